@@ -2,47 +2,238 @@
 
 # MIT-licensed; see LICENSE for details
 
+import argparse, hashlib, os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import penrose
-from tile_manager import TileManager
+from tile_manager import TileManager, rotational_symmetry
 import tile_output as to
+import tile_io
 from pen_num import phi
 
+def _replace_atomically(fname, write, mode = 'wb'):
+  # Calls write(f) on a temporary file, then moves it to fname, so that
+  # fname never holds a partly-written file
+  tmp_name = fname + '.tmp'
+  with open(tmp_name, mode) as f:
+    write(f)
+  os.replace(tmp_name, fname)
+
 def write_svg(tm, fname, include_arcs = False):
-  with open(fname, 'w') as f:
+  def write(f):
     f.write('<?xml version="1.0"?>\n')
     f.write('<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN" "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">\n')
     f.write('<svg width="70mm" height="70mm" viewBox="0 0 70 70" xmlns="http://www.w3.org/2000/svg" version="1.1">\n')
     f.write('<g transform="translate(35,35) scale(1,-1)">\n')
+    # The path data is streamed into the file, rather than built up
+    # as strings first
     if include_arcs:
-      x = to.tiling_arcs_svg(tm, 3)
-      f.write('  <path style="fill: none; stroke: #f99; stroke-width: 0.5; stroke-linecap: butt;" d="{}" />\n'.format(
-        x['type1']
-      ))
-      f.write('  <path style="fill: none; stroke: #9f9; stroke-width: 0.5; stroke-linecap: butt;" d="{}" />\n'.format(
-        x['type2']
-      ))
-    f.write('  <path style="fill: none; stroke: #99f; stroke-width: 0.25; stroke-linejoin: round; stroke-linecap: round;" d="{}" />\n'.format(
-      to.tiling_to_svg_path(tm, 3)
-    ))
+      f.write('  <path style="fill: none; stroke: #f99; stroke-width: 0.5; stroke-linecap: butt;" d="')
+      to.write_arcs_svg(f, tm, 3, 'type1')
+      f.write('" />\n')
+      f.write('  <path style="fill: none; stroke: #9f9; stroke-width: 0.5; stroke-linecap: butt;" d="')
+      to.write_arcs_svg(f, tm, 3, 'type2')
+      f.write('" />\n')
+    f.write('  <path style="fill: none; stroke: #99f; stroke-width: 0.25; stroke-linejoin: round; stroke-linecap: round;" d="')
+    to.write_svg_path(f, tm, 3)
+    f.write('" />\n')
     f.write('</g>\n')
     f.write('</svg>\n')
+  _replace_atomically(fname, write, 'w')
+
+def sun_seed():
+  '''Returns the Robinson A-tiling of the sun vertex figure that the
+  deflations start from.'''
+  init_scale = phi * phi * phi * phi * phi * phi * phi
+  # The sun is symmetric under rotations by multiples of 72 degrees, so only
+  # a fifth of it needs to be deflated and validated at each step
+  tm = TileManager(symmetry = rotational_symmetry(5))
+
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(penrose.KiteTile().scale(init_scale).rotate(i))
+
+  return tm.decompose('to-A')
+
+# Levels count half-deflations of the seed: level 2*i is the i'th A-tiling,
+# and level 2*i+1 the i'th B-tiling.
+
+def level_outputs(level, out_dir):
+  '''Returns a list of (file name, decomposition ID or None, whether to
+  include arcs) for the SVG files to write for a level.'''
+  i = level // 2
+  if level % 2 == 0:
+    return [
+      (os.path.join(out_dir, 'inter-{:02d}-A.svg'.format(i)), None, False),
+      (os.path.join(out_dir, '{:02d}-P2.svg'.format(i)), 'to-P2', True),
+    ]
+  return [
+    (os.path.join(out_dir, 'inter-{:02d}-B.svg'.format(i)), None, False),
+    (os.path.join(out_dir, '{:02d}-P3.svg'.format(i)), 'to-P3', True),
+  ]
+
+def seed_key(seed):
+  '''Returns a short string identifying the tiling seed, for naming
+  checkpoints of tilings deflated from it.'''
+  return hashlib.sha256(tile_io.dumps(seed)).hexdigest()[:16]
+
+class Checkpointer:
+  '''Saves the tilings at each level to files in a cache directory.
+
+  Encoding a tiling is pure Python, and would hold the GIL in a thread, so
+  it's done in the calling thread; only writing the encoded bytes to disk
+  is left to a background thread, overlapping with computing the next
+  level. So a checkpoint still costs its encoding time in the main thread,
+  and saves only the time spent waiting on the disk. At most one write is
+  in progress at a time.'''
+
+  def __init__(self, cache_dir, key):
+    self._dir = os.path.join(cache_dir, key)
+    os.makedirs(self._dir, exist_ok = True)
+    self._executor = ThreadPoolExecutor(max_workers = 1)
+    self._pending = None
+
+  def path(self, level):
+    return os.path.join(self._dir, 'level-{:02d}.tiles'.format(level))
+
+  def has(self, level):
+    return os.path.exists(self.path(level))
+
+  def load_deepest(self, max_level):
+    '''Returns (level, tiling) for the deepest readable checkpoint at a level
+    no greater than max_level, or None if there isn't one. Checkpoints that
+    can't be read are deleted, so that they're written again.'''
+    for level in range(max_level, -1, -1):
+      if not self.has(level):
+        continue
+      try:
+        return (level, tile_io.load(self.path(level)))
+      except ValueError:
+        os.remove(self.path(level))
+    return None
+
+  def save(self, level, tm):
+    '''Encodes the tiling tm, then starts writing it as the checkpoint at
+    the given level, after waiting for the previous one to finish.'''
+    data = tile_io.dumps(tm, compress = True)
+    self.wait()
+    self._pending = self._executor.submit(_replace_atomically, self.path(level), lambda f: f.write(data))
+
+  def wait(self):
+    '''Waits for the checkpoint being written, if any, to finish.'''
+    if self._pending is not None:
+      pending, self._pending = self._pending, None
+      pending.result()
+
+  def close(self):
+    self.wait()
+    self._executor.shutdown()
+
+def _write_output(data, fname, decomp_id, include_arcs):
+  # Writes an SVG file for a level given in tile_io's format, in a worker
+  # process
+  tm = tile_io.loads(data)
+  write_svg(tm if decomp_id is None else tm.decompose(decomp_id), fname, include_arcs)
+
+class _OutputPool:
+  '''Writes levels' SVG files in worker processes, in the background,
+  while the main process goes on to the next level. Levels are passed to
+  the workers in tile_io's format; at most max_pending files are queued or
+  being written at once, so only a few levels are held in memory.'''
+
+  def __init__(self, workers, max_pending = None):
+    self._pool = ProcessPoolExecutor(workers)
+    self._max_pending = 2 * workers if max_pending is None else max_pending
+    self._pending = deque()
+
+  def write(self, tm, outputs):
+    '''Queues the (file name, decomposition ID or None, whether to include
+    arcs) outputs of the tiling tm to be written, first waiting for the
+    earliest queued ones to finish if too many are.'''
+    data = tile_io.dumps(tm)
+    for output in outputs:
+      while len(self._pending) >= self._max_pending:
+        self._pending.popleft().result()
+      self._pending.append(self._pool.submit(_write_output, data, *output))
+
+  def wait(self):
+    '''Waits for all of the queued files to be written.'''
+    while self._pending:
+      self._pending.popleft().result()
+
+  def close(self):
+    self._pool.shutdown(cancel_futures = True)
+
+def run(niter, out_dir, checkpoint_dir = None, workers = 1):
+  '''Writes the SVG files for levels 0 through 2*niter-1 to out_dir. If
+  checkpoint_dir is given, each level's tiling is saved there, and the run
+  resumes from the deepest saved level it can, skipping levels whose SVG
+  files all exist already. If workers > 1, the SVG files are written by
+  that many worker processes, in parallel with the deflation.'''
+  os.makedirs(out_dir, exist_ok = True)
+  n_levels = 2 * niter
+  seed = sun_seed()
 
-init_scale = phi * phi * phi * phi * phi * phi * phi
-tm = TileManager()
+  if checkpoint_dir is None:
+    levels_needed, checkpoints = list(range(n_levels)), None
+  else:
+    levels_needed = [
+      level for level in range(n_levels)
+      if not all(os.path.exists(fname) for fname, _, _ in level_outputs(level, out_dir))
+    ]
+    if len(levels_needed) == 0:
+      return
+    checkpoints = Checkpointer(checkpoint_dir, seed_key(seed))
 
-for i in [-1, 3, 7, 11, 15]:
-  tm.add_tile(penrose.KiteTile().scale(init_scale).rotate(i))
+  start, tm = 0, seed
+  if checkpoints is not None:
+    found = checkpoints.load_deepest(levels_needed[0])
+    if found is not None:
+      start, tm = found
 
-tm = tm.decompose('to-A')
+  pool = _OutputPool(workers) if workers > 1 else None
+  try:
+    for level in range(start, levels_needed[-1] + 1):
+      if checkpoints is not None and not checkpoints.has(level):
+        checkpoints.save(level, tm)
+      if level in levels_needed:
+        outputs = [
+          output for output in level_outputs(level, out_dir)
+          if checkpoints is None or not os.path.exists(output[0])
+        ]
+        if pool is not None:
+          pool.write(tm, outputs)
+        else:
+          for fname, decomp_id, include_arcs in outputs:
+            tiling = tm if decomp_id is None else tm.decompose(decomp_id)
+            write_svg(tiling, fname, include_arcs)
+      if level < levels_needed[-1]:
+        tm = tm.decompose('half-deflation')
+    if pool is not None:
+      pool.wait()
+  finally:
+    if pool is not None:
+      pool.close()
+    if checkpoints is not None:
+      checkpoints.close()
 
-niter = 8
+def main(argv = None):
+  parser = argparse.ArgumentParser(
+    description = 'Repeatedly deflates a P2 sun vertex figure, writing SVG images of each step.'
+  )
+  parser.add_argument('-n', '--iterations', type = int, default = 8,
+    help = 'number of (full) deflations (default: %(default)s)')
+  parser.add_argument('-o', '--out-dir', default = 'sun',
+    help = 'directory for the SVG files (default: %(default)s)')
+  parser.add_argument('--checkpoint-dir',
+    help = 'directory to save each level in, and to resume from')
+  parser.add_argument('-j', '--workers', type = int, default = 1,
+    help = 'number of processes writing the SVG files in the background (default: %(default)s)')
+  args = parser.parse_args(argv)
+  if args.iterations < 1:
+    parser.error('the number of iterations must be positive')
+  if args.workers < 1:
+    parser.error('the number of workers must be positive')
+  run(args.iterations, args.out_dir, args.checkpoint_dir, args.workers)
 
-for i in range(niter):
-  write_svg(tm, 'sun/inter-{:02d}-A.svg'.format(i))
-  write_svg(tm.decompose('to-P2'), 'sun/{:02d}-P2.svg'.format(i), True)
-  tm = tm.decompose('half-deflation')
-  write_svg(tm, 'sun/inter-{:02d}-B.svg'.format(i))
-  write_svg(tm.decompose('to-P3'), 'sun/{:02d}-P3.svg'.format(i), True)
-  if i == niter-1:
-    break
-  tm = tm.decompose('half-deflation')
+if __name__ == '__main__':
+  main()
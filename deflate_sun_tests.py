@@ -0,0 +1,81 @@
+# MIT-licensed; see LICENSE for details
+
+import os, shutil, tempfile
+from unittest import TestCase
+import deflate_sun as ds
+
+def _contents(out_dir):
+  # Maps the names of the files in out_dir to their contents
+  contents = {}
+  for name in os.listdir(out_dir):
+    with open(os.path.join(out_dir, name), 'rb') as f:
+      contents[name] = f.read()
+  return contents
+
+class TestCheckpoints(TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.out = os.path.join(self.dir, 'out')
+    self.ck = os.path.join(self.dir, 'ck')
+    # Records the levels that runs resume from
+    self.resumed = []
+    load_deepest = ds.Checkpointer.load_deepest
+    def recording(checkpointer, max_level):
+      found = load_deepest(checkpointer, max_level)
+      self.resumed.append(None if found is None else found[0])
+      return found
+    ds.Checkpointer.load_deepest = recording
+    self.addCleanup(setattr, ds.Checkpointer, 'load_deepest', load_deepest)
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def checkpoint_dir(self):
+    return os.path.join(self.ck, os.listdir(self.ck)[0])
+
+  def test_resume(self):
+    ds.run(2, self.out, self.ck)
+    self.assertEqual(self.resumed, [None])
+    expected = _contents(self.out)
+    self.assertEqual(len(expected), 8)
+    self.assertEqual(sorted(os.listdir(self.checkpoint_dir())),
+      ['level-{:02d}.tiles'.format(level) for level in range(4)])
+
+    # Only the missing file is written, from the deepest checkpoint before it
+    os.remove(os.path.join(self.out, '01-P2.svg'))
+    mtimes = {name: os.stat(os.path.join(self.out, name)).st_mtime_ns for name in os.listdir(self.out)}
+    ds.run(2, self.out, self.ck)
+    self.assertEqual(self.resumed, [None, 2])
+    self.assertEqual(_contents(self.out), expected)
+    for name, mtime in mtimes.items():
+      self.assertEqual(os.stat(os.path.join(self.out, name)).st_mtime_ns, mtime)
+
+    # Nothing is done when all of the files exist
+    ds.run(2, self.out, self.ck)
+    self.assertEqual(self.resumed, [None, 2])
+
+  def test_corrupt_checkpoint(self):
+    ds.run(2, self.out, self.ck)
+    expected = _contents(self.out)
+    path = os.path.join(self.checkpoint_dir(), 'level-03.tiles')
+    with open(path, 'rb') as f:
+      data = f.read()
+    middle = len(data) // 2
+    with open(path, 'wb') as f:
+      f.write(data[:middle] + bytes(b ^ 0xff for b in data[middle:middle+8]) + data[middle+8:])
+
+    # The run falls back to the level before, and writes the checkpoint again
+    os.remove(os.path.join(self.out, '01-P3.svg'))
+    ds.run(2, self.out, self.ck)
+    self.assertEqual(self.resumed, [None, 2])
+    self.assertEqual(_contents(self.out), expected)
+    with open(path, 'rb') as f:
+      self.assertEqual(f.read(), data)
+
+class TestWorkers(TestCase):
+  def test_same_output(self):
+    with tempfile.TemporaryDirectory() as d:
+      serial, pooled = os.path.join(d, 'serial'), os.path.join(d, 'pooled')
+      ds.run(2, serial)
+      ds.run(2, pooled, workers = 3)
+      self.assertEqual(_contents(pooled), _contents(serial))
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+# Benchmark for the spatial indexes in tile_index: for several tilings,
+# inserts the tiles one by one (as TileManager.add_tile does) and reports
+# the number of candidate tiles that the index returns for each insertion,
+# i.e., the number of tiles that need exact geometric checks.
+
+# MIT-licensed; see LICENSE for details
+
+import sys, time
+from collections import defaultdict
+from math import floor
+import penrose, tile_index
+import pen_geom as pg
+import pen_num as pn
+from tile_manager import TileManager
+from pen_num import phi
+
+class _LegacyGridIndex:
+  '''The grid TileManager used to have, for comparison: the cell size is
+  fixed by the first tile, cell bounds are computed with exact arithmetic,
+  and the vertical cell range is (wrongly) derived from the tile's max_x.'''
+
+  def __init__(self):
+    self._scale_factor = None
+    self._cells = defaultdict(set)
+    self._n = 0
+
+  def __len__(self):
+    return self._n
+
+  def _grid_bounds(self, bb):
+    sf = self._scale_factor
+    return (floor(bb.min_x * sf), floor(bb.max_x * sf), floor(bb.min_y * sf), floor(bb.max_x * sf))
+
+  def insert(self, t):
+    if self._scale_factor is None:
+      self._scale_factor = pn.approx_inv_sqrt(t.curr_transform().det())
+    min_x, max_x, min_y, max_y = self._grid_bounds(t.bbox())
+    for ix in range(min_x, max_x+1):
+      for iy in range(min_y, max_y+1):
+        self._cells[(ix,iy)].add(t)
+    self._n += 1
+
+  def query_tile(self, t):
+    found = set()
+    if self._scale_factor is None:
+      return found
+    min_x, max_x, min_y, max_y = self._grid_bounds(t.bbox())
+    for ix in range(min_x, max_x+1):
+      for iy in range(min_y, max_y+1):
+        found |= self._cells.get((ix,iy), set())
+    return found
+
+def _query_tile(index, t):
+  if isinstance(index, _LegacyGridIndex):
+    return index.query_tile(t)
+  return index.query(tile_index.float_bbox(t))
+
+def _sun(levels):
+  tm = TileManager()
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(penrose.KiteTile().scale(phi * phi * phi).rotate(i))
+  tm = tm.decompose('to-A')
+  for i in range(levels):
+    tm = tm.decompose('half-deflation')
+  return tm.get_tiles()
+
+def _mixed_scales(levels):
+  # A tiling next to a scaled-down copy of a deflation of itself
+  coarse = _sun(levels)
+  fine = [t.transform(pg.translation(12, 0) @ pg.scaling(pn.inv_phi * pn.inv_phi)) for t in _sun(levels + 2)]
+  return coarse + fine
+
+_workloads = [
+  ('sun, 6 half-deflations', lambda: _sun(6)),
+  ('sun, 8 half-deflations', lambda: _sun(8)),
+  ('mixed scales', lambda: _mixed_scales(4)),
+]
+
+_indexes = [
+  ('legacy grid', _LegacyGridIndex),
+  ('grid', tile_index.GridIndex),
+  ('quadtree', tile_index.QuadtreeIndex),
+  ('R-tree', tile_index.RTreeIndex),
+]
+
+def run(out = sys.stdout):
+  out.write('{:<24} {:<12} {:>7} {:>10} {:>8} {:>9}\n'.format(
+    'workload', 'index', 'tiles', 'mean cand.', 'max', 'time (s)'
+  ))
+  for wname, mk_tiles in _workloads:
+    tiles = mk_tiles()
+    for iname, mk_index in _indexes:
+      index = mk_index()
+      sizes = []
+      start = time.perf_counter()
+      for t in tiles:
+        sizes.append(len(_query_tile(index, t)))
+        index.insert(t)
+      elapsed = time.perf_counter() - start
+      out.write('{:<24} {:<12} {:>7} {:>10.2f} {:>8} {:>9.3f}\n'.format(
+        wname, iname, len(tiles), sum(sizes) / len(sizes), max(sizes), elapsed
+      ))
+
+if __name__ == '__main__':
+  run()
@@ -5,6 +5,7 @@ a useful field to work in when handling Penrose tiles'''
 
 from fractions import Fraction as Q
 from math import sqrt, floor, ceil
+from sys import float_info
 
 def _fraction_as_string(q):
   if q.denominator == 1:
@@ -184,6 +185,11 @@ _float_powers_of_alpha = (
   _float_alpha * _pre_alpha
 )
 
+# Bounds the error in computing a sum of products of floats with a few
+# terms, relative to the sum of the products' absolute values; see
+# Number.float_with_error()
+_float_error_factor = 16 * float_info.epsilon
+
 _rational_zero = Q(0)
 
 class Number:
@@ -405,6 +411,12 @@ class Number:
   def __float__(self):
     return sum(float(self._vec[i]) * _float_powers_of_alpha[i] for i in range(4))
 
+  def float_with_error(self):
+    '''Returns (f, e), where f is float(self) and e is a bound on the
+    absolute difference between f and self'''
+    terms = [float(self._vec[i]) * _float_powers_of_alpha[i] for i in range(4)]
+    return (sum(terms), _float_error_factor * sum(abs(t) for t in terms) + float_info.min)
+
   def is_rational(self):
     # A Number is rational if and only if all of the {alpha, alpha^2, alpha3}
     # terms are zero:
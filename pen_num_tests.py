@@ -219,6 +219,21 @@ class TestNumberProperties(TestCase):
         self.assertLess(y, f)
         self.assertLess(f, z)
 
+  def test_float_with_error(self):
+    cases = [
+      Y(0, 0, 0, 0), Y('2/3', 0, 0, 0), pen_num.phi, Y('-3/2', 0, '1/8', 0),
+      Y(0, '1/4', 0, 0), Y(10**12, 0, 0, -1) * pen_num.phi,
+      # Nearly cancelling terms
+      Y(Q(-3804226065180614, 10**15), 1, 0, 0),
+    ]
+    for x in cases:
+      with self.subTest(num = x):
+        f, e = x.float_with_error()
+        self.assertEqual(f, float(x))
+        self.assertLess(e, 1e-9 * (abs(f) + 1))
+        self.assertLessEqual(Q(f - e), x)
+        self.assertLessEqual(x, Q(f + e))
+
   def test_is_rational(self):
     cases = [
       (Y(0, 0, 0, 0),            True),
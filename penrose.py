@@ -36,6 +36,12 @@ class TileWithMatchingRule:
     decomp_id is not recognized, returns None'''
     return None
 
+  def decompose_child(self, decomp_id, i):
+    '''Returns the i'th tile of self.decompose(decomp_id), or None if
+    decomp_id is not recognized'''
+    d = self.decompose(decomp_id)
+    return None if d is None else d[i]
+
   def tile_set(self):
     '''Returns an ID indicating the tile set this tile belongs to.'''
     raise NotImplementedError
@@ -199,6 +205,14 @@ class TransformableTile(TileWithMatchingRule):
 
     return [pt.transform(self._t) for pt in decomp_prototiles]
 
+  def decompose_child(self, decomp_id, i):
+    # Only construct the one tile we need:
+    decomp_prototiles = self._decompositions.get(decomp_id, None)
+    if decomp_prototiles is None:
+      return None
+
+    return decomp_prototiles[i].transform(self._t)
+
   def tile_set(self):
     return self._tile_set
 
@@ -374,3 +388,11 @@ def _mk_full_deflations():
     T._decompositions['deflation'] = tuple(it.chain( *(tt.decompose('half-deflation') for tt in hd) ))
 
 _mk_full_deflations()
+
+# All of the concrete tile types, in a fixed order; a type's position in
+# this tuple serves as a compact code for it, e.g. in columnar storage
+tile_types = (
+  KiteTile, DartTile, ThickRhomb, ThinRhomb,
+  A_K1, A_K2, A_D1, A_D2, B_L1, B_L2, B_S1, B_S2,
+)
+tile_type_codes = {ty: code for code, ty in enumerate(tile_types)}
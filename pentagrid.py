@@ -0,0 +1,288 @@
+'''Direct generation of P3 (rhomb) tilings using de Bruijn's pentagrid method'''
+
+# MIT-licensed; see LICENSE for details
+
+# De Bruijn [1] showed that the P3 tiling can be obtained as the dual of a
+# pentagrid: five families of parallel lines {x : x|e_j + gamma_j = k},
+# k integer, where e_j is the unit vector at angle 72*j degrees and the
+# offsets gamma_j sum to zero. Every point x not on a grid line gets the
+# integer 5-vector K(x) with K_j(x) = ceil(x|e_j + gamma_j), which is mapped
+# to the tile vertex sum(K_j(x) * e_j). Each intersection of a line of family
+# r with one of family s (r < s) yields one rhomb, whose four vertices come
+# from the four meshes of the pentagrid around the intersection point. The
+# rhomb is thick if e_r and e_s are 72 or 288 degrees apart, and thin otherwise.
+#
+# As all of the e_j are exactly representable as pen_num.Numbers, so are all
+# the tile vertices, which lets us emit the same TransformableTiles as
+# penrose.py does. Only the grid-index computation needs care: we do it in
+# floating point, falling back to exact sign tests on the rare occasions that
+# a value is too close to an integer for the floating-point result to be
+# trustworthy.
+#
+# The matching rules of each rhomb follow from de Bruijn's vertex index
+# sum(K_j), which is always in {1, 2, 3, 4}: the acute corner of a thick
+# rhomb with the rule-3 edges leaving it, and the obtuse corner of a thin
+# rhomb with the rule-3 edges entering it, are the corners of index 2 or 3.
+#
+# [1] N. G. de Bruijn, "Algebraic theory of Penrose's non-periodic tilings
+#     of the plane", Indagationes Mathematicae 84 (1981), pp. 39-66.
+
+from fractions import Fraction as Q
+from math import ceil, floor, cos, sin, pi, atan2, hypot, sqrt
+import itertools as it
+import penrose as p
+import pen_geom as pg
+from pen_geom import Point, Vector, Rectangle
+
+# Grid directions, exactly and in floating point
+_e = tuple(Vector(1, 0).rotate(4*j) for j in range(5))
+_ef = tuple((cos(2*pi*j/5), sin(2*pi*j/5)) for j in range(5))
+
+# Scalar cross products e_i ^ e_j
+_cross = tuple(tuple(_e[i] ^ _e[j] for j in range(5)) for i in range(5))
+
+# Offsets for which the pentagrid is regular (no three lines meet at a point).
+# Three lines can only meet if some gamma_r - c * gamma_s, c a rational number
+# with a small denominator depending only on r and s, is of the form i - c*j
+# with i and j integers; the large, distinct prime denominators rule that out.
+# They sum to zero, as required.
+_g = (Q(13,97), Q(29,101), Q(-7,89), Q(-41,113))
+default_offsets = _g + (-sum(_g),)
+
+# How close a floating-point grid coordinate can get to an integer before
+# we redo the computation exactly
+_eps = 1e-7
+
+# Tile centers lie within this distance of (5/2)*x + sum(gamma_j * e_j), x being
+# the grid-space location of the tile's intersection point: each vertex is
+# off by sum(f_j * e_j) for some f_j in [0, 1], which has length at most phi.
+_reach = 1.7
+
+def _check_offsets(offsets):
+  offsets = tuple(Q(g) for g in offsets)
+  if len(offsets) != 5:
+    raise ValueError
+  if sum(offsets) != 0:
+    raise ValueError
+  return offsets
+
+def _mk_placements():
+  # For each pair of grid families (r, s), work out the two ways that
+  # the rhomb spanned by e_r and e_s can be expressed as a transformed
+  # proto-tile. Each placement is a tuple
+  #   (tile class, (dr, ds) of vertex 0, rotation, (dr, ds) of key vertex)
+  # where (dr, ds) are the offsets in K_r and K_s relative to the rhomb's
+  # base vertex, and the key vertex is the one whose index decides between
+  # the two placements.
+  protos = (
+    (p.ThickRhomb, 4, 0), # class, angle at vertex 0 (in 18-degree units), key vertex
+    (p.ThinRhomb,  2, 1),
+  )
+  placements = {}
+  for r, s in it.combinations(range(5), 2):
+    offs = [(0, 0), (1, 0), (1, 1), (0, 1)]
+    er, es = _ef[r], _ef[s]
+    if er[0] * es[1] - er[1] * es[0] < 0:
+      offs = [offs[0], offs[3], offs[2], offs[1]]
+    pts = [(dr * er[0] + ds * es[0], dr * er[1] + ds * es[1]) for dr, ds in offs]
+
+    found = []
+    for cls, angle, key in protos:
+      for st in range(4):
+        v0, v1 = pts[st], pts[(st+1)%4]
+        n = round(atan2(v1[1] - v0[1], v1[0] - v0[0]) / (pi / 10)) % 20
+        # Compare the proto-tile, rotated by n and moved to v0, with the rhomb:
+        a = pi * n / 10
+        b = pi * (n + angle) / 10
+        u, w = (cos(a), sin(a)), (cos(b), sin(b))
+        proto = [(0, 0), u, (u[0] + w[0], u[1] + w[1]), w]
+        if all(hypot(v0[0] + q[0] - pts[(st+i)%4][0], v0[1] + q[1] - pts[(st+i)%4][1]) < 1e-9
+               for i, q in enumerate(proto)):
+          found.append((cls, offs[st], n, offs[(st+key)%4]))
+    if len(found) != 2:
+      raise AssertionError
+    placements[(r,s)] = tuple(found)
+  return placements
+
+_placements = _mk_placements()
+
+def _grid_index(j, r, s, kr, ks, offsets, xf, yf):
+  '''Returns K_j at the pentagrid meshes around the intersection point
+  (xf, yf) (approximately) of line kr of family r and line ks of family s,
+  for j not in (r, s).'''
+  v = xf * _ef[j][0] + yf * _ef[j][1] + float(offsets[j])
+  m = round(v)
+  if abs(v - m) > _eps:
+    return ceil(v)
+
+  # Too close to call in floating point. With a = kr - gamma_r and
+  # b = ks - gamma_s, the intersection point x has
+  #   x|e_j = (a * (e_j ^ e_s) + b * (e_r ^ e_j)) / (e_r ^ e_s),
+  # so the sign of x|e_j + gamma_j - m can be found without division:
+  a, b = kr - offsets[r], ks - offsets[s]
+  c = _cross
+  sgn = (a * c[j][s] + b * c[r][j] + (offsets[j] - m) * c[r][s]).sgn() * c[r][s].sgn()
+  if sgn == 0:
+    raise ValueError('singular pentagrid: three grid lines meet at a point')
+  return m if sgn < 0 else m + 1
+
+def _vertex(K):
+  e = _e
+  return Point(0, 0) + (K[0]*e[0] + K[1]*e[1] + K[2]*e[2] + K[3]*e[3] + K[4]*e[4])
+
+def _tile_at(r, s, kr, ks, offsets):
+  '''Returns (tile, approximate center, (K, r, s)) for the rhomb dual to the
+  intersection of line kr of family r with line ks of family s, K being
+  the grid indices of the rhomb's base vertex.'''
+  er, es = _ef[r], _ef[s]
+  a, b = kr - float(offsets[r]), ks - float(offsets[s])
+  det = er[0] * es[1] - er[1] * es[0]
+  xf, yf = (a * es[1] - b * er[1]) / det, (b * er[0] - a * es[0]) / det
+
+  K = [0] * 5
+  for j in range(5):
+    if j == r:
+      K[j] = kr
+    elif j == s:
+      K[j] = ks
+    else:
+      K[j] = _grid_index(j, r, s, kr, ks, offsets, xf, yf)
+  index = sum(K)
+
+  for cls, (dr, ds), n, (kdr, kds) in _placements[(r,s)]:
+    if index + kdr + kds in (2, 3):
+      break
+  else:
+    raise AssertionError
+
+  K0 = list(K)
+  K0[r] += dr
+  K0[s] += ds
+  t = cls(pg.translation(Vector(_vertex(K0))) @ pg.rotation(n))
+
+  cxf = sum(k * e[0] for k, e in zip(K, _ef)) + (er[0] + es[0]) / 2
+  cyf = sum(k * e[1] for k, e in zip(K, _ef)) + (er[1] + es[1]) / 2
+  return t, (cxf, cyf), (K, r, s)
+
+def _half_open_contains(lo, hi, vf, exact):
+  # Whether lo <= v < hi, for v approximately vf and exactly exact()
+  lof, hif = float(lo), float(hi)
+  if lof + _eps < vf < hif - _eps:
+    return True
+  if vf < lof - _eps or vf > hif + _eps:
+    return False
+  v = exact()
+  return lo <= v and v < hi
+
+def _center(K, r, s):
+  return _vertex(K) + Q(1,2) * (_e[r] + _e[s])
+
+def _line_range(family, rect_f, offsets):
+  # Range of k such that line k of the given family crosses the
+  # (floating-point) grid-space rectangle rect_f
+  min_x, min_y, max_x, max_y = rect_f
+  e = _ef[family]
+  vals = [x * e[0] + y * e[1] for x in (min_x, max_x) for y in (min_y, max_y)]
+  g = float(offsets[family])
+  return range(floor(min(vals) + g), ceil(max(vals) + g) + 1)
+
+def _clip_line(r, kr, s, rect_f, offsets):
+  # Range of k such that line k of family s meets line kr of family r
+  # within the grid-space rectangle rect_f
+  min_x, min_y, max_x, max_y = rect_f
+  er, es = _ef[r], _ef[s]
+  d = kr - float(offsets[r])
+  # The line is {d*er + t*perp}, with perp perpendicular to er:
+  px, py = d * er[0], d * er[1]
+  ux, uy = -er[1], er[0]
+  t_lo, t_hi = float('-inf'), float('inf')
+  for o, u, lo, hi in ((px, ux, min_x, max_x), (py, uy, min_y, max_y)):
+    if abs(u) < 1e-12:
+      if o < lo or o > hi:
+        return range(0)
+    else:
+      t1, t2 = (lo - o) / u, (hi - o) / u
+      t_lo, t_hi = max(t_lo, min(t1, t2)), min(t_hi, max(t1, t2))
+  if t_lo > t_hi:
+    return range(0)
+  g = float(offsets[s])
+  v1 = (px + t_lo * ux) * es[0] + (py + t_lo * uy) * es[1] + g
+  v2 = (px + t_hi * ux) * es[0] + (py + t_hi * uy) * es[1] + g
+  return range(floor(min(v1, v2)), ceil(max(v1, v2)) + 1)
+
+def pentagrid_tiles(rect, offsets = default_offsets):
+  '''Yields the ThickRhomb and ThinRhomb tiles (of edge length 1) of the
+  P3 tiling given by the pentagrid with the given offsets whose centers
+  lie in the Rectangle rect.
+
+  The rectangle is treated as half-open (including its minimum edges but
+  not its maximum edges), so the tiles of a set of rectangles that
+  partition a region (see split_rectangle) are exactly the tiles of the
+  region, each produced once. Tiles may extend past rect by up to one edge
+  length.'''
+  if not isinstance(rect, Rectangle):
+    raise TypeError
+  offsets = _check_offsets(offsets)
+
+  # Map rect back to grid space, with a margin:
+  cx = sum(float(g) * e[0] for g, e in zip(offsets, _ef))
+  cy = sum(float(g) * e[1] for g, e in zip(offsets, _ef))
+  rect_f = (
+    (float(rect.min_x) - cx - _reach) / 2.5, (float(rect.min_y) - cy - _reach) / 2.5,
+    (float(rect.max_x) - cx + _reach) / 2.5, (float(rect.max_y) - cy + _reach) / 2.5,
+  )
+
+  for r, s in it.combinations(range(5), 2):
+    for kr in _line_range(r, rect_f, offsets):
+      for ks in _clip_line(r, kr, s, rect_f, offsets):
+        t, (cxf, cyf), where = _tile_at(r, s, kr, ks, offsets)
+        center = None
+        def exact_center():
+          nonlocal center
+          if center is None:
+            center = _center(*where)
+          return center
+        if _half_open_contains(rect.min_x, rect.max_x, cxf, lambda: exact_center().x) and \
+           _half_open_contains(rect.min_y, rect.max_y, cyf, lambda: exact_center().y):
+          yield t
+
+def split_rectangle(rect, nx, ny):
+  '''Splits the Rectangle rect into a list of nx * ny sub-rectangles,
+  in row-major order, which can be handled independently by
+  pentagrid_tiles.'''
+  if not (isinstance(nx, int) and isinstance(ny, int)):
+    raise TypeError
+  if nx < 1 or ny < 1:
+    raise ValueError
+  w, h = rect.max_x - rect.min_x, rect.max_y - rect.min_y
+  xs = [rect.min_x + Q(i, nx) * w for i in range(nx)] + [rect.max_x]
+  ys = [rect.min_y + Q(i, ny) * h for i in range(ny)] + [rect.max_y]
+  return [
+    Rectangle(xs[i], ys[j], xs[i+1], ys[j+1])
+    for j in range(ny) for i in range(nx)
+  ]
+
+def _tiles_for_worker(args):
+  rect, offsets = args
+  return list(pentagrid_tiles(rect, offsets))
+
+def pentagrid_tiling(rect, offsets = default_offsets, processes = 1):
+  '''Returns a tile_manager.TileManager holding the tiles of
+  pentagrid_tiles(rect, offsets).
+
+  If processes > 1, rect is split into blocks that are generated in
+  parallel by that many worker processes.'''
+  from tile_manager import TileManager
+
+  tm = TileManager()
+  if processes <= 1:
+    tm.add_tiles(pentagrid_tiles(rect, offsets), trusted = True)
+    return tm
+
+  from concurrent.futures import ProcessPoolExecutor
+  n = ceil(sqrt(4 * processes))
+  jobs = [(sub, offsets) for sub in split_rectangle(rect, n, n)]
+  with ProcessPoolExecutor(processes) as pool:
+    for tiles in pool.map(_tiles_for_worker, jobs):
+      tm.add_tiles(tiles, trusted = True)
+  return tm
@@ -0,0 +1,36 @@
+# MIT-licensed; see LICENSE for details
+
+from unittest import TestCase
+import pentagrid as pgd
+import penrose as p
+import pen_geom as g
+from fractions import Fraction as Q
+from tile_manager import TileManager
+
+class TestPentagrid(TestCase):
+  def test_tiles_obey_matching_rules(self):
+    tiles = list(pgd.pentagrid_tiles(g.Rectangle(-2, -2, 2, 2)))
+    self.assertTrue(len(tiles) > 0)
+    tm = TileManager()
+    for t in tiles:
+      with self.subTest(t = t):
+        self.assertIn(type(t), (p.ThickRhomb, p.ThinRhomb))
+        self.assertIs(tm.try_add_tile(t), True)
+
+  def test_split_rectangle_partitions_tiles(self):
+    rect = g.Rectangle(-2, Q(-3,2), 3, 2)
+    whole = list(pgd.pentagrid_tiles(rect))
+    parts = [t for r in pgd.split_rectangle(rect, 2, 3) for t in pgd.pentagrid_tiles(r)]
+    self.assertEqual(len(parts), len(whole))
+    self.assertEqual(set(parts), set(whole))
+
+  def test_offsets(self):
+    rect = g.Rectangle(0, 0, 1, 1)
+    self.assertRaises(ValueError, lambda: list(pgd.pentagrid_tiles(rect, (0, 0, 0, 0))))
+    self.assertRaises(ValueError, lambda: list(pgd.pentagrid_tiles(rect, (Q(1,3), 0, 0, 0, 0))))
+    self.assertRaises(TypeError, lambda: list(pgd.pentagrid_tiles((0, 0, 1, 1))))
+
+  def test_pentagrid_tiling(self):
+    rect = g.Rectangle(-1, -1, 1, 1)
+    tm = pgd.pentagrid_tiling(rect)
+    self.assertEqual(set(tm.get_tiles()), set(pgd.pentagrid_tiles(rect)))
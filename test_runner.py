@@ -4,11 +4,23 @@
 
 # MIT-licensed; see LICENSE for details
 
-import pen_num_tests, pen_geom_tests
+import pen_num_tests, pen_geom_tests, tile_manager_tests, pentagrid_tests, tile_hierarchy_tests, tile_index_tests, tile_store_tests, tile_io_tests, tile_decoration_tests, tile_output_tests, tile_raster_tests, tile_pyramid_tests, tile_export_tests, deflate_sun_tests
 
 modules_to_test = [
   pen_num_tests,
   pen_geom_tests,
+  tile_manager_tests,
+  pentagrid_tests,
+  tile_hierarchy_tests,
+  tile_index_tests,
+  tile_store_tests,
+  tile_io_tests,
+  tile_decoration_tests,
+  tile_output_tests,
+  tile_raster_tests,
+  tile_pyramid_tests,
+  tile_export_tests,
+  deflate_sun_tests,
 ]
 
 if __name__ == '__main__':
@@ -0,0 +1,219 @@
+'''Decorations of tiles, such as arcs and Ammann bars, defined once per
+prototile and mapped onto each tile by its transform'''
+
+# MIT-licensed; see LICENSE for details
+
+# A decoration is a list of shapes for each tile type, given in the
+# coordinates of the type's prototile (the tile with the identity
+# transform), each assigned to a named layer so that, e.g., the two kinds of
+# arcs can be drawn in different colours. A tile's shapes are the prototile's,
+# mapped by its transform. As the tiles' transforms are similarities, which
+# only come in a few rotations and (in any one tiling) scales, the shapes are
+# mapped by the linear part of each distinct transform just once, leaving
+# only a translation to do for each tile. Radii are scaled by the exact scale
+# factor of the transform.
+
+from fractions import Fraction
+import penrose as p, pen_geom as pg, pen_num as pn
+from pen_geom import Point
+
+def transform_scale(t):
+  '''Returns the scale factor of the similarity transform t, exactly, as a
+  pen_num.Number. Raises ValueError unless t rotates by a multiple of 18
+  degrees, as the transforms of all tiles do.'''
+  a, d = t.a, t.d
+  for n in range(20):
+    r = pg.rotation(n)
+    cos, sin = r.a, r.d
+    # (a, d) is a positive multiple of (cos, sin)
+    if a * sin == d * cos:
+      scale = a * cos + d * sin
+      if scale > 0:
+        return scale
+  raise ValueError
+
+class Arc:
+  '''A circular arc of the given radius, going counterclockwise from start
+  to end; large_arc is true if it spans more than a semicircle.'''
+
+  def __init__(self, start, end, radius, large_arc = False):
+    if not (isinstance(start, Point) and isinstance(end, Point)):
+      raise TypeError
+    self.start, self.end = start, end
+    self.radius = pn.Number(radius)
+    self.large_arc = bool(large_arc)
+
+  def transform(self, t, scale):
+    '''Returns the arc mapped by the similarity transform t, of scale factor
+    scale.'''
+    return Arc(self.start.transform(t), self.end.transform(t), self.radius * scale, self.large_arc)
+
+  def translate(self, dx, dy):
+    return Arc(self.start.translate(dx, dy), self.end.translate(dx, dy), self.radius, self.large_arc)
+
+  def svg_path(self, fmt):
+    '''Returns SVG path data drawing the arc, with coordinates formatted by
+    the tile_output.DecimalFormatter fmt.'''
+    r = fmt.approx(self.radius)
+    return 'M{} {}A{} {} 0 {} 1 {} {}'.format(
+      fmt.approx(self.start.x), fmt.approx(self.start.y),
+      r, r, int(self.large_arc),
+      fmt.approx(self.end.x), fmt.approx(self.end.y)
+    )
+
+class Segment:
+  '''A line segment from start to end.'''
+
+  def __init__(self, start, end):
+    if not (isinstance(start, Point) and isinstance(end, Point)):
+      raise TypeError
+    self.start, self.end = start, end
+
+  def transform(self, t, scale):
+    return Segment(self.start.transform(t), self.end.transform(t))
+
+  def translate(self, dx, dy):
+    return Segment(self.start.translate(dx, dy), self.end.translate(dx, dy))
+
+  def svg_path(self, fmt):
+    return 'M{} {}L{} {}'.format(
+      fmt.approx(self.start.x), fmt.approx(self.start.y),
+      fmt.approx(self.end.x), fmt.approx(self.end.y)
+    )
+
+class Decoration:
+  '''A decoration of tiles, given by a dict mapping tile types to lists of
+  (layer, shape) pairs, where the shapes (Arcs or Segments) are in the
+  coordinates of the type's prototile.'''
+
+  # Number of distinct linear parts of transforms to keep mapped shapes for
+  _max_cached = 1 << 12
+
+  def __init__(self, templates):
+    self._templates = { ty: tuple(shapes) for ty, shapes in templates.items() }
+    self._layers = []
+    for shapes in self._templates.values():
+      for layer, shape in shapes:
+        if not isinstance(shape, (Arc, Segment)):
+          raise TypeError
+        if layer not in self._layers:
+          self._layers.append(layer)
+    self._mapped = {}
+
+  def layers(self):
+    '''Returns a list of the names of the decoration's layers.'''
+    return list(self._layers)
+
+  def tile_types(self):
+    '''Returns a list of the tile types the decoration is defined for.'''
+    return list(self._templates)
+
+  def template(self, ty):
+    '''Returns the (layer, shape) pairs decorating the prototile of type ty.'''
+    shapes = self._templates.get(ty, None)
+    if shapes is None:
+      raise ValueError
+    return shapes
+
+  def shapes(self, t):
+    '''Returns a list of the (layer, shape) pairs decorating the tile t.
+    Raises ValueError if the decoration isn't defined for t's type.'''
+    xf = t.curr_transform()
+    key = (type(t), xf.a, xf.d)
+    mapped = self._mapped.get(key, None)
+    if mapped is None:
+      linear = pg.AffineTransform(xf.a, xf.b, 0, xf.d, xf.e, 0)
+      scale = transform_scale(xf)
+      mapped = [(layer, shape.transform(linear, scale)) for layer, shape in self.template(type(t))]
+      if len(self._mapped) >= self._max_cached:
+        self._mapped.clear()
+      self._mapped[key] = mapped
+    dx, dy = xf.c, xf.f
+    return [(layer, shape.translate(dx, dy)) for layer, shape in mapped]
+
+  def iter_shapes(self, tiling):
+    '''Yields the (layer, shape) pairs decorating each tile of tiling, going
+    through the tiles in Hilbert-curve order.'''
+    for t in tiling.iter_tiles(order = 'hilbert'):
+      yield from self.shapes(t)
+
+def _on_edge(vertices, i, t):
+  # The point a fraction t of the way along the edge from vertex i
+  v1, v2 = vertices[i], vertices[(i + 1) % len(vertices)]
+  return v1 + t * (v2 - v1)
+
+_inv_phi, _inv_phi2 = pn.inv_phi, pn.inv_phi * pn.inv_phi
+_half_inv_phi = Fraction(1, 2) * pn.inv_phi
+
+def _arc(vs, i, j, k, f, radius, large_arc = False):
+  # The arc about vertex i, from a fraction f of the way to vertex j to the
+  # same fraction of the way to vertex k
+  return Arc(vs[i] + f * (vs[j] - vs[i]), vs[i] + f * (vs[k] - vs[i]), radius, large_arc)
+
+def _mk_arcs():
+  kite, dart = p.proto_kite, p.proto_dart
+  thick, thin = p.proto_thick, p.proto_thin
+  one_minus_inv_phi = 1 - _inv_phi
+  one_minus_half_inv_phi = 1 - _half_inv_phi
+  # The prototiles' (long) edges are of length 1, so the radii are the
+  # fractions of the edges the arcs cut off
+  return Decoration({
+    p.KiteTile: [
+      ('type1', _arc(kite, 0, 1, 3, _inv_phi, _inv_phi)),
+      ('type2', _arc(kite, 2, 3, 1, _inv_phi, _inv_phi2)),
+    ],
+    p.DartTile: [
+      ('type1', _arc(dart, 0, 1, 3, one_minus_inv_phi, one_minus_inv_phi)),
+      ('type2', _arc(dart, 2, 3, 1, one_minus_inv_phi, _inv_phi - _inv_phi2, True)),
+    ],
+    p.ThickRhomb: [
+      ('type1', _arc(thick, 0, 1, 3, one_minus_half_inv_phi, one_minus_half_inv_phi)),
+      ('type2', _arc(thick, 2, 3, 1, _half_inv_phi, _half_inv_phi)),
+    ],
+    p.ThinRhomb: [
+      ('type1', _arc(thin, 1, 2, 0, _half_inv_phi, _half_inv_phi)),
+      ('type2', _arc(thin, 3, 0, 2, _half_inv_phi, _half_inv_phi)),
+    ],
+  })
+
+arcs = _mk_arcs()
+'''The arcs decorating P2 and P3 tiles, in layers 'type1' and 'type2',
+which join up into continuous curves across a tiling.'''
+
+def _bars(vs, ends):
+  # Segments between the points ((i1, t1), (i2, t2)) on the edges of the
+  # prototile with vertices vs
+  return [
+    ('bars', Segment(_on_edge(vs, i1, t1), _on_edge(vs, i2, t2)))
+    for (i1, t1), (i2, t2) in ends
+  ]
+
+def _mk_ammann_bars():
+  a = Fraction(1, 2) * pn.phi  # about 0.809
+  b = Fraction(1, 4) * pn.phi  # about 0.405
+  c = Fraction(1, 2) * pn.inv_phi * _inv_phi2  # about 0.118
+  d = Fraction(1, 4) * _inv_phi  # about 0.155
+  half = Fraction(1, 2)
+  return Decoration({
+    p.KiteTile: _bars(p.proto_kite, [
+      ((1, 1 - a), (3, 1 - b)), ((2, a), (3, c)), ((0, 1 - c), (1, 1 - a)),
+      ((0, b), (2, a)), ((0, 1 - c), (3, c)),
+    ]),
+    p.DartTile: _bars(p.proto_dart, [
+      ((1, a), (3, 1 - c)), ((2, 1 - a), (3, b)), ((0, 1 - b), (1, a)),
+      ((0, c), (2, 1 - a)), ((0, c), (3, 1 - c)),
+    ]),
+    p.ThickRhomb: _bars(p.proto_thick, [
+      ((0, d), (3, half)), ((0, half), (3, 1 - d)), ((0, half), (1, 1 - a)),
+      ((2, a), (3, half)), ((1, 1 - a), (2, a)),
+    ]),
+    p.ThinRhomb: _bars(p.proto_thin, [
+      ((0, d), (3, a)), ((1, 1 - d), (2, 1 - a)), ((0, half), (1, half)),
+      ((1, half), (2, 1 - a)), ((0, half), (3, a)),
+    ]),
+  })
+
+ammann_bars = _mk_ammann_bars()
+'''Ammann bars for P2 and P3 tiles, in layer 'bars': the segments join up
+into five families of parallel lines across a tiling, spaced at two
+distances whose ratio is the golden ratio.'''
@@ -0,0 +1,77 @@
+# MIT-licensed; see LICENSE for details
+
+from unittest import TestCase
+from collections import Counter
+from fractions import Fraction as Q
+import tile_decoration as td
+import penrose as p
+import pen_geom as pg
+from pen_num import phi
+from tile_manager import TileManager
+from tile_output import UndirectedLineSegment
+
+def _tilings():
+  tm = TileManager()
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(p.KiteTile().scale(phi).rotate(i))
+  tm = tm.decompose('to-A').decompose('half-deflation').decompose('half-deflation')
+  return [tm.decompose('to-P2'), tm.decompose('half-deflation').decompose('to-P3')]
+
+def _direction(v):
+  # The n for which v is parallel to the direction at n*18 degrees, n < 10
+  for n in range(10):
+    r = pg.rotation(n)
+    if v.x * r.d == v.y * r.a:
+      return n
+  return None
+
+class TestTransformScale(TestCase):
+  def test_scale(self):
+    for n in range(20):
+      t = p.DartTile().scale(phi * phi).rotate(n).translate(3, -1)
+      self.assertEqual(td.transform_scale(t.curr_transform()), phi * phi)
+    self.assertEqual(td.transform_scale(pg.scaling(Q(1, 3))), Q(1, 3))
+
+  def test_other_rotations(self):
+    self.assertRaises(ValueError, td.transform_scale, pg.AffineTransform(3, -4, 0, 4, 3, 0))
+
+class TestDecoration(TestCase):
+  def test_shapes_follow_transform(self):
+    t = p.ThinRhomb().scale(phi).rotate(7).translate(2, 5)
+    xf = t.curr_transform()
+    for (layer, shape), (tlayer, tshape) in zip(td.arcs.shapes(t), td.arcs.template(p.ThinRhomb)):
+      self.assertEqual(layer, tlayer)
+      self.assertEqual(shape.start, tshape.start.transform(xf))
+      self.assertEqual(shape.end, tshape.end.transform(xf))
+      self.assertEqual(shape.radius, tshape.radius * phi)
+
+  def test_layers(self):
+    self.assertEqual(td.arcs.layers(), ['type1', 'type2'])
+    self.assertEqual(td.ammann_bars.layers(), ['bars'])
+    self.assertRaises(ValueError, td.arcs.shapes, p.A_K1())
+    self.assertRaises(TypeError, td.Decoration, { p.KiteTile: [('bars', p.proto_kite[0])] })
+
+  def test_ammann_bars_join_up(self):
+    for tm in _tilings():
+      edges = Counter(
+        UndirectedLineSegment(v1, v2)
+        for t in tm.iter_tiles() for v1, v2 in zip(t.vertices(), t.vertices()[1:] + t.vertices()[:1])
+      )
+      ends = Counter()
+      for t in tm.iter_tiles():
+        vs = t.vertices()
+        for _, bar in td.ammann_bars.shapes(t):
+          d = bar.end - bar.start
+          for pt in [bar.start, bar.end]:
+            # Find the edge the end is on, and skip it if that's on the
+            # boundary of the tiling
+            on = [
+              (v1, v2) for v1, v2 in zip(vs, vs[1:] + vs[:1])
+              if ((pt - v1).x * (v2 - v1).y == (pt - v1).y * (v2 - v1).x)
+            ]
+            self.assertEqual(len(on), 1)
+            if edges[UndirectedLineSegment(*on[0])] == 2:
+              ends[(pt, _direction(d))] += 1
+      # Each bar continues straight on into the next tile
+      self.assertEqual(set(ends.values()), {2})
+      self.assertEqual(len({n for _, n in ends}), 5)
@@ -0,0 +1,219 @@
+'''Exporting tilings as floating-point geometry: vertex and index buffers,
+as raw binary, .npy files or JSON, for renderers and analysis tools'''
+
+# MIT-licensed; see LICENSE for details
+
+# A tiling's geometry is held in four arrays:
+#  * vertices: the x and y coordinates of each distinct vertex, as doubles,
+#  * indices: the indices into vertices of each tile's vertices, going
+#    counterclockwise, as 32-bit ints, all of the tiles' lists concatenated,
+#  * offsets: where each tile's vertices start in indices, and, last, the
+#    length of indices, as 32-bit ints, and
+#  * types: each tile's type code (see penrose.tile_types), as bytes.
+# Vertices shared between tiles are stored once, and are converted from
+# Numbers to floats just once. They're numbered in the order they're first
+# come to, going through the tiles in Hilbert-curve order, so that tiles
+# near each other refer to vertices near each other in the arrays. Tile
+# stores are read from their columns, with their vertices found exactly
+# from the integer coefficients, without making tile or Number objects.
+#
+# The raw binary format is a header of _raw_header (the magic bytes, then
+# the numbers of vertices, tiles and indices), followed by the four arrays,
+# little-endian, in the order above.
+
+import json, struct, sys
+from array import array
+import penrose as p
+from tile_store import TileStore, MappedTileStore, row_vertices
+
+_raw_magic = b'PENGEOM1'
+_raw_header = struct.Struct('<8sIII')
+
+# The typecode of 32-bit ints
+_int32 = 'i' if array('i').itemsize == 4 else 'l'
+
+_npy_magic = b'\x93NUMPY\x01\x00'
+# The .npy descriptions of the arrays' item types
+_npy_descr = { 'd': '<f8', _int32: '<i4', 'b': '|i1' }
+
+# Number of array items to write to a JSON file at a time
+_json_chunk = 1 << 12
+
+class Geometry:
+  '''The floating-point geometry of a tiling, as arrays; see geometry().
+  Attributes:
+    vertices: array('d') of x0, y0, x1, y1, ...
+    indices: array of 32-bit ints: the vertex indices of all the tiles'
+      vertices
+    offsets: array of 32-bit ints: where each tile's indices start, then
+      their total number
+    types: array('b') of the tiles' type codes'''
+
+  def __init__(self, vertices, indices, offsets, types):
+    if len(vertices) % 2 != 0 or len(offsets) != len(types) + 1:
+      raise ValueError
+    self.vertices, self.indices, self.offsets, self.types = vertices, indices, offsets, types
+
+  def __len__(self):
+    return len(self.types)
+
+  def vertex_count(self):
+    return len(self.vertices) // 2
+
+  def tile_vertices(self, k):
+    '''Returns the list of (x, y) vertices of the k'th tile.'''
+    vs = self.vertices
+    return [(vs[2*i], vs[2*i+1]) for i in self.indices[self.offsets[k]:self.offsets[k+1]]]
+
+def geometry(tiling):
+  '''Returns the Geometry of tiling: a TileManager, TileStore or
+  MappedTileStore, whose tiles are taken in Hilbert-curve order, or an
+  iterable of tiles.'''
+  if isinstance(tiling, (TileStore, MappedTileStore)):
+    return _store_geometry(tiling)
+  tiles = tiling.iter_tiles(order = 'hilbert') if hasattr(tiling, 'iter_tiles') else tiling
+  ids = {}
+  vertices, indices, offsets, types = array('d'), array(_int32), array(_int32, [0]), array('b')
+  for t in tiles:
+    code = p.tile_type_codes.get(type(t), None)
+    if code is None:
+      raise TypeError
+    for v in t.vertices():
+      i = ids.get(v, None)
+      if i is None:
+        i = ids[v] = len(ids)
+        vertices.append(float(v.x))
+        vertices.append(float(v.y))
+      indices.append(i)
+    offsets.append(len(indices))
+    types.append(code)
+  return Geometry(vertices, indices, offsets, types)
+
+def _store_geometry(store):
+  # geometry() for a tile store, working from its rows
+  ids = {}
+  vertices, indices, offsets, types = array('d'), array(_int32), array(_int32, [0]), array('b')
+  for code, xf, den in store.rows(order = 'hilbert'):
+    for key, (x, y) in row_vertices(code, xf, den):
+      i = ids.get(key, None)
+      if i is None:
+        i = ids[key] = len(ids)
+        vertices.append(x)
+        vertices.append(y)
+      indices.append(i)
+    offsets.append(len(indices))
+    types.append(code)
+  return Geometry(vertices, indices, offsets, types)
+
+def _little_endian(a):
+  # Returns the array a as little-endian bytes
+  if sys.byteorder != 'little':
+    a = array(a.typecode, a)
+    a.byteswap()
+  return a.tobytes()
+
+def _arrays(geom):
+  return (geom.vertices, geom.indices, geom.offsets, geom.types)
+
+def write_raw(f, geom):
+  '''Writes the Geometry geom to the binary file object f, in the raw
+  binary format described at the top of this module.'''
+  f.write(_raw_header.pack(_raw_magic, geom.vertex_count(), len(geom), len(geom.indices)))
+  for a in _arrays(geom):
+    f.write(_little_endian(a))
+
+def read_raw(f):
+  '''Reads a Geometry from the binary file object f, in the raw binary
+  format. Raises ValueError if the data is malformed.'''
+  header = f.read(_raw_header.size)
+  if len(header) != _raw_header.size:
+    raise ValueError
+  magic, n_vertices, n_tiles, n_indices = _raw_header.unpack(header)
+  if magic != _raw_magic:
+    raise ValueError
+  arrays = []
+  for typecode, n in (('d', 2 * n_vertices), (_int32, n_indices), (_int32, n_tiles + 1), ('b', n_tiles)):
+    a = array(typecode)
+    data = f.read(n * a.itemsize)
+    if len(data) != n * a.itemsize:
+      raise ValueError
+    a.frombytes(data)
+    if sys.byteorder != 'little':
+      a.byteswap()
+    arrays.append(a)
+  return Geometry(*arrays)
+
+def write_npy(f, a, shape = None):
+  '''Writes the array a (of doubles, 32-bit ints or bytes) to the binary file
+  object f in NumPy's .npy format, as an array of the given shape (by
+  default, one-dimensional).'''
+  descr = _npy_descr.get(a.typecode, None)
+  if descr is None:
+    raise ValueError
+  shape = (len(a),) if shape is None else tuple(shape)
+  n = 1
+  for dim in shape:
+    n *= dim
+  if n != len(a):
+    raise ValueError
+  header = "{{'descr': '{}', 'fortran_order': False, 'shape': {}, }}".format(descr, repr(shape))
+  # The header is padded with spaces, and ends with a newline, so that the
+  # data starts at a multiple of 64 bytes
+  n_pad = -(len(_npy_magic) + 2 + len(header) + 1) % 64
+  header = (header + ' ' * n_pad + '\n').encode('latin1')
+  f.write(_npy_magic + struct.pack('<H', len(header)) + header)
+  f.write(_little_endian(a))
+
+def save_npy(prefix, geom):
+  '''Writes the arrays of the Geometry geom to the .npy files
+  prefix + '-vertices.npy' (of shape (number of vertices, 2)),
+  prefix + '-indices.npy', prefix + '-offsets.npy' and
+  prefix + '-types.npy'.'''
+  for name, a, shape in (
+    ('vertices', geom.vertices, (geom.vertex_count(), 2)),
+    ('indices', geom.indices, None),
+    ('offsets', geom.offsets, None),
+    ('types', geom.types, None),
+  ):
+    with open('{}-{}.npy'.format(prefix, name), 'wb') as f:
+      write_npy(f, a, shape)
+
+def _write_json_array(f, a, fmt):
+  f.write('[')
+  for start in range(0, len(a), _json_chunk):
+    if start > 0:
+      f.write(',')
+    f.write(','.join(map(fmt, a[start:start+_json_chunk])))
+  f.write(']')
+
+def write_json(f, geom):
+  '''Writes the Geometry geom to the text file object f as a JSON object
+  with the arrays as members "vertices", "indices", "offsets" and "types",
+  and the names of the tile types, indexed by type code, as "type_names".
+  The arrays are streamed out a chunk at a time, not built up as one
+  string.'''
+  f.write('{"type_names":')
+  f.write(json.dumps([ty.__name__ for ty in p.tile_types]))
+  for name, a in zip(('vertices', 'indices', 'offsets', 'types'), _arrays(geom)):
+    f.write(',"{}":'.format(name))
+    _write_json_array(f, a, repr if a.typecode == 'd' else str)
+  f.write('}\n')
+
+def save(path, tiling, fmt = None):
+  '''Writes the geometry of tiling to a new file at path, in the format
+  fmt: 'raw', 'json' or 'npy' (in which case path is the prefix passed to
+  save_npy()); by default, chosen by path's extension ('.json' for JSON,
+  otherwise raw).'''
+  if fmt is None:
+    fmt = 'json' if path.endswith('.json') else 'raw'
+  if fmt not in ('raw', 'json', 'npy'):
+    raise ValueError
+  geom = geometry(tiling)
+  if fmt == 'npy':
+    save_npy(path, geom)
+  elif fmt == 'json':
+    with open(path, 'w') as f:
+      write_json(f, geom)
+  else:
+    with open(path, 'wb') as f:
+      write_raw(f, geom)
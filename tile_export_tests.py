@@ -0,0 +1,98 @@
+# MIT-licensed; see LICENSE for details
+
+import ast, io, json, os, shutil, struct, tempfile
+from unittest import TestCase
+import tile_export as te
+import penrose as p
+from tile_manager import TileManager
+from tile_store import TileStore, MappedTileStore
+from pen_num import phi
+
+def _sun():
+  tm = TileManager()
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(p.KiteTile().scale(phi).rotate(i))
+  return tm.decompose('to-A').decompose('half-deflation').decompose('half-deflation').decompose('to-P2')
+
+def _read_npy(data):
+  # Returns (header dict, data) for the .npy file data
+  if data[:8] != b'\x93NUMPY\x01\x00':
+    raise ValueError
+  n, = struct.unpack('<H', data[8:10])
+  if (10 + n) % 64 != 0:
+    raise ValueError
+  return (ast.literal_eval(data[10:10+n].decode('latin1')), data[10+n:])
+
+class TestExport(TestCase):
+  def test_geometry(self):
+    tm = _sun()
+    geom = te.geometry(tm)
+    self.assertEqual(len(geom), tm.count())
+    self.assertEqual(geom.vertex_count(), len(tm.get_vertices()))
+    self.assertEqual(geom.offsets[-1], len(geom.indices))
+    for k, t in enumerate(tm.iter_tiles(order = 'hilbert')):
+      self.assertIs(p.tile_types[geom.types[k]], type(t))
+      self.assertEqual(geom.tile_vertices(k), [(float(v.x), float(v.y)) for v in t.vertices()])
+    self.assertRaises(TypeError, te.geometry, [object()])
+    self.assertEqual(geom.indices.itemsize, 4)
+
+  def test_stores(self):
+    # Stores are exported from their columns, with the same vertices shared
+    tm = _sun()
+    def polygons(geom):
+      return sorted(
+        (geom.types[k], tuple((round(x, 9), round(y, 9)) for x, y in geom.tile_vertices(k)))
+        for k in range(len(geom))
+      )
+    expected = te.geometry(tm)
+    store = TileStore(tm.iter_tiles())
+    d = tempfile.mkdtemp()
+    try:
+      with MappedTileStore.create(os.path.join(d, 'sun'), store) as m:
+        for s in (store, m):
+          geom = te.geometry(s)
+          self.assertEqual(geom.vertex_count(), expected.vertex_count())
+          self.assertEqual(polygons(geom), polygons(expected))
+    finally:
+      shutil.rmtree(d)
+
+  def test_raw(self):
+    geom = te.geometry(_sun())
+    f = io.BytesIO()
+    te.write_raw(f, geom)
+    self.assertEqual(len(f.getvalue()), 20 + 8 * len(geom.vertices) + 4 * (len(geom.indices) + len(geom.offsets)) + len(geom))
+    f.seek(0)
+    read = te.read_raw(f)
+    for a, b in zip(te._arrays(geom), te._arrays(read)):
+      self.assertEqual(a, b)
+    self.assertRaises(ValueError, te.read_raw, io.BytesIO(f.getvalue()[:-1]))
+    self.assertRaises(ValueError, te.read_raw, io.BytesIO(b'PENGEOM2' + f.getvalue()[8:]))
+
+  def test_npy(self):
+    geom = te.geometry(_sun())
+    f = io.BytesIO()
+    te.write_npy(f, geom.vertices, (geom.vertex_count(), 2))
+    header, data = _read_npy(f.getvalue())
+    self.assertEqual(header, {'descr': '<f8', 'fortran_order': False, 'shape': (geom.vertex_count(), 2)})
+    self.assertEqual(struct.unpack('<2d', data[:16]), tuple(geom.vertices[:2]))
+    self.assertRaises(ValueError, te.write_npy, io.BytesIO(), geom.vertices, (3, 2))
+
+    d = tempfile.mkdtemp()
+    try:
+      te.save(os.path.join(d, 'sun'), _sun(), 'npy')
+      self.assertEqual(sorted(os.listdir(d)), ['sun-indices.npy', 'sun-offsets.npy', 'sun-types.npy', 'sun-vertices.npy'])
+      with open(os.path.join(d, 'sun-types.npy'), 'rb') as f:
+        header, data = _read_npy(f.read())
+      self.assertEqual((header['descr'], header['shape']), ('|i1', (len(geom),)))
+      self.assertEqual(data, geom.types.tobytes())
+    finally:
+      shutil.rmtree(d)
+
+  def test_json(self):
+    geom = te.geometry(_sun())
+    f = io.StringIO()
+    te.write_json(f, geom)
+    obj = json.loads(f.getvalue())
+    self.assertEqual(obj['type_names'][obj['types'][0]], p.tile_types[geom.types[0]].__name__)
+    for name, a in zip(('vertices', 'indices', 'offsets', 'types'), te._arrays(geom)):
+      self.assertEqual(obj[name], list(a))
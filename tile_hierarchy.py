@@ -0,0 +1,376 @@
+'''Queries on the substitution hierarchy of a tiling, answered without
+generating the full deflated tiling'''
+
+# MIT-licensed; see LICENSE for details
+
+import random, sys, weakref
+from fractions import Fraction as Q
+import penrose as p
+import pen_geom as pg
+import pen_num
+
+def _tiles_of(tiling):
+  if isinstance(tiling, p.TileWithMatchingRule):
+    return (tiling,)
+  get_tiles = getattr(tiling, 'get_tiles', None)
+  if get_tiles is not None:
+    return get_tiles()
+  return tiling
+
+def _containment(pt, t):
+  # +1 if pt is inside t, 0 if on its boundary, -1 if outside
+  bb = t.bbox()
+  if pt.x < bb.min_x or pt.x > bb.max_x or pt.y < bb.min_y or pt.y > bb.max_y:
+    return -1
+  return pg.point_in_polygon(pt, pg.Polygon(t.vertices()))
+
+def _containing_tile(pt, tiles):
+  # Returns (index, tile) for a tile of tiles that contains pt, preferring
+  # one that has pt in its interior, or None if there isn't any
+  on_boundary = None
+  for i, t in enumerate(tiles):
+    c = _containment(pt, t)
+    if c > 0:
+      return (i, t)
+    if c == 0 and on_boundary is None:
+      on_boundary = (i, t)
+  return on_boundary
+
+def _descend(point, seed_tiling, depth, decomp_id):
+  if not isinstance(point, pg.Point):
+    raise TypeError
+  if depth < 0:
+    raise ValueError
+
+  found = _containing_tile(point, seed_tiles(seed_tiling))
+  if found is None:
+    return None
+  address, t = [found[0]], found[1]
+  for i in range(depth):
+    children = t.decompose(decomp_id)
+    if children is None:
+      raise ValueError
+    found = _containing_tile(point, children)
+    if found is None: # only possible if children don't cover t
+      return None
+    address.append(found[0])
+    t = found[1]
+  return (tuple(address), t)
+
+def locate(point, seed_tiling, depth, decomp_id = 'half-deflation'):
+  '''Returns the tile containing Point point in the tiling obtained by
+  decomposing seed_tiling (a TileManager, an iterable of tiles, or a single
+  tile) depth times using decomp_id, or None if point is outside the
+  seed tiling.
+
+  Only the children of the tile containing point are examined at each
+  level, so this takes time proportional to depth rather than to the size
+  of the decomposed tiling. If point is on the boundary between tiles,
+  any one of them may be returned.'''
+  found = _descend(point, seed_tiling, depth, decomp_id)
+  return None if found is None else found[1]
+
+# Hierarchical addresses
+#
+# A tile obtained by decomposing a seed tiling n times is identified by its
+# address: a tuple (s, c_1, ..., c_n) where s is the index of its ancestor
+# in seed_tiles(seed_tiling), and c_i is the index of its level-i ancestor
+# in the decomposition of its level-(i-1) ancestor (i.e., in the
+# _decompositions table of that tile's class). Addresses depend only on the
+# seed tiling and the decomposition used, so they are stable from run to run,
+# and all tiles sharing an address prefix form a contiguous patch.
+
+def _canonical_key(t):
+  if isinstance(t, p.TransformableTile):
+    tr = t.curr_transform()
+    coords = (tr.a, tr.b, tr.c, tr.d, tr.e, tr.f)
+  else:
+    coords = [c for v in t.vertices() for c in (v.x, v.y)]
+  return (type(t).__name__, tuple(x._vec for x in coords))
+
+# Maps TileManagers to (generation, tuple of their tiles in canonical
+# order), so that they're only sorted again after they change
+_seed_orders = weakref.WeakKeyDictionary()
+
+def _seed_order(seed_tiling):
+  # Returns a sequence of the tiles of seed_tiling in canonical order
+  generation = getattr(seed_tiling, 'generation', None)
+  if generation is None:
+    return sorted(_tiles_of(seed_tiling), key = _canonical_key)
+  cached = _seed_orders.get(seed_tiling, None)
+  if cached is None or cached[0] != generation():
+    cached = (generation(), tuple(sorted(_tiles_of(seed_tiling), key = _canonical_key)))
+    _seed_orders[seed_tiling] = cached
+  return cached[1]
+
+def seed_tiles(seed_tiling):
+  '''Returns the tiles of seed_tiling (a TileManager, an iterable of tiles,
+  or a single tile) in the canonical order used for addresses; the order
+  of a TileManager's tiles is kept until tiles are added to or removed
+  from it.'''
+  return list(_seed_order(seed_tiling))
+
+def _child_types(ty, decomp_id):
+  d = ty._decompositions.get(decomp_id, None)
+  if d is None:
+    raise ValueError
+  return tuple(type(c) for c in d)
+
+def tile_at_address(seed_tiling, address, decomp_id = 'half-deflation'):
+  '''Returns the tile with the given address, constructing only its
+  ancestors (not their siblings).'''
+  if len(address) == 0:
+    raise ValueError
+  t = _seed_order(seed_tiling)[address[0]]
+  for i in address[1:]:
+    t = t.decompose_child(decomp_id, i)
+    if t is None:
+      raise ValueError
+  return t
+
+def locate_address(point, seed_tiling, depth, decomp_id = 'half-deflation'):
+  '''Like locate, but returns the address of the tile containing point
+  (or None).'''
+  found = _descend(point, seed_tiling, depth, decomp_id)
+  return None if found is None else found[0]
+
+def _iter_subtree(address, ty, depth, decomp_id):
+  # Addresses of the descendants at the given relative depth of a tile
+  # of type ty at address; only tile types are needed, not geometry
+  if depth == 0:
+    yield address
+    return
+  for i, child_ty in enumerate(_child_types(ty, decomp_id)):
+    yield from _iter_subtree(address + (i,), child_ty, depth - 1, decomp_id)
+
+def iter_addresses(seed_tiling, depth, prefix = (), decomp_id = 'half-deflation'):
+  '''Yields, in lexicographic order, the addresses of all tiles obtained by
+  decomposing seed_tiling depth times that start with prefix.
+
+  No tile geometry is computed, so this is cheap; splitting the addresses
+  at some depth k into prefixes, e.g. with iter_addresses(seed_tiling, k),
+  gives independent pieces of work for separate processes.'''
+  prefix = tuple(prefix)
+  seeds = seed_tiles(seed_tiling)
+  if len(prefix) == 0:
+    for s, t in enumerate(seeds):
+      yield from _iter_subtree((s,), type(t), depth, decomp_id)
+    return
+  if len(prefix) > depth + 1:
+    raise ValueError
+  ty = type(seeds[prefix[0]])
+  for i in prefix[1:]:
+    ty = _child_types(ty, decomp_id)[i]
+  yield from _iter_subtree(prefix, ty, depth + 1 - len(prefix), decomp_id)
+
+def iter_tiles(seed_tiling, depth, prefix = (), region = None, decomp_id = 'half-deflation'):
+  '''Yields (address, tile) for the tiles obtained by decomposing seed_tiling
+  depth times whose addresses start with prefix and, if region is given,
+  whose bounding boxes overlap the Rectangle region.
+
+  Subtrees whose root doesn't overlap region are skipped, which assumes
+  that the decomposition doesn't extend beyond the decomposed tile (true
+  of the half-deflations and deflations of the Robinson tiles).'''
+  prefix = tuple(prefix)
+  seeds = seed_tiles(seed_tiling)
+  if len(prefix) > depth + 1:
+    raise ValueError
+
+  def walk(address, t, remaining):
+    if region is not None and not pg.do_bboxes_overlap(t, region):
+      return
+    if remaining == 0:
+      yield (address, t)
+      return
+    children = t.decompose(decomp_id)
+    if children is None:
+      raise ValueError
+    for i, c in enumerate(children):
+      yield from walk(address + (i,), c, remaining - 1)
+
+  if len(prefix) == 0:
+    for s, t in enumerate(seeds):
+      yield from walk((s,), t, depth)
+  else:
+    t = seeds[prefix[0]]
+    for i in prefix[1:]:
+      t = t.decompose_child(decomp_id, i)
+      if t is None:
+        raise ValueError
+    yield from walk(prefix, t, depth + 1 - len(prefix))
+
+def addresses_in_region(seed_tiling, region, depth, decomp_id = 'half-deflation'):
+  '''Returns the addresses of the tiles obtained by decomposing seed_tiling
+  depth times whose bounding boxes overlap the Rectangle region.'''
+  return [a for a, t in iter_tiles(seed_tiling, depth, region = region, decomp_id = decomp_id)]
+
+def _subtree_sizes(ty, depth, decomp_id, memo):
+  key = (ty, depth)
+  n = memo.get(key, None)
+  if n is None:
+    if depth == 0:
+      n = 1
+    else:
+      n = sum(_subtree_sizes(c, depth - 1, decomp_id, memo) for c in _child_types(ty, decomp_id))
+    memo[key] = n
+  return n
+
+def random_address(seed_tiling, depth, rng = random, decomp_id = 'half-deflation'):
+  '''Returns the address of a tile chosen uniformly at random from those
+  obtained by decomposing seed_tiling depth times, using the random.Random
+  instance (or module) rng. No tile geometry is computed.'''
+  memo = {}
+  tys = [type(t) for t in seed_tiles(seed_tiling)]
+
+  def choose(types, remaining):
+    weights = [_subtree_sizes(ty, remaining, decomp_id, memo) for ty in types]
+    k = rng.randrange(sum(weights))
+    for i, w in enumerate(weights):
+      if k < w:
+        return i
+      k -= w
+
+  address = [choose(tys, depth)]
+  ty = tys[address[0]]
+  for d in range(depth, 0, -1):
+    children = _child_types(ty, decomp_id)
+    i = choose(children, d - 1)
+    address.append(i)
+    ty = children[i]
+  return tuple(address)
+
+# Tile-count forecasting
+#
+# With types T_1, ..., T_k, the substitution matrix M of a decomposition has
+# M[i][j] equal to the number of tiles of type T_i in the decomposition of
+# a tile of type T_j. If v holds the number of tiles of each type in a
+# tiling, M^n v holds the numbers after decomposing it n times.
+
+def _reachable_types(types, decomp_id):
+  found, todo = [], list(types)
+  while todo:
+    ty = todo.pop()
+    if ty in found:
+      continue
+    found.append(ty)
+    todo.extend(_child_types(ty, decomp_id))
+  return tuple(sorted(found, key = lambda ty: ty.__name__))
+
+_robinson_types = (p.A_K1, p.A_K2, p.A_D1, p.A_D2, p.B_L1, p.B_L2, p.B_S1, p.B_S2)
+
+def substitution_matrix(decomp_id = 'half-deflation', types = _robinson_types):
+  '''Returns (types, M), where types is a tuple of the tile classes reachable
+  from types by repeatedly decomposing with decomp_id, and M is the
+  substitution matrix (a list of rows of ints) with respect to those types,
+  derived from the classes' _decompositions tables.'''
+  types = _reachable_types(types, decomp_id)
+  index = {ty: i for i, ty in enumerate(types)}
+  M = [[0] * len(types) for ty in types]
+  for j, ty in enumerate(types):
+    for child_ty in _child_types(ty, decomp_id):
+      M[index[child_ty]][j] += 1
+  return (types, M)
+
+def _mat_mul(A, B):
+  Bt = list(zip(*B))
+  return [[sum(a * b for a, b in zip(row, col)) for col in Bt] for row in A]
+
+def _mat_pow(M, n):
+  result = [[int(i == j) for j in range(len(M))] for i in range(len(M))]
+  while n > 0:
+    if n & 1:
+      result = _mat_mul(result, M)
+    M = _mat_mul(M, M)
+    n >>= 1
+  return result
+
+def forecast_counts(seed_tiling, depth, decomp_id = 'half-deflation'):
+  '''Returns a dict mapping tile class to the exact number of tiles of that
+  class obtained by decomposing seed_tiling depth times, using O(log depth)
+  products of the substitution matrix (no tiles are constructed).'''
+  if depth < 0:
+    raise ValueError
+  seed_types = [type(t) for t in _tiles_of(seed_tiling)]
+  if depth == 0:
+    # The seed's types needn't have decompositions
+    counts = {}
+    for ty in seed_types:
+      counts[ty] = counts.get(ty, 0) + 1
+    return counts
+  types, M = substitution_matrix(decomp_id, set(seed_types))
+  v = [[seed_types.count(ty)] for ty in types]
+  counts = _mat_mul(_mat_pow(M, depth), v)
+  return {ty: counts[i][0] for i, ty in enumerate(types) if counts[i][0] != 0}
+
+def _deep_size(obj, seen):
+  # Approximate number of bytes used by obj and the objects only it refers to
+  if id(obj) in seen:
+    return 0
+  seen.add(id(obj))
+  size = sys.getsizeof(obj)
+  if isinstance(obj, (tuple, list, set, frozenset)):
+    size += sum(_deep_size(x, seen) for x in obj)
+  elif isinstance(obj, dict):
+    size += sum(_deep_size(k, seen) + _deep_size(v, seen) for k, v in obj.items())
+  elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+    size += _deep_size(obj.__dict__, seen)
+  elif isinstance(obj, Q):
+    size += _deep_size(obj.numerator, seen) + _deep_size(obj.denominator, seen)
+  return size
+
+# Rough per-tile cost of TileManager's bookkeeping (set and dict entries
+# for the tile, its grid cells and its vertices)
+_manager_overhead_bytes = 600
+
+def estimate_tile_bytes(ty, scale_depth = 0):
+  '''Returns a rough estimate of the memory, in bytes, taken by a tile of
+  class ty held in a TileManager, including its cached bounding box, edges
+  and hash. scale_depth is the number of half-deflations the tile is from
+  a unit-sized tile (coordinates get larger denominators as it increases).'''
+  tr = pg.rotation(3) @ pg.scaling(pen_num.inv_phi)
+  t = ty()
+  for i in range(scale_depth):
+    t = t.transform(tr)
+  t.bbox()
+  t._edges()
+  hash(t)
+  # Don't count objects shared with all other tiles
+  seen = {id(x) for x in (ty, pg.identity_transform)}
+  return _deep_size(t, seen) + _manager_overhead_bytes
+
+class Forecast:
+  '''The result of forecast(): the expected size of a decomposed tiling'''
+
+  def __init__(self, counts, bytes_per_tile):
+    self.counts = counts
+    self.bytes_per_tile = bytes_per_tile
+
+  def total(self):
+    '''Returns the total number of tiles'''
+    return sum(self.counts.values())
+
+  def estimated_bytes(self):
+    '''Returns a rough estimate of the memory needed to hold the tiling'''
+    return sum(n * self.bytes_per_tile[ty] for ty, n in self.counts.items())
+
+  def check(self, max_tiles = None, max_bytes = None):
+    '''Raises MemoryError if the forecast exceeds max_tiles tiles or
+    max_bytes bytes.'''
+    if max_tiles is not None and self.total() > max_tiles:
+      raise MemoryError('forecast of {} tiles exceeds the limit of {}'.format(self.total(), max_tiles))
+    if max_bytes is not None and self.estimated_bytes() > max_bytes:
+      raise MemoryError('forecast of {} bytes exceeds the limit of {}'.format(self.estimated_bytes(), max_bytes))
+    return self
+
+  def __str__(self):
+    return '<Forecast {} tiles (~{:.1f} MiB): {}>'.format(
+      self.total(),
+      self.estimated_bytes() / 2**20,
+      ', '.join('{} {}'.format(n, ty.__name__) for ty, n in self.counts.items())
+    )
+
+def forecast(seed_tiling, depth, decomp_id = 'half-deflation'):
+  '''Returns a Forecast of the tiles obtained by decomposing seed_tiling
+  depth times: exact per-class counts, plus a rough memory estimate.'''
+  counts = forecast_counts(seed_tiling, depth, decomp_id)
+  return Forecast(counts, {ty: estimate_tile_bytes(ty, depth) for ty in counts})
@@ -0,0 +1,138 @@
+# MIT-licensed; see LICENSE for details
+
+from unittest import TestCase
+import tile_hierarchy as th
+import penrose as p
+import pen_geom as g
+from fractions import Fraction as Q
+from pen_num import phi
+from tile_manager import TileManager
+
+def _seed():
+  tm = TileManager()
+  tm.add_tile(p.KiteTile().scale(3).rotate(-1))
+  tm.add_tile(p.KiteTile().scale(3).rotate(3))
+  return tm.decompose('to-A')
+
+class TestLocate(TestCase):
+  def test_locate_matches_full_decomposition(self):
+    seed = _seed()
+    full = seed.decompose('half-deflation').decompose('half-deflation')
+    points = [
+      g.Point(1, Q(1,2)), g.Point(2, Q(-1,3)), g.Point(Q(1,10), Q(1,5)),
+      g.Point(Q(-1,5), 2),
+    ]
+    for pt in points:
+      with self.subTest(pt = pt):
+        t = th.locate(pt, seed, 2)
+        self.assertIn(t, set(full.get_tiles()))
+        self.assertEqual(g.point_in_polygon(pt, g.Polygon(t.vertices())), 1)
+
+  def test_locate_outside(self):
+    self.assertIsNone(th.locate(g.Point(-1, -1), _seed(), 3))
+
+  def test_locate_bad_args(self):
+    self.assertRaises(TypeError, th.locate, (0, 0), _seed(), 1)
+    self.assertRaises(ValueError, th.locate, g.Point(1, 0), _seed(), -1)
+    self.assertRaises(ValueError, th.locate, g.Point(1, Q(1,2)), _seed(), 1, 'no-such-decomposition')
+
+class TestAddresses(TestCase):
+  def test_addresses_cover_decomposition(self):
+    seed = _seed()
+    full = seed.decompose('half-deflation').decompose('half-deflation')
+    pairs = list(th.iter_tiles(seed, 2))
+    self.assertEqual(set(t for a, t in pairs), set(full.get_tiles()))
+    self.assertEqual(len(pairs), len(full.get_tiles()))
+    self.assertEqual([a for a, t in pairs], list(th.iter_addresses(seed, 2)))
+    for a, t in pairs:
+      with self.subTest(address = a):
+        self.assertEqual(th.tile_at_address(seed, a), t)
+
+  def test_addresses_are_canonical(self):
+    seed = _seed()
+    reordered = list(reversed(th.seed_tiles(seed)))
+    self.assertEqual(list(th.iter_addresses(seed, 3)), list(th.iter_addresses(reordered, 3)))
+
+  def test_seed_order_is_updated(self):
+    seed = _seed()
+    first = th.seed_tiles(seed)
+    self.assertEqual(th.seed_tiles(seed), first)
+    seed.remove_tile(first[0])
+    self.assertEqual(th.seed_tiles(seed), first[1:])
+    self.assertEqual(th.tile_at_address(seed, (0,)), first[1])
+
+  def test_prefixes(self):
+    seed = _seed()
+    all_addrs = list(th.iter_addresses(seed, 3))
+    by_prefix = [a for pre in th.iter_addresses(seed, 1) for a in th.iter_addresses(seed, 3, pre)]
+    self.assertEqual(all_addrs, by_prefix)
+    pre = all_addrs[3][:3]
+    self.assertEqual(
+      [a for a, t in th.iter_tiles(seed, 3, pre)],
+      [a for a in all_addrs if a[:3] == pre]
+    )
+    self.assertRaises(ValueError, list, th.iter_addresses(seed, 1, (0, 0, 0)))
+
+  def test_locate_address(self):
+    seed = _seed()
+    pt = g.Point(1, Q(1,2))
+    a = th.locate_address(pt, seed, 3)
+    self.assertEqual(len(a), 4)
+    self.assertEqual(th.tile_at_address(seed, a), th.locate(pt, seed, 3))
+    self.assertIsNone(th.locate_address(g.Point(-1, -1), seed, 3))
+
+  def test_addresses_in_region(self):
+    seed = _seed()
+    region = g.Rectangle(0, 0, Q(1,2), Q(1,2))
+    addrs = th.addresses_in_region(seed, region, 2)
+    expected = [a for a, t in th.iter_tiles(seed, 2) if g.do_bboxes_overlap(t, region)]
+    self.assertEqual(addrs, expected)
+    self.assertTrue(0 < len(addrs) < len(list(th.iter_addresses(seed, 2))))
+
+  def test_random_address(self):
+    import random
+    seed = _seed()
+    rng = random.Random(1234)
+    valid = set(th.iter_addresses(seed, 4))
+    for i in range(20):
+      self.assertIn(th.random_address(seed, 4, rng), valid)
+
+class TestForecast(TestCase):
+  def test_substitution_matrix(self):
+    types, M = th.substitution_matrix()
+    self.assertEqual(len(types), 8)
+    for j, ty in enumerate(types):
+      with self.subTest(ty = ty):
+        self.assertEqual(sum(row[j] for row in M), len(ty._decompositions['half-deflation']))
+    types, M = th.substitution_matrix('deflation', (p.A_K1,))
+    self.assertEqual(set(types), {p.A_K1, p.A_K2, p.A_D1, p.A_D2})
+
+  def test_forecast_counts_match_decomposition(self):
+    from collections import Counter
+    tm = _seed()
+    for depth in range(4):
+      with self.subTest(depth = depth):
+        self.assertEqual(th.forecast_counts(_seed(), depth), dict(Counter(type(t) for t in tm.get_tiles())))
+      tm = tm.decompose('half-deflation')
+
+  def test_forecast_counts_large_depth(self):
+    counts = th.forecast_counts(p.A_K1(), 200)
+    # The numbers of tiles grow by a factor of phi^2 per full deflation
+    ratio = sum(counts.values()) / sum(th.forecast_counts(p.A_K1(), 198).values())
+    self.assertAlmostEqual(ratio, float(phi * phi))
+    self.assertRaises(ValueError, th.forecast_counts, p.KiteTile(), 1)
+
+  def test_forecast_counts_depth_zero(self):
+    # P2 and P3 tiles have no half-deflation, but a depth of 0 needs none
+    sun = [p.KiteTile().rotate(i) for i in [-1, 3, 7, 11, 15]]
+    self.assertEqual(th.forecast_counts(sun, 0), {p.KiteTile: 5})
+    self.assertEqual(th.forecast_counts(p.ThinRhomb(), 0), {p.ThinRhomb: 1})
+    self.assertEqual(th.forecast(sun, 0).total(), 5)
+
+  def test_forecast(self):
+    f = th.forecast(_seed(), 6)
+    self.assertEqual(f.total(), sum(th.forecast_counts(_seed(), 6).values()))
+    self.assertTrue(f.estimated_bytes() > 1000 * f.total())
+    self.assertIs(f.check(max_tiles = f.total()), f)
+    self.assertRaises(MemoryError, f.check, max_tiles = f.total() - 1)
+    self.assertRaises(MemoryError, f.check, max_bytes = 1000)
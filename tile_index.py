@@ -0,0 +1,680 @@
+'''Spatial indexes for tiles, using floating-point shadows of their bounding boxes'''
+
+# MIT-licensed; see LICENSE for details
+
+# The indexes here only ever serve as a filter: they return a superset of
+# the tiles whose (exact) bounding boxes overlap a query, and the caller does
+# any exact geometric tests needed. So it's fine for them to work on
+# floating-point approximations of the bounding boxes, as long as those
+# approximations are widened slightly to make up for rounding.
+
+from collections import defaultdict
+from math import floor, ceil, sqrt, hypot
+import heapq
+
+# Relative and absolute widening of floating-point bounding boxes
+_rel_slop = 1e-9
+_abs_slop = 1e-12
+
+def widen(min_x, min_y, max_x, max_y):
+  '''Returns the floating-point bounding box (min_x, min_y, max_x, max_y),
+  widened enough to make up for rounding errors in computing it.'''
+  slop = _abs_slop + _rel_slop * max(abs(min_x), abs(min_y), abs(max_x), abs(max_y))
+  return (min_x - slop, min_y - slop, max_x + slop, max_y + slop)
+
+def float_bbox(t):
+  '''Returns a tuple (min_x, min_y, max_x, max_y) of floats, bounding
+  the exact bounding box of t (anything with a bbox() method) from outside.'''
+  bb = t.bbox()
+  return widen(float(bb.min_x), float(bb.min_y), float(bb.max_x), float(bb.max_y))
+
+def _bbox_size(fb):
+  return max(fb[2] - fb[0], fb[3] - fb[1])
+
+def overlap(fb1, fb2):
+  '''Returns whether the floating-point bounding boxes fb1 and fb2 overlap.'''
+  return fb1[0] <= fb2[2] and fb2[0] <= fb1[2] and fb1[1] <= fb2[3] and fb2[1] <= fb1[3]
+
+def _union(fbs):
+  fbs = list(fbs)
+  return (min(fb[0] for fb in fbs), min(fb[1] for fb in fbs),
+          max(fb[2] for fb in fbs), max(fb[3] for fb in fbs))
+
+def bbox_distance(x, y, fb):
+  '''Returns the distance from the point (x, y) to the floating-point
+  bounding box fb, which is 0 if the point is inside it.'''
+  dx = max(fb[0] - x, 0.0, x - fb[2])
+  dy = max(fb[1] - y, 0.0, y - fb[3])
+  return hypot(dx, dy)
+
+def polygon_distance(x, y, pts):
+  '''Returns the distance from the point (x, y) to the simple polygon with
+  the list of vertices pts, as (x, y) pairs of floats; this is 0 if the
+  point is inside the polygon.'''
+  inside, best = False, None
+  for k in range(len(pts)):
+    (x1, y1), (x2, y2) = pts[k-1], pts[k]
+    if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+      inside = not inside
+    dx, dy = x2 - x1, y2 - y1
+    len2 = dx*dx + dy*dy
+    s = 0.0 if len2 == 0 else min(1.0, max(0.0, ((x - x1)*dx + (y - y1)*dy) / len2))
+    d = hypot(x - x1 - s*dx, y - y1 - s*dy)
+    best = d if best is None or d < best else best
+  return 0.0 if inside else best
+
+def float_centroid(t):
+  '''Returns the centroid of t's vertices, as a pair of floats.'''
+  v = t.vertices()
+  return (sum(float(pt.x) for pt in v) / len(v), sum(float(pt.y) for pt in v) / len(v))
+
+def morton_key(ix, iy):
+  '''Returns the position of the cell (ix, iy), with ix and iy non-negative
+  integers, along the Morton (Z-order) curve, by interleaving their bits.'''
+  key, shift = 0, 0
+  while ix or iy:
+    key |= ((ix & 1) << (2*shift)) | ((iy & 1) << (2*shift + 1))
+    ix, iy, shift = ix >> 1, iy >> 1, shift + 1
+  return key
+
+def hilbert_key(ix, iy, bits):
+  '''Returns the position of the cell (ix, iy) along the Hilbert curve
+  filling the 2**bits by 2**bits grid of cells.'''
+  key, s = 0, 1 << (bits - 1)
+  while s > 0:
+    rx = 1 if ix & s else 0
+    ry = 1 if iy & s else 0
+    key += s * s * ((3 * rx) ^ ry)
+    # Rotate the quadrant, so that the curve within it has
+    # the standard orientation
+    if ry == 0:
+      if rx == 1:
+        ix, iy = s - 1 - (ix & (s - 1)), s - 1 - (iy & (s - 1))
+      ix, iy = iy, ix
+    s >>= 1
+  return key
+
+# Bits per coordinate of the grid that curve_keys() quantizes to
+_curve_bits = 16
+
+def curve_keys(ts, curve, centroid = float_centroid):
+  '''Returns a dict mapping each of the objects in ts to its position along
+  the space-filling curve ('morton' or 'hilbert') through a fine grid over
+  their bounding box; positions are taken at the objects' centroids, as
+  given by centroid(t) as pairs of floats.'''
+  if curve not in ('morton', 'hilbert'):
+    raise ValueError
+  centroids = {t: centroid(t) for t in ts}
+  if len(centroids) == 0:
+    return {}
+  min_x = min(c[0] for c in centroids.values())
+  min_y = min(c[1] for c in centroids.values())
+  extent = max(max(c[0] for c in centroids.values()) - min_x,
+               max(c[1] for c in centroids.values()) - min_y)
+  n = 1 << _curve_bits
+  scale = (n - 1) / extent if extent > 0 else 0.0
+
+  keys = {}
+  for t, (x, y) in centroids.items():
+    ix, iy = int((x - min_x) * scale), int((y - min_y) * scale)
+    keys[t] = morton_key(ix, iy) if curve == 'morton' else hilbert_key(ix, iy, _curve_bits)
+  return keys
+
+class SpatialIndex:
+  '''The interface of the spatial indexes: a set of objects with bbox()
+  methods (usually tiles), supporting queries by floating-point bounding box
+  fb = (min_x, min_y, max_x, max_y) and nearest-neighbor searches.'''
+
+  def __len__(self):
+    raise NotImplementedError
+
+  def __contains__(self, t):
+    raise NotImplementedError
+
+  def insert(self, t):
+    '''Adds t to the index.'''
+    raise NotImplementedError
+
+  def insert_many(self, ts):
+    '''Adds all of the objects in the iterable ts to the index.'''
+    for t in ts:
+      self.insert(t)
+
+  def remove(self, t):
+    '''Removes t from the index, if present.'''
+    raise NotImplementedError
+
+  def query(self, fb):
+    '''Returns the set of objects whose bounding boxes might overlap the
+    floating-point bounding box fb = (min_x, min_y, max_x, max_y).'''
+    raise NotImplementedError
+
+  def nearest(self, x, y, dist = None):
+    '''Returns the object nearest to the point (x, y), or None if the index
+    is empty. dist(t, x, y), if given, is the distance to use; it must be no
+    less than the distance to t's bounding box, which is the default.'''
+    raise NotImplementedError
+
+class GridIndex(SpatialIndex):
+  '''A uniform grid of square cells, each holding the set of tiles whose
+  bounding boxes meet it.
+
+  The cell size tracks the typical (mean) tile size: whenever the mean size
+  of the indexed tiles drifts away from the cell size by more than a factor
+  of two, e.g. because tiles of another scale were added, the grid is rebuilt.'''
+
+  # How far the typical tile size may drift from the cell size
+  # before the grid is rebuilt
+  _max_drift = 2.0
+
+  def __init__(self):
+    self._bboxes = {}
+    self._cells = defaultdict(set)
+    self._cell_size = None
+    self._size_sum = 0.0
+    # The range of cells (min_ix, min_iy, max_ix, max_iy) that have held
+    # tiles since the grid was built; it isn't shrunk when tiles are removed,
+    # so it may be larger than the range of the occupied cells
+    self._extent = None
+
+  def __len__(self):
+    return len(self._bboxes)
+
+  def __contains__(self, t):
+    return t in self._bboxes
+
+  def cell_size(self):
+    return self._cell_size
+
+  def _cell_range(self, fb):
+    inv = 1.0 / self._cell_size
+    return (floor(fb[0] * inv), floor(fb[1] * inv), floor(fb[2] * inv), floor(fb[3] * inv))
+
+  def _add_to_cells(self, t, fb):
+    cells = self._cells
+    min_ix, min_iy, max_ix, max_iy = self._cell_range(fb)
+    for ix in range(min_ix, max_ix+1):
+      for iy in range(min_iy, max_iy+1):
+        cells[(ix,iy)].add(t)
+    e = self._extent
+    if e is None:
+      self._extent = [min_ix, min_iy, max_ix, max_iy]
+    else:
+      e[0], e[1] = min(e[0], min_ix), min(e[1], min_iy)
+      e[2], e[3] = max(e[2], max_ix), max(e[3], max_iy)
+
+  def _rebuild(self, cell_size):
+    self._cell_size = cell_size
+    self._cells = defaultdict(set)
+    self._extent = None
+    for t, fb in self._bboxes.items():
+      self._add_to_cells(t, fb)
+
+  def _typical_size(self):
+    return self._size_sum / len(self._bboxes)
+
+  def insert(self, t):
+    '''Adds t to the index.'''
+    if t in self._bboxes:
+      return
+    fb = float_bbox(t)
+    self._bboxes[t] = fb
+    self._size_sum += _bbox_size(fb)
+
+    typical = self._typical_size()
+    if self._cell_size is None or not (
+      self._cell_size / self._max_drift <= typical <= self._cell_size * self._max_drift
+    ):
+      self._rebuild(typical if typical > 0 else 1.0)
+    else:
+      self._add_to_cells(t, fb)
+
+  def remove(self, t):
+    '''Removes t from the index, if present.'''
+    fb = self._bboxes.pop(t, None)
+    if fb is None:
+      return
+    self._size_sum -= _bbox_size(fb)
+
+    cells = self._cells
+    min_ix, min_iy, max_ix, max_iy = self._cell_range(fb)
+    for ix in range(min_ix, max_ix+1):
+      for iy in range(min_iy, max_iy+1):
+        cell = cells[(ix,iy)]
+        cell.discard(t)
+        if not cell:
+          del cells[(ix,iy)]
+
+    if len(self._bboxes) == 0:
+      self._cell_size = None
+      self._size_sum = 0.0
+      self._extent = None
+
+  def query(self, fb):
+    '''Returns the set of tiles whose bounding boxes might overlap the
+    floating-point bounding box fb = (min_x, min_y, max_x, max_y).'''
+    if self._cell_size is None:
+      return set()
+    min_ix, min_iy, max_ix, max_iy = self._cell_range(fb)
+    n_cells = (max_ix - min_ix + 1) * (max_iy - min_iy + 1)
+
+    if n_cells > len(self._cells):
+      # Big query; scanning the occupied cells is cheaper
+      found = set()
+      for (ix, iy), cell in self._cells.items():
+        if min_ix <= ix <= max_ix and min_iy <= iy <= max_iy:
+          found |= cell
+      return found
+
+    found = set()
+    cells = self._cells
+    for ix in range(min_ix, max_ix+1):
+      for iy in range(min_iy, max_iy+1):
+        cell = cells.get((ix,iy), None)
+        if cell is not None:
+          found |= cell
+    return found
+
+  def nearest(self, x, y, dist = None):
+    if self._cell_size is None:
+      return None
+    if dist is None:
+      bboxes = self._bboxes
+      dist = lambda t, x, y: bbox_distance(x, y, bboxes[t])
+
+    # Search rings of cells around the one containing (x, y), starting
+    # with the first ring that reaches the extent of the grid, until the
+    # next ring is farther away than the nearest object seen so far or
+    # covers the whole extent; once the rings have more cells than are
+    # occupied, it's faster to look through the occupied cells instead
+    cs, cells = self._cell_size, self._cells
+    cx, cy = floor(x / cs), floor(y / cs)
+    min_ix, min_iy, max_ix, max_iy = self._extent
+    min_r = max(min_ix - cx, cx - max_ix, min_iy - cy, cy - max_iy, 0)
+    max_r = max(cx - min_ix, max_ix - cx, cy - min_iy, max_iy - cy, 0)
+    best, best_d, seen = None, None, set()
+
+    def scan(ts):
+      nonlocal best, best_d
+      for t in ts:
+        if t in seen:
+          continue
+        seen.add(t)
+        d = dist(t, x, y)
+        if best is None or d < best_d:
+          best, best_d = t, d
+
+    for r in range(min_r, max_r + 1):
+      if best is not None and (r - 1) * cs > best_d:
+        break
+      if 8 * r > len(cells):
+        for cell in cells.values():
+          scan(cell)
+        break
+      ring = [(cx + i, cy + j) for i in range(-r, r+1) for j in ((-r, r) if r else (0,))]
+      ring += [(cx + i, cy + j) for i in ((-r, r) if r else ()) for j in range(-r+1, r)]
+      for key in ring:
+        scan(cells.get(key, ()))
+    return best
+
+class QuadtreeIndex(SpatialIndex):
+  '''A quadtree in which each object is stored at the smallest node whose
+  square contains its bounding box. The root grows as needed to cover
+  everything inserted, so no bounds need to be known in advance, and tiles
+  of very different sizes are each stored at an appropriate depth.'''
+
+  # Number of objects a node holds before it's split
+  _capacity = 8
+  _max_depth = 40
+
+  class _Node:
+    __slots__ = ('fb', 'depth', 'items', 'children')
+
+    def __init__(self, fb, depth):
+      # The node covers the square fb
+      self.fb, self.depth = fb, depth
+      self.items = {}
+      self.children = None
+
+    def contains(self, fb):
+      nfb = self.fb
+      return nfb[0] <= fb[0] and nfb[1] <= fb[1] and fb[2] <= nfb[2] and fb[3] <= nfb[3]
+
+  def __init__(self):
+    self._root = None
+    self._node_of = {}
+
+  def __len__(self):
+    return len(self._node_of)
+
+  def __contains__(self, t):
+    return t in self._node_of
+
+  def _grow(self, fb):
+    # Doubles the root, towards fb, until it contains fb; the old root
+    # becomes one of the new root's quadrants. (Coordinates are always
+    # derived from existing ones, so that each node's square is exactly
+    # within its parent's.)
+    root = self._root
+    if root.contains(fb):
+      return
+    while not root.contains(fb):
+      x0, y0, x1, y1 = root.fb
+      i, j = (1 if fb[0] < x0 else 0), (1 if fb[1] < y0 else 0)
+      xs = (x0 - (x1 - x0), x0, x1) if i else (x0, x1, x1 + (x1 - x0))
+      ys = (y0 - (y1 - y0), y0, y1) if j else (y0, y1, y1 + (y1 - y0))
+      new_root = self._Node((xs[0], ys[0], xs[2], ys[2]), 0)
+      new_root.children = [
+        root if (ci, cj) == (i, j) else self._Node((xs[ci], ys[cj], xs[ci+1], ys[cj+1]), 0)
+        for cj in (0, 1) for ci in (0, 1)
+      ]
+      root = new_root
+    self._root = root
+    self._renumber(root, 0)
+
+  def _renumber(self, node, depth):
+    node.depth = depth
+    for c in node.children or ():
+      self._renumber(c, depth + 1)
+
+  def _child_for(self, node, fb):
+    for c in node.children:
+      if c.contains(fb):
+        return c
+    return None
+
+  def _split(self, node):
+    x0, y0, x1, y1 = node.fb
+    xs, ys, depth = (x0, (x0 + x1) / 2, x1), (y0, (y0 + y1) / 2, y1), node.depth + 1
+    node.children = [self._Node((xs[i], ys[j], xs[i+1], ys[j+1]), depth)
+                     for j in (0, 1) for i in (0, 1)]
+    items, node.items = node.items, {}
+    for t, fb in items.items():
+      self._place(node, t, fb)
+
+  def _place(self, node, t, fb):
+    while node.children is not None:
+      child = self._child_for(node, fb)
+      if child is None:
+        break
+      node = child
+    node.items[t] = fb
+    self._node_of[t] = node
+    if node.children is None and len(node.items) > self._capacity and node.depth < self._max_depth:
+      self._split(node)
+
+  def insert(self, t):
+    if t in self._node_of:
+      return
+    fb = float_bbox(t)
+    if self._root is None:
+      size = max(_bbox_size(fb), 1e-9)
+      self._root = self._Node((fb[0], fb[1], fb[0] + size, fb[1] + size), 0)
+    self._grow(fb)
+    self._place(self._root, t, fb)
+
+  def remove(self, t):
+    node = self._node_of.pop(t, None)
+    if node is None:
+      return
+    del node.items[t]
+    if len(self._node_of) == 0:
+      self._root = None
+
+  def query(self, fb):
+    found = set()
+    if self._root is None:
+      return found
+    stack = [self._root]
+    while stack:
+      node = stack.pop()
+      for t, tfb in node.items.items():
+        if overlap(fb, tfb):
+          found.add(t)
+      if node.children is not None:
+        stack.extend(c for c in node.children if overlap(fb, c.fb))
+    return found
+
+  def nearest(self, x, y, dist = None):
+    if self._root is None:
+      return None
+    return _best_first(self._root, x, y, dist,
+      lambda node: node.items.items(), lambda node: node.children or ())
+
+class RTreeIndex(SpatialIndex):
+  '''An R-tree bulk-loaded with the Sort-Tile-Recursive (STR) algorithm,
+  which gives well-packed, barely-overlapping nodes.
+
+  Objects inserted after the tree was built go into an overflow
+  GridIndex, and removed objects are only forgotten, not taken out of the
+  tree; the tree is rebuilt once either of these grows to a fixed fraction
+  of it. So the tree is rebuilt at sizes growing geometrically, and
+  inserting tiles one at a time takes O(log n) amortized time each.
+  insert_many() adds everything before rebuilding once, so it's still the
+  faster way of filling the index.'''
+
+  # Maximum number of entries per node
+  _fanout = 16
+
+  # The fraction of the size of the tree that the overflow may grow to
+  # before the tree is rebuilt
+  _max_overflow = 0.25
+
+  class _Node:
+    __slots__ = ('fb', 'entries', 'is_leaf')
+
+    def __init__(self, entries, is_leaf):
+      # entries are (fb, object) pairs for leaves, and nodes otherwise
+      self.entries, self.is_leaf = entries, is_leaf
+      self.fb = _union(e[0] for e in entries) if is_leaf else _union(n.fb for n in entries)
+
+  def __init__(self):
+    self._bboxes = {}
+    self._root = None
+    self._in_tree = set()
+    self._overflow = GridIndex()
+
+  def __len__(self):
+    return len(self._bboxes)
+
+  def __contains__(self, t):
+    return t in self._bboxes
+
+  def _str_pack(self, items, key_fb):
+    # Groups items into runs of at most _fanout, tiled by x then y
+    m = self._fanout
+    n_slices = max(1, ceil(sqrt(ceil(len(items) / m))))
+    slice_len = ceil(len(items) / n_slices)
+    items = sorted(items, key = lambda i: key_fb(i)[0] + key_fb(i)[2])
+    groups = []
+    for s in range(0, len(items), slice_len):
+      sl = sorted(items[s:s+slice_len], key = lambda i: key_fb(i)[1] + key_fb(i)[3])
+      groups.extend(sl[k:k+m] for k in range(0, len(sl), m))
+    return groups
+
+  def _rebuild(self):
+    self._in_tree = set(self._bboxes)
+    self._overflow = GridIndex()
+    if len(self._bboxes) == 0:
+      self._root = None
+      return
+    nodes = [self._Node(g, True) for g in
+             self._str_pack([(fb, t) for t, fb in self._bboxes.items()], lambda e: e[0])]
+    while len(nodes) > 1:
+      nodes = [self._Node(g, False) for g in self._str_pack(nodes, lambda n: n.fb)]
+    self._root = nodes[0]
+
+  def _needs_rebuild(self):
+    n_tree = len(self._in_tree)
+    n_dead = n_tree - (len(self._bboxes) - len(self._overflow))
+    return len(self._overflow) > max(32, self._max_overflow * n_tree) or n_dead > n_tree // 2
+
+  def insert(self, t):
+    if t in self._bboxes:
+      return
+    fb = float_bbox(t)
+    self._bboxes[t] = fb
+    if t not in self._in_tree:
+      self._overflow.insert(t)
+      if self._needs_rebuild():
+        self._rebuild()
+
+  def insert_many(self, ts):
+    for t in ts:
+      if t not in self._bboxes:
+        self._bboxes[t] = float_bbox(t)
+    self._rebuild()
+
+  def remove(self, t):
+    if self._bboxes.pop(t, None) is None:
+      return
+    self._overflow.remove(t)
+    if self._needs_rebuild():
+      self._rebuild()
+
+  def query(self, fb):
+    bboxes = self._bboxes
+    found = {t for t in self._overflow.query(fb) if overlap(fb, bboxes[t])}
+    if self._root is None or not overlap(fb, self._root.fb):
+      return found
+    stack = [self._root]
+    while stack:
+      node = stack.pop()
+      if node.is_leaf:
+        found.update(t for tfb, t in node.entries if t in bboxes and overlap(fb, tfb))
+      else:
+        stack.extend(c for c in node.entries if overlap(fb, c.fb))
+    return found
+
+  def nearest(self, x, y, dist = None):
+    if len(self._bboxes) == 0:
+      return None
+    bboxes = self._bboxes
+    best = _best_first(self._root, x, y, dist,
+      lambda node: ((t, tfb) for tfb, t in node.entries if t in bboxes) if node.is_leaf else (),
+      lambda node: () if node.is_leaf else node.entries) if self._root is not None else None
+    if len(self._overflow) == 0:
+      return best
+
+    if dist is None:
+      dist = lambda t, x, y: bbox_distance(x, y, bboxes[t])
+    candidates = [self._overflow.nearest(x, y, dist)] + ([best] if best is not None else [])
+    return min(candidates, key = lambda t: dist(t, x, y))
+
+def _best_first(root, x, y, dist, items_of, children_of):
+  # Best-first nearest-neighbor search over a tree of nodes with fb
+  # attributes: items_of(node) gives the (object, fb) pairs stored at a node
+  # and children_of(node) the child nodes. Objects are queued by the distance
+  # to their bounding boxes, and only evaluated with dist when they come up.
+  if dist is None:
+    dist = lambda t, x, y: None
+  heap, counter = [(bbox_distance(x, y, root.fb), 0, 0, root)], 1
+  best, best_d = None, None
+  while heap:
+    d, _, kind, item = heapq.heappop(heap)
+    if best is not None and d >= best_d:
+      break
+    if kind == 1:
+      # An object, with d the distance to its bbox
+      real_d = dist(item, x, y)
+      real_d = d if real_d is None else real_d
+      if best is None or real_d < best_d:
+        best, best_d = item, real_d
+      continue
+    for t, tfb in items_of(item):
+      heapq.heappush(heap, (bbox_distance(x, y, tfb), counter, 1, t))
+      counter += 1
+    for c in children_of(item):
+      heapq.heappush(heap, (bbox_distance(x, y, c.fb), counter, 0, c))
+      counter += 1
+  return best
+
+class PointGrid:
+  '''A set of keyed points, given by float coordinates, in a uniform grid of
+  square cells, supporting nearest-neighbor searches while points are
+  added and removed. It works best when cell_size is about the typical
+  distance between neighboring points.'''
+
+  def __init__(self, cell_size):
+    if not cell_size > 0:
+      raise ValueError
+    self._cell_size = float(cell_size)
+    self._cells = {}
+    self._where = {}
+
+  def __len__(self):
+    return len(self._where)
+
+  def __contains__(self, key):
+    return key in self._where
+
+  def _cell(self, x, y):
+    cs = self._cell_size
+    return (floor(x / cs), floor(y / cs))
+
+  def insert(self, key, x, y):
+    '''Adds the point (x, y) with the given key, replacing any point
+    with that key already present.'''
+    self.remove(key)
+    cell = self._cell(x, y)
+    self._cells.setdefault(cell, {})[key] = (x, y)
+    self._where[key] = cell
+
+  def remove(self, key):
+    '''Removes the point with the given key, if present.'''
+    cell = self._where.pop(key, None)
+    if cell is None:
+      return
+    points = self._cells[cell]
+    del points[key]
+    if not points:
+      del self._cells[cell]
+
+  def _scan(self, cells, x, y, found):
+    # Calls found(key, distance) for each point in the given cells
+    all_cells = self._cells
+    for cell in cells:
+      for key, (px, py) in all_cells.get(cell, {}).items():
+        found(key, hypot(px - x, py - y))
+
+  def nearest(self, x, y):
+    '''Returns (key, distance) for the point nearest to (x, y), or None if
+    there are no points.'''
+    if not self._where:
+      return None
+    best = [None, None]
+    def found(key, d):
+      if best[0] is None or d < best[1]:
+        best[0], best[1] = key, d
+
+    # Search rings of cells around the one containing (x, y), until the
+    # next ring is farther away than the nearest point seen so far; once
+    # the rings get bigger than the number of occupied cells, it's faster
+    # to look through the occupied cells instead
+    cs = self._cell_size
+    cx, cy = self._cell(x, y)
+    r = 0
+    while True:
+      if best[0] is not None and (r - 1) * cs > best[1]:
+        break
+      if (2*r + 1) * (2*r + 1) > len(self._cells):
+        self._scan(list(self._cells), x, y, found)
+        break
+      ring = [(cx + i, cy + j) for i in range(-r, r+1) for j in ((-r, r) if r else (0,))]
+      ring += [(cx + i, cy + j) for i in ((-r, r) if r else ()) for j in range(-r+1, r)]
+      self._scan(ring, x, y, found)
+      r += 1
+    return tuple(best)
+
+  def within(self, x, y, r):
+    '''Returns a list of the keys of the points at distance at most r
+    from (x, y).'''
+    min_ix, min_iy = self._cell(x - r, y - r)
+    max_ix, max_iy = self._cell(x + r, y + r)
+    if (max_ix - min_ix + 1) * (max_iy - min_iy + 1) > len(self._cells):
+      cells = [c for c in self._cells if min_ix <= c[0] <= max_ix and min_iy <= c[1] <= max_iy]
+    else:
+      cells = [(ix, iy) for ix in range(min_ix, max_ix+1) for iy in range(min_iy, max_iy+1)]
+    keys = []
+    self._scan(cells, x, y, lambda key, d: keys.append(key) if d <= r else None)
+    return keys
@@ -0,0 +1,143 @@
+# MIT-licensed; see LICENSE for details
+
+import random
+from math import hypot
+from unittest import TestCase
+import tile_index as ti
+import penrose as p
+from pen_num import phi
+from fractions import Fraction as Q
+
+def _overlaps(fb1, fb2):
+  return fb1[0] <= fb2[2] and fb2[0] <= fb1[2] and fb1[1] <= fb2[3] and fb2[1] <= fb1[3]
+
+def _tiles():
+  tiles = [p.KiteTile().scale(phi).rotate(i) for i in [-1, 3, 7, 11, 15]]
+  return [nt for t in tiles for nt in t.decompose('to-A')]
+
+class TestGridIndex(TestCase):
+  def test_float_bbox(self):
+    t = p.KiteTile().scale(phi).rotate(3)
+    bb, fb = t.bbox(), ti.float_bbox(t)
+    self.assertTrue(Q(fb[0]) < bb.min_x and Q(fb[1]) < bb.min_y)
+    self.assertTrue(Q(fb[2]) > bb.max_x and Q(fb[3]) > bb.max_y)
+
+  def test_query_is_superset(self):
+    tiles = _tiles()
+    index = ti.GridIndex()
+    for t in tiles:
+      index.insert(t)
+    self.assertEqual(len(index), len(tiles))
+    for q in tiles:
+      fb = ti.float_bbox(q)
+      expected = {t for t in tiles if _overlaps(fb, ti.float_bbox(t))}
+      self.assertTrue(expected <= index.query(fb))
+    everything = (-100.0, -100.0, 100.0, 100.0)
+    self.assertEqual(index.query(everything), set(tiles))
+
+  def test_remove(self):
+    tiles = _tiles()
+    index = ti.GridIndex()
+    for t in tiles:
+      index.insert(t)
+    for t in tiles[1:]:
+      index.remove(t)
+    self.assertEqual(len(index), 1)
+    self.assertTrue(tiles[0] in index and tiles[1] not in index)
+    self.assertEqual(index.query(ti.float_bbox(tiles[1])) - {tiles[0]}, set())
+    index.remove(tiles[0])
+    self.assertEqual(len(index), 0)
+    self.assertEqual(index.cell_size(), None)
+
+  def test_cell_size_adapts(self):
+    index = ti.GridIndex()
+    big = [p.KiteTile().scale(phi * phi * phi * phi).rotate(i) for i in [-1, 3, 7, 11, 15]]
+    for t in big:
+      index.insert(t)
+    big_cell = index.cell_size()
+
+    small = [p.KiteTile().rotate(i).translate(30 + k, 0) for k in range(40) for i in [3]]
+    for t in small:
+      index.insert(t)
+    self.assertTrue(index.cell_size() < big_cell / 2)
+    for t in big + small:
+      self.assertTrue(t in index.query(ti.float_bbox(t)))
+
+  def test_nearest_after_removals(self):
+    tiles = _tiles()
+    index = ti.GridIndex()
+    for t in tiles:
+      index.insert(t)
+    for t in tiles[::2]:
+      index.remove(t)
+    left = tiles[1::2]
+    for x, y in [(0.0, 0.0), (0.3, -0.7), (50.0, 20.0), (-80.0, -3.0)]:
+      d = min(ti.bbox_distance(x, y, ti.float_bbox(t)) for t in left)
+      self.assertEqual(ti.bbox_distance(x, y, ti.float_bbox(index.nearest(x, y))), d)
+
+  def test_nearest_far_away(self):
+    # Points far outside the tiles are found without searching every ring
+    # of cells out to them
+    tiles = _tiles()
+    index = ti.GridIndex()
+    for t in tiles:
+      index.insert(t)
+    for x, y in [(3000.0, 0.0), (-1e6, 5e5), (2.5, -1e7)]:
+      d = min(ti.bbox_distance(x, y, ti.float_bbox(t)) for t in tiles)
+      self.assertEqual(ti.bbox_distance(x, y, ti.float_bbox(index.nearest(x, y))), d)
+
+class TestRTreeIndex(TestCase):
+  def test_incremental(self):
+    # Tiles inserted and removed one at a time, partly held in the overflow
+    # grid, are found just as those in the tree are
+    tiles = _tiles()
+    for i in range(4):
+      tiles = [t for u in tiles for t in u.decompose('half-deflation')]
+    index, present = ti.RTreeIndex(), []
+    for k, t in enumerate(tiles):
+      index.insert(t)
+      present.append(t)
+      if k % 5 == 4:
+        index.remove(present.pop(0))
+      fb = ti.float_bbox(t)
+      expected = {u for u in present if _overlaps(fb, ti.float_bbox(u))}
+      found = index.query(fb)
+      self.assertTrue(expected <= found <= set(present))
+    self.assertEqual(len(index), len(present))
+    for x, y in [(0.0, 0.0), (0.3, -0.7), (50.0, 20.0)]:
+      d = min(ti.bbox_distance(x, y, ti.float_bbox(t)) for t in present)
+      self.assertEqual(ti.bbox_distance(x, y, ti.float_bbox(index.nearest(x, y))), d)
+
+class TestPointGrid(TestCase):
+  def test_against_brute_force(self):
+    rng = random.Random(42)
+    for cell_size in [0.01, 1.0, 50.0]:
+      grid, points = ti.PointGrid(cell_size), {}
+      for k in range(500):
+        points[k] = (rng.gauss(0, 20), rng.gauss(0, 5))
+        grid.insert(k, *points[k])
+        if k % 3 == 0:
+          gone = rng.choice(sorted(points))
+          grid.remove(gone)
+          del points[gone]
+      self.assertEqual(len(grid), len(points))
+      for i in range(50):
+        x, y = rng.uniform(-80, 80), rng.uniform(-80, 80)
+        dists = { k: hypot(px - x, py - y) for k, (px, py) in points.items() }
+        key, d = grid.nearest(x, y)
+        self.assertEqual(d, min(dists.values()))
+        self.assertEqual(dists[key], d)
+        self.assertEqual(set(grid.within(x, y, 5)), { k for k, dk in dists.items() if dk <= 5 })
+
+  def test_insert_remove(self):
+    grid = ti.PointGrid(1)
+    self.assertEqual(grid.nearest(0, 0), None)
+    grid.insert('a', 0.5, 0.5)
+    grid.insert('a', 10.5, 0.5)
+    self.assertEqual(len(grid), 1)
+    self.assertEqual(grid.nearest(0.5, 0.5), ('a', 10.0))
+    grid.remove('a')
+    grid.remove('a')
+    self.assertTrue('a' not in grid)
+    self.assertEqual(grid.nearest(0, 0), None)
+    self.assertRaises(ValueError, ti.PointGrid, 0)
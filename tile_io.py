@@ -0,0 +1,273 @@
+'''Saving tilings to, and loading them from, a compact binary format'''
+
+# MIT-licensed; see LICENSE for details
+
+# The format is:
+#  * the magic bytes b'PENTILIO',
+#  * a byte with the format version (_version),
+#  * a byte of flags; _flag_zlib means the rest of the file is
+#    zlib-compressed,
+#  * a byte with the order of the tiling's rotational symmetry
+#    (see tile_manager.rotational_symmetry), or 0 if none was declared,
+#  * a record for each tile: the length of the rest of the record in bytes,
+#    then the tile's type code (see penrose.tile_types), the denominator
+#    and the 16 coefficients of its transform (see
+#    tile_store.encode_transform), and
+#  * an empty record (a length of 0), followed by the number of tiles.
+# All of the numbers after the header bytes are varints: unsigned LEB128,
+# with signed values (the coefficients) zigzag-encoded first.
+#
+# As each tile is written exactly, loading a tiling doesn't need to check
+# that the tiles fit together again, as long as the file was written from
+# a TileManager (or from something built from one by decomposition).
+
+import io, zlib
+import penrose as p
+from tile_manager import TileManager, rotational_symmetry
+from tile_store import TileStore, MappedTileStore, encode_transform, decode_transform
+
+_magic = b'PENTILIO'
+_version = 1
+_flag_zlib = 1
+
+# Size of the chunks to read files in
+_chunk_size = 1 << 16
+
+def _varint(n, out):
+  # Appends the unsigned integer n to the bytearray out
+  while n >= 0x80:
+    out.append((n & 0x7f) | 0x80)
+    n >>= 7
+  out.append(n)
+
+def _zigzag(n):
+  return 2*n if n >= 0 else -2*n - 1
+
+def _unzigzag(n):
+  return n >> 1 if n & 1 == 0 else -((n + 1) >> 1)
+
+def _symmetry_order(tiling):
+  symmetry = getattr(tiling, 'symmetry', None)
+  symmetry = symmetry() if symmetry is not None else None
+  return 0 if symmetry is None else len(symmetry)
+
+def _rows(tiles):
+  # Yields (type code, coefficients, den) for the tiles in a TileManager,
+  # a tile store or an iterable of tiles
+  if isinstance(tiles, (TileStore, MappedTileStore)):
+    yield from tiles.rows()
+    return
+  if isinstance(tiles, TileManager):
+    tiles = tiles.iter_tiles(order = 'hilbert')
+  for t in tiles:
+    code = p.tile_type_codes.get(type(t), None)
+    if code is None:
+      raise TypeError
+    yield (code, *encode_transform(t.curr_transform()))
+
+class TilingWriter:
+  '''Writes tiles to a binary file object one at a time, so a tiling never
+  needs to be held in memory in its entirety to save it. Use as a context
+  manager, or call close() (which doesn't close the file object) at the end.
+
+  If symmetry is given, it's the order of the rotational symmetry that
+  the tiling will be declared to have when it's loaded.'''
+
+  def __init__(self, f, compress = False, symmetry = 0):
+    if not isinstance(symmetry, int):
+      raise TypeError
+    if not 0 <= symmetry <= 20:
+      raise ValueError
+    self._f = f
+    self._count = 0
+    self._compressor = zlib.compressobj() if compress else None
+    f.write(_magic + bytes((_version, _flag_zlib if compress else 0, symmetry)))
+
+  def _write(self, data):
+    if self._compressor is not None:
+      data = self._compressor.compress(data)
+    self._f.write(data)
+
+  def write_row(self, code, xf, den):
+    '''Writes a tile given as its type code and encoded transform.'''
+    body = bytearray()
+    _varint(code, body)
+    _varint(den, body)
+    for x in xf:
+      _varint(_zigzag(x), body)
+    record = bytearray()
+    _varint(len(body), record)
+    record += body
+    self._write(bytes(record))
+    self._count += 1
+
+  def write(self, t):
+    '''Writes the tile t.'''
+    for row in _rows((t,)):
+      self.write_row(*row)
+
+  def write_all(self, tiles):
+    '''Writes all of tiles: a TileManager, TileStore, MappedTileStore or
+    iterable of tiles.'''
+    for row in _rows(tiles):
+      self.write_row(*row)
+
+  def close(self):
+    trailer = bytearray()
+    _varint(0, trailer)
+    _varint(self._count, trailer)
+    self._write(bytes(trailer))
+    if self._compressor is not None:
+      self._f.write(self._compressor.flush())
+      self._compressor = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is None:
+      self.close()
+
+class _Reader:
+  # Reads varints from a binary file object, decompressing if needed
+
+  def __init__(self, f, decompress):
+    self._f = f
+    self._decompressor = zlib.decompressobj() if decompress else None
+    self._buf, self._pos = b'', 0
+
+  def _fill(self, n):
+    # Makes sure at least n bytes are buffered past the current position,
+    # returning False at the end of the file
+    while len(self._buf) - self._pos < n:
+      raw = self._f.read(_chunk_size)
+      data = raw
+      if self._decompressor is not None:
+        try:
+          data = self._decompressor.decompress(raw) if raw else self._decompressor.flush()
+        except zlib.error as e:
+          raise ValueError('corrupt tiling file') from e
+      if not raw and not data:
+        return False
+      self._buf = self._buf[self._pos:] + data
+      self._pos = 0
+    return True
+
+  def varint(self):
+    n, shift = 0, 0
+    while True:
+      if not self._fill(1):
+        raise ValueError('truncated tiling file')
+      b = self._buf[self._pos]
+      self._pos += 1
+      n |= (b & 0x7f) << shift
+      if b < 0x80:
+        return n
+      shift += 7
+
+  def record(self):
+    # Returns the next record's body as a memoryview, or None at the end
+    n = self.varint()
+    if n == 0:
+      return None
+    if not self._fill(n):
+      raise ValueError('truncated tiling file')
+    body = memoryview(self._buf)[self._pos:self._pos+n]
+    self._pos += n
+    return body
+
+def _parse_record(body):
+  values, n, shift = [], 0, 0
+  for b in body:
+    n |= (b & 0x7f) << shift
+    if b < 0x80:
+      values.append(n)
+      n, shift = 0, 0
+    else:
+      shift += 7
+  if len(values) != 18 or values[0] >= len(p.tile_types) or values[1] == 0:
+    raise ValueError('corrupt tiling file')
+  return (values[0], [_unzigzag(x) for x in values[2:]], values[1])
+
+def _read_header(f):
+  header = f.read(len(_magic) + 3)
+  if len(header) != len(_magic) + 3 or header[:len(_magic)] != _magic:
+    raise ValueError('not a tiling file')
+  version, flags, symmetry = header[len(_magic):]
+  if version != _version or flags & ~_flag_zlib:
+    raise ValueError('unsupported tiling file version')
+  return (bool(flags & _flag_zlib), symmetry)
+
+def iter_rows(f):
+  '''Reads a tiling from the binary file object f, yielding each of its
+  tiles as a tuple (type code, coefficients, den), as taken by
+  TileStore.append_row(). Raises ValueError if the file is malformed.'''
+  compressed, _ = _read_header(f)
+  reader, count = _Reader(f, compressed), 0
+  while True:
+    body = reader.record()
+    if body is None:
+      break
+    yield _parse_record(body)
+    count += 1
+  if reader.varint() != count:
+    raise ValueError('corrupt tiling file')
+
+def iter_tiles(f):
+  '''Reads a tiling from the binary file object f, yielding its tiles.'''
+  for code, xf, den in iter_rows(f):
+    yield p.tile_types[code](decode_transform(xf, den))
+
+def write_tiling(f, tiling, compress = False):
+  '''Writes tiling (a TileManager, TileStore, MappedTileStore or iterable
+  of tiles) to the binary file object f, compressing it with zlib if
+  compress is true; a TileManager's declared symmetry is saved as well.
+  The tiles are written as they are read, without being gathered first.'''
+  with TilingWriter(f, compress, _symmetry_order(tiling)) as w:
+    w.write_all(tiling)
+
+def read_tiling(f, **kwargs):
+  '''Reads a tiling from the binary file object f into a new TileManager,
+  adding the tiles without checks; keyword arguments are passed on to
+  TileManager(), and the symmetry saved with the tiling is used unless one
+  is given.'''
+  start = f.tell() if f.seekable() else None
+  if 'symmetry' not in kwargs:
+    if start is None:
+      raise ValueError('the symmetry must be given for unseekable files')
+    _, order = _read_header(f)
+    f.seek(start)
+    kwargs['symmetry'] = rotational_symmetry(order) if order else None
+  tm = TileManager(**kwargs)
+  tm.add_tiles(iter_tiles(f), trusted = True)
+  return tm
+
+def read_store(f):
+  '''Reads a tiling from the binary file object f into a new TileStore,
+  without creating tile objects.'''
+  store = TileStore()
+  for row in iter_rows(f):
+    store.append_row(*row)
+  return store
+
+def save(path, tiling, compress = False):
+  '''Writes tiling to a new file at path; see write_tiling().'''
+  with open(path, 'wb') as f:
+    write_tiling(f, tiling, compress)
+
+def load(path, **kwargs):
+  '''Reads a tiling from the file at path into a TileManager; see
+  read_tiling().'''
+  with open(path, 'rb') as f:
+    return read_tiling(f, **kwargs)
+
+def dumps(tiling, compress = False):
+  '''Returns tiling, written out as bytes; see write_tiling().'''
+  f = io.BytesIO()
+  write_tiling(f, tiling, compress)
+  return f.getvalue()
+
+def loads(data, **kwargs):
+  '''Reads a tiling from the bytes data into a TileManager; see
+  read_tiling().'''
+  return read_tiling(io.BytesIO(data), **kwargs)
@@ -0,0 +1,70 @@
+# MIT-licensed; see LICENSE for details
+
+import io, os, tempfile
+from unittest import TestCase
+import tile_io
+import tile_manager as tmgr
+from tile_manager import TileManager
+from tile_store import TileStore
+import penrose as p
+from pen_num import phi
+
+def _sun():
+  tm = TileManager(tmgr.rotational_symmetry(5))
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(p.KiteTile().scale(phi).rotate(i))
+  return tm.decompose('to-A').decompose('half-deflation')
+
+class TestTileIO(TestCase):
+  def test_round_trip(self):
+    tm = _sun()
+    for compress in [False, True]:
+      with self.subTest(compress = compress):
+        data = tile_io.dumps(tm, compress)
+        loaded = tile_io.loads(data)
+        self.assertEqual(set(loaded.get_tiles()), set(tm.get_tiles()))
+        self.assertEqual(len(loaded.symmetry()), 5)
+        self.assertIs(tile_io.loads(data, symmetry = None).symmetry(), None)
+        self.assertEqual(list(tile_io.iter_tiles(io.BytesIO(data))), tm.curve_order())
+    self.assertLess(len(tile_io.dumps(tm, True)), len(tile_io.dumps(tm)))
+
+  def test_stores(self):
+    store = TileStore(_sun().get_tiles()).decompose('deflation')
+    data = tile_io.dumps(store)
+    self.assertEqual(list(tile_io.read_store(io.BytesIO(data)).rows()), list(store.rows()))
+    self.assertEqual(set(tile_io.loads(data).get_tiles()), set(store))
+
+  def test_streaming_writer(self):
+    tiles = _sun().get_tiles()
+    f = io.BytesIO()
+    with tile_io.TilingWriter(f, compress = True) as w:
+      for t in tiles:
+        w.write(t)
+    self.assertEqual(list(tile_io.iter_tiles(io.BytesIO(f.getvalue()))), tiles)
+    self.assertRaises(TypeError, tile_io.dumps, [p.KiteTile().vertices()])
+
+  def test_files(self):
+    tm = _sun()
+    with tempfile.TemporaryDirectory() as d:
+      path = os.path.join(d, 'tiling')
+      tile_io.save(path, tm, compress = True)
+      self.assertEqual(set(tile_io.load(path).get_tiles()), set(tm.get_tiles()))
+
+  def test_malformed(self):
+    data = tile_io.dumps(_sun())
+    self.assertRaises(ValueError, tile_io.loads, b'PENTILES' + data[8:])
+    self.assertRaises(ValueError, tile_io.loads, data[:8] + b'\x02' + data[9:])
+    self.assertRaises(ValueError, tile_io.loads, data[:-30])
+    self.assertRaises(ValueError, tile_io.loads, data[:-1] + b'\x05')
+    compressed = tile_io.dumps(_sun(), True)
+    self.assertRaises(ValueError, tile_io.loads, compressed[:len(compressed) // 2])
+    # A corrupt compressed stream
+    self.assertRaises(ValueError, tile_io.loads, compressed[:12] + b'\x00' + compressed[13:])
+    middle = len(compressed) // 2
+    flipped = compressed[:middle] + bytes(b ^ 0xff for b in compressed[middle:middle+8]) + compressed[middle+8:]
+    self.assertRaises(ValueError, tile_io.loads, flipped)
+    # A tile with a denominator of 0
+    f = io.BytesIO()
+    with tile_io.TilingWriter(f) as w:
+      w.write_row(0, [1] + [0] * 15, 0)
+    self.assertRaises(ValueError, tile_io.loads, f.getvalue())
@@ -1,8 +1,9 @@
 # MIT-licensed; see LICENSE for details
 
-import penrose as p, pen_num as pn, pen_geom as pg
+import penrose as p, pen_geom as pg, tile_index
+from pen_geom import Vector
 from collections import defaultdict
-from math import floor, ceil
+from array import array
 
 class _TileAlreadyPresent:
   def __str__(self):
@@ -13,19 +14,102 @@ class _TileAlreadyPresent:
 
 TileAlreadyPresent = _TileAlreadyPresent()
 
+def rotational_symmetry(n):
+  '''Returns the group of the n rotations about the origin by multiples
+  of 360/n degrees, as a tuple of AffineTransforms starting with the
+  identity; n must divide 20.'''
+  if not isinstance(n, int):
+    raise TypeError
+  if n < 1 or 20 % n != 0:
+    raise ValueError
+  return tuple(pg.rotation(k * (20 // n)) for k in range(n))
+
+def _in_sector(s, n):
+  # Whether the non-zero Vector s is at an angle in [0, 360/n) degrees
+  if n == 1:
+    return True
+  in_upper_half = s.y.sgn() > 0 or (s.y.sgn() == 0 and s.x.sgn() > 0)
+  if n == 2:
+    return in_upper_half
+  return in_upper_half and (Vector(1, 0).rotate(20 // n) ^ s).sgn() < 0
+
+def _edge_key(pt1, pt2):
+  # Key for the undirected edge between pt1 and pt2
+  return frozenset((pt1, pt2))
+
+def _is_convex(t):
+  return len(t.convex_decomposition()) == 1
+
+def _ccw_before(ref, d1, d2):
+  # Whether the angle CCW from Vector ref to Vector d1 is less than that
+  # to d2, angles being taken in [0, 360) degrees
+  def half(d):
+    c = (ref ^ d).sgn()
+    return 0 if c > 0 or (c == 0 and (ref | d).sgn() > 0) else 1
+  h1, h2 = half(d1), half(d2)
+  if h1 != h2:
+    return h1 < h2
+  return (d1 ^ d2).sgn() > 0
+
+def _cones_disjoint(tv, k, uv, m):
+  # A convex polygon lies within the cone formed by the two edges at any of
+  # its vertices. So, convex tiles with vertices tv and uv, where tv[k] and
+  # uv[m] are the same point, overlap if and only if their cones at that
+  # point do. Returns whether the interiors of the cones are disjoint, without
+  # the cones' edges touching along a ray (which would mean that edges of the
+  # tiles partially overlap).
+  apex = tv[k]
+  t_out, t_in = tv[(k+1)%len(tv)] - apex, tv[k-1] - apex
+  u_out, u_in = uv[(m+1)%len(uv)] - apex, uv[m-1] - apex
+  # The interior of t's cone is swept going CCW from t_out to t_in, so
+  # u's cone has to fit strictly within the sweep from t_in to t_out:
+  return _ccw_before(t_in, t_in, u_out) and \
+         _ccw_before(t_in, u_out, u_in) and \
+         _ccw_before(t_in, u_in, t_out)
+
+def _float_distance(t, x, y):
+  return tile_index.polygon_distance(x, y, [(float(v.x), float(v.y)) for v in t.vertices()])
+
 class TileManager:
-  def __init__(self):
-    self._scale_factor = None
+  def __init__(self, symmetry = None, index = None):
+    '''If symmetry is given, it must be a rotation group as returned
+    by rotational_symmetry() that leaves the tiling unchanged; decompose()
+    then only decomposes one sector of the tiling and fills in the rest
+    by rotating the results.
+
+    index selects the spatial index used to find nearby tiles: a
+    tile_index.SpatialIndex subclass, such as GridIndex (the default),
+    QuadtreeIndex or RTreeIndex. The tiling managers returned by transform()
+    and decompose() use the same kind of index.'''
+    if symmetry is not None:
+      symmetry = tuple(symmetry)
+      group = rotational_symmetry(len(symmetry))
+      if not all(any(r == g for r in symmetry) for g in group):
+        raise ValueError
+      symmetry = group
+    if index is None:
+      index = tile_index.GridIndex
+    elif not (isinstance(index, type) and issubclass(index, tile_index.SpatialIndex)):
+      raise TypeError
+    self._symmetry = symmetry
     self._tiles = set()
-    self._tiles_in_grid = defaultdict(set)
+    self._index_type = index
+    self._index = index()
     self._vertices = defaultdict(set)
-
-  def _grid_bounds(self, t):
-    bb = t.bbox()
-    sf = self._scale_factor
-    min_x, max_x = floor(bb.min_x * sf), floor(bb.max_x * sf)
-    min_y, max_y = floor(bb.min_y * sf), floor(bb.max_x * sf)
-    return (min_x, max_x, min_y, max_y)
+    # The bounding box of the tiles, as of the last call to bbox(), and
+    # the tiles added since then; _bbox is None if it needs recomputing
+    # from scratch.
+    self._bbox = None
+    self._bbox_pending = []
+    # Maps 'morton' and 'hilbert' to (keys, tiles): the tiles' positions
+    # along that space-filling curve, and the tiles sorted by them; cleared
+    # whenever tiles are added or removed.
+    self._curve_orders = {}
+    # Incremented whenever tiles are added or removed; see generation()
+    self._generation = 0
+    # Maps each undirected edge to a list of (tile, edge index) pairs;
+    # a valid tiling has at most two of these per edge.
+    self._edges = {}
 
   def can_add_tile(self, t):
     if not isinstance(t, p.TileWithMatchingRule):
@@ -35,18 +119,42 @@ class TileManager:
     if t in self._tiles:
       return TileAlreadyPresent
 
-    # Get all tiles in self with overlapping bboxes
-    nearby_tiles = set()
+    v, mr = t.vertices(), t.matching_rules()
+    n = len(v)
+    t_is_convex = _is_convex(t)
+    checked = set()
+
+    # Tiles sharing an entire edge with t are looked up in the edge index.
+    # The two tiles must traverse the edge in opposite directions (i.e.,
+    # be on opposite sides of it) with opposite matching rules; if both are
+    # convex, that's all there is to check.
+    for i in range(n):
+      entries = self._edges.get(_edge_key(v[i], v[(i+1)%n]), ())
+      for u, j in entries:
+        if len(entries) > 1 or u.vertices()[j] != v[(i+1)%n] or u.matching_rules()[j] != -mr[i]:
+          return False
+        if t_is_convex and _is_convex(u):
+          checked.add(u)
 
-    min_x, max_x, min_y, max_y = self._grid_bounds(t)
-    tig = self._tiles_in_grid
+    # Convex tiles sharing just a vertex with t are compared by
+    # the cones formed by their edges at that vertex.
+    if t_is_convex:
+      verts = self._vertices
+      for k in range(n):
+        for u in verts.get(v[k], ()):
+          if u in checked or not _is_convex(u):
+            continue
+          uv = u.vertices()
+          if not _cones_disjoint(v, k, uv, uv.index(v[k])):
+            return False
+          checked.add(u)
 
-    for ix in range(min_x, max_x+1):
-      for iy in range(min_y, max_y+1):
-        nearby_tiles |= tig[(ix,iy)]
+    # Get all other tiles in self with (possibly) overlapping bboxes
+    nearby_tiles = self._index.query(tile_index.float_bbox(t))
 
-    # Now, make sure the new tile is compatible with existing tiles:
-    for nt in nearby_tiles:
+    # Now, make sure the new tile is compatible with the rest of the
+    # existing tiles, using the full (and much slower) geometric test:
+    for nt in nearby_tiles - checked:
       if not t.matches(nt):
         return False
 
@@ -54,80 +162,282 @@ class TileManager:
     # to the tiling:
     return True
 
-  def try_add_tile(self, t):
-    x = self.can_add_tile(t)
+  def try_add_tile(self, t, trusted = False):
+    '''Adds t to the tiling if it's compatible with the tiles already present,
+    returning the result of can_add_tile(t).
+
+    If trusted is true, t is assumed to be compatible (e.g., it was produced
+    by a generator known to emit valid tilings), and only the check for
+    an identical tile already being present is performed.'''
+    if trusted:
+      if not isinstance(t, p.TileWithMatchingRule):
+        raise TypeError
+      x = TileAlreadyPresent if t in self._tiles else True
+    else:
+      x = self.can_add_tile(t)
     if x is True:
-      self._tiles.add(t)
+      self._register(t)
+      self._index.insert(t)
+    return x
 
-      # Set up our scale factor, if needed:
-      if self._scale_factor is None:
-        if isinstance(t, p.TransformableTile):
-          self._scale_factor = pn.approx_inv_sqrt(t.curr_transform().det())
-        else:
-          bb = t.bbox()
-          isqrt = pn.approx_inv_sqrt(min(bb.max_x - bb.min_x, bb.max_y - bb.min_y))
-          self._scale_factor = isqrt * isqrt
+  def _register(self, t):
+    # Adds t to everything but the spatial index
+    self._tiles.add(t)
+    self._bbox_pending.append(t)
+    self._curve_orders.clear()
+    self._generation += 1
 
-      min_x, max_x, min_y, max_y = self._grid_bounds(t)
-      tig = self._tiles_in_grid
+    verts = self._vertices
+    for v in t.vertices():
+      verts[v].add(t)
 
-      for ix in range(min_x, max_x+1):
-        for iy in range(min_y, max_y+1):
-          tig[(ix,iy)].add(t)
+    edges, v = self._edges, t.vertices()
+    for i in range(len(v)):
+      edges.setdefault(_edge_key(v[i], v[(i+1)%len(v)]), []).append((t, i))
 
-      verts = self._vertices
-      for v in t.vertices():
-        verts[v].add(t)
+  def add_tile(self, t, trusted = False):
+    if not self.try_add_tile(t, trusted):
+      raise ValueError
 
-    return x
+  def add_tiles(self, tiles, trusted = False):
+    if not trusted:
+      for t in tiles:
+        self.add_tile(t)
+      return
 
-  def add_tile(self, t):
-    if not self.try_add_tile(t):
-      raise ValueError
+    # Nothing needs to be looked up in the spatial index, so the
+    # tiles can be indexed all at once
+    added = []
+    for t in tiles:
+      if not isinstance(t, p.TileWithMatchingRule):
+        raise TypeError
+      if t not in self._tiles:
+        self._register(t)
+        added.append(t)
+    self._index.insert_many(added)
 
   def remove_tile(self, t):
     if t not in self._tiles:
       return
 
     self._tiles.remove(t)
+    self._index.remove(t)
+    self._curve_orders.clear()
+    self._generation += 1
 
-    min_x, max_x, min_y, max_y = self._grid_bounds(t)
-    tig = self._tiles_in_grid
-    for ix in range(min_x, max_x+1):
-      for iy in range(min_y, max_y+1):
-        tix[(ix,iy)].remove(t)
+    # The bounding box only needs recomputing if t was on its boundary
+    bb, tbb = self._bbox, t.bbox()
+    if bb is not None and (tbb.min_x == bb.min_x or tbb.min_y == bb.min_y or
+                           tbb.max_x == bb.max_x or tbb.max_y == bb.max_y):
+      self._bbox = None
+      self._bbox_pending = list(self._tiles)
 
     verts = self._vertices
     for v in t.vertices():
       verts[v].remove(t)
 
+    edges, v = self._edges, t.vertices()
+    for i in range(len(v)):
+      key = _edge_key(v[i], v[(i+1)%len(v)])
+      entries = [e for e in edges[key] if not (e[0] is t or e[0] == t)]
+      if entries:
+        edges[key] = entries
+      else:
+        del edges[key]
+
+  def generation(self):
+    '''Returns a number that changes whenever tiles are added or removed,
+    so that results computed from the tiles can be cached.'''
+    return self._generation
+
   def get_tiles(self):
     return list(self._tiles)
 
+  def count(self):
+    '''Returns the number of tiles.'''
+    return len(self._tiles)
+
+  def iter_tiles(self, region = None, order = None):
+    '''Returns an iterator over the tiles, without copying them into a list
+    first; the tiling must not be modified while iterating.
+
+    If region is given, only the tiles whose bounding boxes overlap the
+    Rectangle region are produced, looked up with the spatial index. If
+    order is None, the tiles come in no particular order. Otherwise, order
+    may be 'x' or 'y', for the tiles to be sorted by the minimum x or y
+    coordinates of their bounding boxes, or 'morton' or 'hilbert', for them
+    to follow that space-filling curve through the whole tiling, so that
+    consecutive tiles are (mostly) close together; see curve_order().'''
+    if order not in (None, 'x', 'y', 'morton', 'hilbert'):
+      raise ValueError
+    if region is None:
+      if order in ('morton', 'hilbert'):
+        return iter(self.curve_order(order))
+      tiles = self._tiles
+    else:
+      fb = (float(region.min_x), float(region.min_y), float(region.max_x), float(region.max_y))
+      tiles = (t for t in self._index.query(fb) if pg.do_bboxes_overlap(t, region))
+
+    if order in ('x', 'y'):
+      k = 0 if order == 'x' else 1
+      def key(t):
+        fb = tile_index.float_bbox(t)
+        return (fb[k], fb[1-k])
+      tiles = sorted(tiles, key = key)
+    elif order is not None:
+      tiles = sorted(tiles, key = self._curve_keys(order).__getitem__)
+    return iter(tiles)
+
+  def _curve_keys(self, curve):
+    if curve not in self._curve_orders:
+      keys = tile_index.curve_keys(self._tiles, curve)
+      self._curve_orders[curve] = (keys, sorted(self._tiles, key = keys.__getitem__))
+    return self._curve_orders[curve][0]
+
+  def curve_order(self, curve = 'hilbert'):
+    '''Returns a list of the tiles in the order of a space-filling curve
+    ('morton' or 'hilbert') through the tiles' centroids. The order is
+    cached until tiles are added or removed.'''
+    self._curve_keys(curve)
+    return list(self._curve_orders[curve][1])
+
+  def shards(self, n, curve = 'hilbert'):
+    '''Splits the tiles into n lists of (nearly) equal sizes, each one
+    a contiguous run of curve_order(curve), and so spatially compact; these
+    are suitable for handing to parallel workers.'''
+    if not isinstance(n, int):
+      raise TypeError
+    if n < 1:
+      raise ValueError
+    self._curve_keys(curve)
+    tiles = self._curve_orders[curve][1]
+    return [tiles[(k * len(tiles)) // n : ((k+1) * len(tiles)) // n] for k in range(n)]
+
+  def tiles_in_rect(self, rect):
+    '''Returns the list of tiles whose bounding boxes overlap the
+    Rectangle rect.'''
+    return list(self.iter_tiles(rect))
+
+  def nearest_tile(self, pt):
+    '''Returns the tile nearest to the Point pt (one containing pt,
+    if there is one), or None if there are no tiles; distances are computed
+    in floating point, so ties and near-ties are broken arbitrarily.'''
+    return self._index.nearest(float(pt.x), float(pt.y), _float_distance)
+
   def get_vertices(self):
     verts = self._vertices
     return [v for v in verts.keys() if len(verts[v]) != 0]
 
+  def tile_across_edge(self, t, i):
+    '''Returns the tile sharing the i'th edge of tile t, or None if there
+    isn't one.'''
+    v = t.vertices()
+    for u, j in self._edges.get(_edge_key(v[i], v[(i+1)%len(v)]), ()):
+      if u is not t and u != t:
+        return u
+    return None
+
+  def neighbors(self, t):
+    '''Returns the list of tiles sharing an edge with tile t, in the order
+    of t's edges.'''
+    nbrs = (self.tile_across_edge(t, i) for i in range(len(t.vertices())))
+    return [u for u in nbrs if u is not None]
+
+  def adjacency_csr(self, use_numpy = None):
+    '''Returns the graph of tiles sharing edges in compressed sparse row
+    form, as a tuple (tiles, indptr, indices): the neighbors of tiles[k] are
+    the tiles[indices[m]] for indptr[k] <= m < indptr[k+1].
+
+    indptr and indices are int64 NumPy arrays if use_numpy is true (or if it's
+    None and NumPy is available), and array.array('q')s otherwise.'''
+    if use_numpy is None or use_numpy:
+      try:
+        import numpy
+      except ImportError:
+        if use_numpy:
+          raise
+        numpy = None
+    else:
+      numpy = None
+
+    tiles = list(self._tiles)
+    node_ids = {id(t): k for k, t in enumerate(tiles)}
+    indptr, indices = array('q', [0]), array('q')
+    for t in tiles:
+      v = t.vertices()
+      for i in range(len(v)):
+        for u, j in self._edges[_edge_key(v[i], v[(i+1)%len(v)])]:
+          if u is not t:
+            indices.append(node_ids[id(u)])
+      indptr.append(len(indices))
+
+    if numpy is not None:
+      indptr = numpy.frombuffer(indptr, dtype = numpy.int64).copy()
+      indices = numpy.frombuffer(indices, dtype = numpy.int64).copy()
+    return (tiles, indptr, indices)
+
   def transform(self, trns):
-    new_tm = TileManager()
+    new_tm = TileManager(index = self._index_type)
     for t in self._tiles:
       new_tm.add_tile(t.transform(trns))
     return new_tm
 
-  def decompose(self, decomp_id):
-    new_tm = TileManager()
+  def symmetry(self):
+    return self._symmetry
+
+  def _fundamental_tiles(self):
+    # Returns the tiles in the sector [0, 360/n) degrees, as measured
+    # at the tiles' vertex centroids, along with any tiles centered on the
+    # origin; rotating these by the symmetry group gives the whole tiling.
+    n = len(self._symmetry)
+    fundamental, n_centered = [], 0
     for t in self._tiles:
-      for nt in t.decompose(decomp_id):
-        new_tm.add_tile(nt)
+      s = sum((pt.as_offset_vector() for pt in t.vertices()), Vector(0, 0))
+      if s.x == 0 and s.y == 0:
+        if not all(t.transform(rot) == t for rot in self._symmetry[1:]):
+          raise ValueError('tiling does not have the declared symmetry')
+        fundamental.append(t)
+        n_centered += 1
+      elif _in_sector(s, n):
+        fundamental.append(t)
+
+    # Each tile not centered on the origin has n distinct rotated copies:
+    if n * (len(fundamental) - n_centered) + n_centered != len(self._tiles):
+      raise ValueError('tiling does not have the declared symmetry')
+    return fundamental
+
+  def decompose(self, decomp_id):
+    new_tm = TileManager(self._symmetry, self._index_type)
+    if self._symmetry is None:
+      for t in self._tiles:
+        for nt in t.decompose(decomp_id):
+          new_tm.add_tile(nt)
+      return new_tm
+
+    # Decompose (and validate) one sector's worth of tiles; as the tiling
+    # is symmetric, rotated copies of those are valid as well. Copies of
+    # tiles on the sector boundaries or at the center may coincide, which
+    # the trusted add_tile quietly ignores.
+    children = [nt for t in self._fundamental_tiles() for nt in t.decompose(decomp_id)]
+    new_tm.add_tiles(children)
+    for rot in self._symmetry[1:]:
+      new_tm.add_tiles((nt.transform(rot) for nt in children), trusted = True)
     return new_tm
 
   def bbox(self):
     if len(self._tiles) == 0:
       return None
 
-    bboxes = [t.bbox() for t in self._tiles]
-    min_x = min(bb.min_x for bb in bboxes)
-    max_x = max(bb.max_x for bb in bboxes)
-    min_y = min(bb.min_y for bb in bboxes)
-    max_y = max(bb.max_y for bb in bboxes)
-    return pg.Rectangle(min_x, min_y, max_x, max_y)
+    # Fold the bounding boxes of the tiles added since the last call
+    # into the one computed then
+    bboxes = [t.bbox() for t in self._bbox_pending if t in self._tiles]
+    if self._bbox is not None:
+      bboxes.append(self._bbox)
+    if len(bboxes) > 1 or self._bbox is None:
+      min_x = min(bb.min_x for bb in bboxes)
+      max_x = max(bb.max_x for bb in bboxes)
+      min_y = min(bb.min_y for bb in bboxes)
+      max_y = max(bb.max_y for bb in bboxes)
+      self._bbox = pg.Rectangle(min_x, min_y, max_x, max_y)
+    self._bbox_pending = []
+    return self._bbox
@@ -0,0 +1,270 @@
+# MIT-licensed; see LICENSE for details
+
+from unittest import TestCase
+import tile_manager as tmgr, tile_index as ti
+from tile_manager import TileManager
+import penrose as p
+import pen_geom as g
+from pen_num import phi
+from fractions import Fraction as Q
+
+def _sun(symmetry = None):
+  tm = TileManager(symmetry)
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(p.KiteTile().scale(phi).rotate(i))
+  return tm
+
+class TestSymmetry(TestCase):
+  def test_rotational_symmetry(self):
+    group = tmgr.rotational_symmetry(5)
+    self.assertEqual(len(group), 5)
+    self.assertEqual(group[0], g.identity_transform)
+    self.assertEqual(group[1], g.rotation(4))
+    self.assertRaises(ValueError, tmgr.rotational_symmetry, 3)
+    self.assertRaises(ValueError, tmgr.rotational_symmetry, 0)
+    self.assertRaises(TypeError, tmgr.rotational_symmetry, 2.5)
+    self.assertRaises(ValueError, TileManager, (g.rotation(4),))
+
+  def test_symmetric_decomposition(self):
+    plain, sym = _sun(), _sun(tmgr.rotational_symmetry(5))
+    for decomp_id in ['to-A', 'half-deflation', 'half-deflation', 'to-P2']:
+      with self.subTest(decomp_id = decomp_id):
+        plain, sym = plain.decompose(decomp_id), sym.decompose(decomp_id)
+        self.assertEqual(set(plain.get_tiles()), set(sym.get_tiles()))
+        self.assertEqual(len(sym.symmetry()), 5)
+
+  def test_two_fold_symmetry(self):
+    plain, sym = TileManager(), TileManager(tmgr.rotational_symmetry(2))
+    for tm in (plain, sym):
+      tm.add_tile(p.KiteTile())
+      tm.add_tile(p.KiteTile().rotate(10))
+    for i in range(3):
+      plain, sym = plain.decompose('to-A' if i == 0 else 'half-deflation'), \
+                   sym.decompose('to-A' if i == 0 else 'half-deflation')
+      self.assertEqual(set(plain.get_tiles()), set(sym.get_tiles()))
+
+  def test_centered_tile(self):
+    # No tile with matching rules is symmetric under a half-turn, so a
+    # tile centered on the origin breaks two-fold symmetry
+    center = p.proto_thick[2].as_offset_vector()
+    tm = TileManager(tmgr.rotational_symmetry(2))
+    tm.add_tile(p.ThickRhomb(g.translation(-(Q(1,2) * center))))
+    self.assertRaises(ValueError, tm.decompose, 'to-B')
+
+  def test_asymmetric_tiling(self):
+    tm = TileManager(tmgr.rotational_symmetry(5))
+    tm.add_tile(p.KiteTile().rotate(-1))
+    self.assertRaises(ValueError, tm.decompose, 'to-A')
+
+class TestMatchingChecks(TestCase):
+  def _compare_with_full_check(self, tiles, types):
+    tm = TileManager()
+    tm.add_tiles(tiles)
+    tr = tiles[0].curr_transform()
+    linear = g.AffineTransform(tr.a, tr.b, 0, tr.d, tr.e, 0)
+    n_accepted = 0
+    for T in types:
+      for pt in tiles[0].vertices():
+        for rot in range(0, 20, 2):
+          cand = T(g.translation(pt.as_offset_vector()) @ g.rotation(rot) @ linear)
+          if cand in tiles:
+            continue
+          with self.subTest(T = T, pt = pt, rot = rot):
+            expected = all(cand.matches(t) for t in tiles)
+            self.assertEqual(bool(tm.can_add_tile(cand)), expected)
+            n_accepted += expected
+    # Make sure both outcomes were exercised:
+    self.assertTrue(n_accepted > 0)
+
+  def test_rhombs(self):
+    self._compare_with_full_check([p.ThickRhomb(), p.ThinRhomb(g.rotation(4))], [p.ThickRhomb, p.ThinRhomb])
+
+  def test_kites_and_darts(self):
+    self._compare_with_full_check([p.KiteTile().rotate(-1), p.KiteTile().rotate(3)], [p.KiteTile, p.DartTile])
+
+  def test_robinson_triangles(self):
+    self._compare_with_full_check(list(p.KiteTile().decompose('to-A')), [p.A_K1, p.A_K2, p.A_D1, p.A_D2])
+
+  def test_remove_and_readd(self):
+    tm = _sun()
+    tiles = tm.get_tiles()
+    for t in tiles:
+      tm.remove_tile(t)
+      self.assertIs(tm.can_add_tile(t), True)
+      tm.add_tile(t)
+      self.assertIs(tm.can_add_tile(t), tmgr.TileAlreadyPresent)
+    self.assertEqual(set(tm.get_tiles()), set(tiles))
+
+class TestAdjacency(TestCase):
+  def test_neighbors(self):
+    tm = _sun()
+    tiles = tm.get_tiles()
+    for t in tiles:
+      with self.subTest(t = t):
+        nbrs = tm.neighbors(t)
+        self.assertEqual(len(nbrs), 2)
+        for u in nbrs:
+          self.assertIn(t, tm.neighbors(u))
+    kite = p.KiteTile().scale(phi).rotate(-1)
+    self.assertEqual(tm.tile_across_edge(kite, 0), p.KiteTile().scale(phi).rotate(15))
+    self.assertEqual(tm.tile_across_edge(kite, 1), None)
+    self.assertEqual(tm.tile_across_edge(kite, 2), None)
+    self.assertEqual(tm.tile_across_edge(kite, 3), p.KiteTile().scale(phi).rotate(3))
+    self.assertEqual(tm.tile_across_edge(p.KiteTile().scale(phi).rotate(3), 0), kite)
+
+  def test_neighbors_after_removal(self):
+    tm = _sun()
+    kite = p.KiteTile().scale(phi).rotate(3)
+    tm.remove_tile(kite)
+    self.assertEqual(tm.tile_across_edge(p.KiteTile().scale(phi).rotate(-1), 3), None)
+    self.assertEqual(len(tm.neighbors(p.KiteTile().scale(phi).rotate(-1))), 1)
+
+  def test_adjacency_csr(self):
+    tm = _sun().decompose('to-A')
+    tiles, indptr, indices = tm.adjacency_csr(use_numpy = False)
+    self.assertEqual(len(indptr), len(tiles) + 1)
+    self.assertEqual(indptr[-1], len(indices))
+    for k, t in enumerate(tiles):
+      with self.subTest(t = t):
+        self.assertEqual(
+          set(tiles[m] for m in indices[indptr[k]:indptr[k+1]]),
+          set(tm.neighbors(t))
+        )
+    # Each of the 10 halves of the sun's kites has two neighbors:
+    self.assertEqual(len(indices), 20)
+
+class TestSpatialQueries(TestCase):
+  index_types = [ti.GridIndex, ti.QuadtreeIndex, ti.RTreeIndex]
+
+  def setUp(self):
+    self.tiles = _sun().decompose('to-A').decompose('half-deflation').get_tiles()
+
+  def test_index_types(self):
+    self.assertRaises(TypeError, TileManager, None, dict)
+    expected = set(t for u in self.tiles for t in u.decompose('half-deflation'))
+    for index in self.index_types:
+      with self.subTest(index = index):
+        tm = TileManager(index = index)
+        tm.add_tiles(self.tiles)
+        self.assertRaises(ValueError, tm.add_tile, p.KiteTile().scale(phi))
+        d = tm.decompose('half-deflation')
+        self.assertIsInstance(d._index, index)
+        self.assertEqual(set(d.get_tiles()), expected)
+        self.assertIsInstance(tm.transform(g.rotation(1))._index, index)
+
+  def test_tiles_in_rect(self):
+    rects = [g.Rectangle(0, 0, 1, 1), g.Rectangle(-3, -Q(1, 2), Q(-1, 3), 2), g.Rectangle(5, 5, 6, 6)]
+    for index in self.index_types:
+      tm = TileManager(index = index)
+      tm.add_tiles(self.tiles, trusted = True)
+      for r in rects:
+        with self.subTest(index = index, rect = r):
+          expected = set(t for t in self.tiles if g.do_bboxes_overlap(t, r))
+          self.assertEqual(set(tm.tiles_in_rect(r)), expected)
+
+  def test_nearest_tile(self):
+    points = [g.Point(Q(1, 3), Q(1, 7)), g.Point(-1, Q(1, 2)), g.Point(Q(1, 5), -1)]
+    for index in self.index_types:
+      tm = TileManager(index = index)
+      self.assertIs(tm.nearest_tile(g.Point(0, 0)), None)
+      tm.add_tiles(self.tiles)
+      for pt in points:
+        with self.subTest(index = index, pt = pt):
+          t = tm.nearest_tile(pt)
+          self.assertEqual(g.point_in_polygon(pt, g.Polygon(t.vertices())), 1)
+      far = tm.nearest_tile(g.Point(100, 0))
+      self.assertTrue(all(g.Vector(1, 0) | (v - g.Point(100, 0)) <= 0 for v in far.vertices()))
+
+class TestIteration(TestCase):
+  def setUp(self):
+    self.tm = _sun().decompose('to-A').decompose('half-deflation')
+
+  def test_iter_tiles(self):
+    tm = self.tm
+    self.assertEqual(tm.count(), len(tm.get_tiles()))
+    self.assertEqual(set(tm.iter_tiles()), set(tm.get_tiles()))
+    r = g.Rectangle(0, 0, 1, 1)
+    self.assertEqual(set(tm.iter_tiles(r)), set(tm.tiles_in_rect(r)))
+    self.assertRaises(ValueError, tm.iter_tiles, None, 'z')
+
+    xs = [float(t.bbox().min_x) for t in tm.iter_tiles(order = 'x')]
+    self.assertEqual(xs, sorted(xs))
+    ys = [float(t.bbox().min_y) for t in tm.iter_tiles(r, order = 'y')]
+    self.assertEqual(ys, sorted(ys))
+    self.assertEqual(len(ys), len(tm.tiles_in_rect(r)))
+
+  def test_incremental_bbox(self):
+    def full_bbox(tm):
+      tiles = tm.get_tiles()
+      return g.Rectangle(
+        min(t.bbox().min_x for t in tiles), min(t.bbox().min_y for t in tiles),
+        max(t.bbox().max_x for t in tiles), max(t.bbox().max_y for t in tiles)
+      )
+
+    tm = TileManager()
+    self.assertIs(tm.bbox(), None)
+    tiles = sorted(self.tm.get_tiles(), key = lambda t: float(t.bbox().min_x))
+    for t in tiles:
+      tm.add_tile(t)
+      self.assertEqual(tm.bbox(), full_bbox(tm))
+    for t in tiles[:-1]:
+      tm.remove_tile(t)
+      self.assertEqual(tm.bbox(), full_bbox(tm))
+    tm.remove_tile(tiles[-1])
+    self.assertIs(tm.bbox(), None)
+
+class TestCurveOrder(TestCase):
+  def setUp(self):
+    self.tm = _sun().decompose('to-A').decompose('half-deflation')
+
+  def test_curve_order(self):
+    tm = self.tm
+    for curve in ['morton', 'hilbert']:
+      with self.subTest(curve = curve):
+        order = tm.curve_order(curve)
+        self.assertEqual(set(order), set(tm.get_tiles()))
+        self.assertEqual(len(order), tm.count())
+        self.assertEqual(list(tm.iter_tiles(order = curve)), order)
+        r = g.Rectangle(0, 0, 1, 1)
+        in_r = list(tm.iter_tiles(r, order = curve))
+        self.assertEqual(in_r, [t for t in order if t in set(in_r)])
+    self.assertRaises(ValueError, tm.curve_order, 'peano')
+
+  def test_cache_invalidation(self):
+    tm = self.tm
+    order = tm.curve_order()
+    tm.remove_tile(order[0])
+    self.assertEqual(tm.curve_order(), order[1:])
+    tm.add_tile(order[0])
+    self.assertEqual(tm.curve_order(), order)
+
+  def test_locality(self):
+    # Consecutive tiles along the Hilbert curve are closer together than
+    # when alternating between two sweeps across the tiling
+    def path_length(tiles):
+      cs = [ti.float_centroid(t) for t in tiles]
+      return sum(((a[0]-b[0])**2 + (a[1]-b[1])**2)**0.5 for a, b in zip(cs, cs[1:]))
+    tiles = sorted(self.tm.get_tiles(), key = lambda t: float(t.bbox().min_y))
+    tiles = tiles[0::2] + tiles[1::2]
+    self.assertLess(path_length(self.tm.curve_order('hilbert')), path_length(tiles))
+
+  def test_shards(self):
+    tm = self.tm
+    shards = tm.shards(3)
+    self.assertEqual(len(shards), 3)
+    self.assertEqual([t for s in shards for t in s], tm.curve_order())
+    self.assertLessEqual(max(map(len, shards)) - min(map(len, shards)), 1)
+    self.assertRaises(ValueError, tm.shards, 0)
+    self.assertRaises(TypeError, tm.shards, 1.5)
+
+class TestCurveKeys(TestCase):
+  def test_hilbert_key(self):
+    cells = {ti.hilbert_key(x, y, 3): (x, y) for x in range(8) for y in range(8)}
+    self.assertEqual(sorted(cells), list(range(64)))
+    path = [cells[k] for k in range(64)]
+    for a, b in zip(path, path[1:]):
+      self.assertEqual(abs(a[0] - b[0]) + abs(a[1] - b[1]), 1)
+
+  def test_morton_key(self):
+    self.assertEqual(ti.morton_key(3, 5), 39)
+    self.assertEqual(sorted(ti.morton_key(x, y) for x in range(8) for y in range(8)), list(range(64)))
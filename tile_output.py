@@ -1,35 +1,68 @@
 # MIT-licensed; see LICENSE for details
 
-import re, math, itertools, penrose, pen_num
-from fractions import Fraction
+import re, math, itertools, penrose, pen_num, tile_decoration
+from tile_index import PointGrid
 from pen_geom import Point
-from collections import defaultdict
+from collections import defaultdict, namedtuple, OrderedDict
+from sys import float_info
 
 _trim_trailing_re = re.compile(r'\.?0+$')
 
-_cache = {}
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
 
 class DecimalFormatter:
-  def __init__(self, n):
-    if not isinstance(n, int):
-      return TypeError
-    if n < 1:
-      return ValueError
+  '''Formats numbers as decimals, rounded down to n places. The rounded
+  values of the most recently used cache_size numbers are cached.'''
+
+  def __init__(self, n, cache_size = 1 << 16):
+    if not isinstance(n, int) or not isinstance(cache_size, int):
+      raise TypeError
+    if n < 1 or cache_size < 0:
+      raise ValueError
 
     self._fmtstr = '{}.{:0' + str(n) + 'd}'
     self._divisor = 10**n
     self._n = n
+    self._cache = OrderedDict()
+    self._cache_size = cache_size
+    self._hits, self._misses = 0, 0
 
   _trim_trailing_re = re.compile(r'\.?0+$')
 
-  def _decimal_approx(self, x):
-    global _cache
+  def cache_info(self):
+    '''Returns a CacheInfo with the numbers of cache hits and misses so far,
+    and the maximum and current sizes of the cache.'''
+    return CacheInfo(self._hits, self._misses, self._cache_size, len(self._cache))
 
-    y = _cache.get((self._n, x), None)
-    if y is None:
-      y = math.floor(x * self._divisor)
-      _cache[(self._n, x)] = y
+  def _floor_scaled(self, x):
+    # Returns floor(x * 10**n). For a Number, that's done in floating point,
+    # unless x * 10**n is too close to an integer for the rounding errors
+    # to be ruled out, as exact arithmetic is much slower
+    divs = self._divisor
+    if isinstance(x, pen_num.Number):
+      f, e = x.float_with_error()
+      y = f * divs
+      # Allow for the errors in f, and in scaling and shifting it
+      e = e * divs + 4 * abs(y) * float_info.epsilon
+      low = math.floor(y - e)
+      if low == math.floor(y + e):
+        return low
+    return math.floor(x * divs)
 
+  def _decimal_approx(self, x):
+    cache = self._cache
+    y = cache.get(x, None)
+    if y is not None:
+      self._hits += 1
+      cache.move_to_end(x)
+      return y
+
+    self._misses += 1
+    y = self._floor_scaled(x)
+    if self._cache_size > 0:
+      cache[x] = y
+      if len(cache) > self._cache_size:
+        cache.popitem(last = False)
     return y
 
   def _to_decimal_string(self, x):
@@ -71,14 +104,60 @@ class UndirectedLineSegment:
   def __hash__(self):
     return hash((self.end1, self.end2))
 
-def tiling_to_svg_path(tiling, precision):
+# Default number of characters to buffer before writing to a file
+_default_buffer_size = 1 << 16
+
+def _write_buffered(f, strings, buffer_size):
+  # Writes the iterable of strings to f, in chunks of (roughly) buffer_size
+  # characters
+  buf, n = [], 0
+  for s in strings:
+    buf.append(s)
+    n += len(s)
+    if n >= buffer_size:
+      f.write(''.join(buf))
+      buf, n = [], 0
+  if buf:
+    f.write(''.join(buf))
+
+def _path_commands(tiling, precision, method):
+  if method == 'greedy':
+    return _svg_path_commands(tiling, precision)
+  if method == 'trails':
+    return _trail_commands(tiling, precision)
+  raise ValueError
+
+def tiling_to_svg_path(tiling, precision, method = 'greedy'):
+  '''Returns SVG path data (i.e., the d attribute of a <path>) drawing the
+  edges of the tiles of tiling, with coordinates rounded to precision
+  decimal places.
+
+  With method 'greedy', the path follows edges until it reaches a point
+  with none left to draw, then moves to the nearest point that has some.
+  With method 'trails', the edges are split into as few continuous
+  trails as there can be, which are drawn in turn; this takes longer,
+  but lifts the pen far less often, as suits pen plotters.'''
+  return ''.join(_path_commands(tiling, precision, method))
+
+def write_svg_path(f, tiling, precision, buffer_size = _default_buffer_size, method = 'greedy'):
+  '''Writes the path data that tiling_to_svg_path() would return to the
+  text file object f, in chunks of about buffer_size characters, rather
+  than building it all up in memory first.'''
+  _write_buffered(f, _path_commands(tiling, precision, method), buffer_size)
+
+def _svg_path_commands(tiling, precision):
+  # Yields the commands of the path drawing the tiles' edges
   untraversed_lines = set()
   untraversed_lines_at = defaultdict(set)
   remaining_points = dict()
   rp_indices = itertools.count()
   uls = None
 
-  for tile in tiling.get_tiles():
+  # Going through the tiles along a space-filling curve numbers the
+  # remaining points roughly by position (the numbers break ties between
+  # equally-near points below), and makes the output independent of the
+  # order of the tiles in the tiling's set
+  for tile in tiling.iter_tiles(order = 'hilbert'):
     vertices = tile.vertices()
     for pt1, pt2 in zip(vertices, [*vertices[1:], vertices[0]]):
       uls = UndirectedLineSegment(pt1, pt2)
@@ -94,9 +173,11 @@ def tiling_to_svg_path(tiling, precision):
     untraversed_lines_at[end1].discard(l)
     if len(untraversed_lines_at[end1]) == 0:
       del remaining_points[end1]
+      grid.remove(end1)
     untraversed_lines_at[end2].discard(l)
     if len(untraversed_lines_at[end2]) == 0:
       del remaining_points[end2]
+      grid.remove(end2)
 
   def any_element(s):
     for i in s:
@@ -108,17 +189,22 @@ def tiling_to_svg_path(tiling, precision):
     return (dx * dx) + (dy * dy)
 
   if uls is None:
-    return ''
+    return
+
+  # The remaining points, in a float grid with cells about an edge long,
+  # to find where to jump to when the pen has to be lifted
+  grid = PointGrid(math.hypot(float(uls.end2.x - uls.end1.x), float(uls.end2.y - uls.end1.y)))
+  for pt in remaining_points:
+    grid.insert(pt, float(pt.x), float(pt.y))
 
-  path = []
   fmt = DecimalFormatter(precision)
 
   # Add a first line segment
-  path.append('M{} {}'.format(
+  yield ('M{} {}'.format(
     fmt.approx(uls.end1.x),
     fmt.approx(uls.end1.y)
   ))
-  path.append('l{} {}'.format(
+  yield ('l{} {}'.format(
     fmt.approx_delta(uls.end1.x, uls.end2.x),
     fmt.approx_delta(uls.end1.y, uls.end2.y)
   ))
@@ -130,19 +216,22 @@ def tiling_to_svg_path(tiling, precision):
     next_seg = any_element(untraversed_lines_at[last_pt])
 
     if next_seg is None:
-      # Find nearest point with remaining line segments -
-      # using a spatial tree would be asymptotically faster, I know,
-      # but I'm looking for quick-to-code-up here.
-      d2, idx, next_pt = min((dist_squared(last_pt, p), i, p) for p, i in remaining_points.items())
-
-      path.append('m{} {}'.format(
+      # Find nearest point with remaining line segments: the grid finds
+      # the candidates that are nearest, up to rounding errors, and exact
+      # arithmetic picks between them
+      fx, fy = float(last_pt.x), float(last_pt.y)
+      _, d = grid.nearest(fx, fy)
+      candidates = grid.within(fx, fy, d * (1 + 1e-9) + 1e-12)
+      d2, idx, next_pt = min((dist_squared(last_pt, p), remaining_points[p], p) for p in candidates)
+
+      yield ('m{} {}'.format(
         fmt.approx_delta(last_pt.x, next_pt.x),
         fmt.approx_delta(last_pt.y, next_pt.y)
       ))
       last_pt, next_seg = next_pt, any_element(untraversed_lines_at[next_pt])
 
     next_pt = next_seg.end2 if last_pt == next_seg.end1 else next_seg.end1
-    path.append('l{} {}'.format(
+    yield ('l{} {}'.format(
       fmt.approx_delta(last_pt.x, next_pt.x),
       fmt.approx_delta(last_pt.y, next_pt.y)
     ))
@@ -150,96 +239,236 @@ def tiling_to_svg_path(tiling, precision):
     remove_segment(next_seg)
     last_pt = next_pt
 
-  return ''.join(path)
+def _edge_graph(tiling):
+  # Returns (vertices, edges, adjacent) for the graph of the tiles' edges:
+  # vertices is a list of the points, edges a list of pairs of indices
+  # into vertices, and adjacent[i] a list of the indices of the edges at
+  # vertex i
+  vertex_ids, vertices, adjacent = {}, [], []
+  seen, edges = set(), []
+
+  def vertex_id(pt):
+    i = vertex_ids.get(pt, None)
+    if i is None:
+      i = vertex_ids[pt] = len(vertices)
+      vertices.append(pt)
+      adjacent.append([])
+    return i
+
+  for tile in tiling.iter_tiles(order = 'hilbert'):
+    vertices_ = tile.vertices()
+    for pt1, pt2 in zip(vertices_, [*vertices_[1:], vertices_[0]]):
+      uls = UndirectedLineSegment(pt1, pt2)
+      if uls in seen:
+        continue
+      seen.add(uls)
+      i, j = vertex_id(uls.end1), vertex_id(uls.end2)
+      adjacent[i].append(len(edges))
+      adjacent[j].append(len(edges))
+      edges.append((i, j))
+  return (vertices, edges, adjacent)
+
+def _euler_circuit(start, edges, adjacent, used, next_edge):
+  # Returns a list of the edges of an Eulerian circuit of the unused edges
+  # connected to vertex start, as (edge, from, to) triples, using
+  # Hierholzer's algorithm; next_edge[i] is the position in adjacent[i]
+  # before which all edges are used
+  stack, popped = [(start, None)], []
+  while stack:
+    v, e = stack[-1]
+    adj, k = adjacent[v], next_edge[v]
+    while k < len(adj) and used[adj[k]]:
+      k += 1
+    next_edge[v] = k
+    if k < len(adj):
+      e_next = adj[k]
+      used[e_next] = True
+      i, j = edges[e_next]
+      stack.append((j if i == v else i, e_next))
+    else:
+      popped.append(stack.pop())
+  # In reverse order of popping, each vertex follows the edge that
+  # leads to it from the one before
+  popped.reverse()
+  return [(e, popped[k-1][0], v) for k, (v, e) in enumerate(popped) if e is not None]
+
+def _trail_commands(tiling, precision):
+  # Yields the commands of a path drawing the tiles' edges in few trails.
+  # Any graph can be drawn in as many trails as half its number of
+  # odd-degree vertices (or in one, if there are none): joining those
+  # vertices in pairs, by extra edges, gives a graph with an Eulerian
+  # circuit, and removing the extra edges from that circuit leaves the
+  # trails. The odd-degree vertices are paired greedily with near ones, so
+  # the extra edges, which become the moves between trails, are short.
+  vertices, edges, adjacent = _edge_graph(tiling)
+  if not edges:
+    return
+  n_real = len(edges)
+  float_vertices = [(float(pt.x), float(pt.y)) for pt in vertices]
+  cell_size = math.hypot(
+    float_vertices[edges[0][0]][0] - float_vertices[edges[0][1]][0],
+    float_vertices[edges[0][0]][1] - float_vertices[edges[0][1]][1]
+  )
+
+  odd = PointGrid(cell_size)
+  for i, adj in enumerate(adjacent):
+    if len(adj) % 2 == 1:
+      odd.insert(i, *float_vertices[i])
+  for i in range(len(vertices)):
+    if i in odd:
+      odd.remove(i)
+      j, _ = odd.nearest(*float_vertices[i])
+      odd.remove(j)
+      adjacent[i].append(len(edges))
+      adjacent[j].append(len(edges))
+      edges.append((i, j))
+
+  # Vertices with edges left to draw, to find where to start each circuit
+  remaining = PointGrid(cell_size)
+  for i, fv in enumerate(float_vertices):
+    remaining.insert(i, *fv)
+  used, next_edge = [False] * len(edges), [0] * len(vertices)
 
-def tiling_arcs_svg(tiling, precision):
   fmt = DecimalFormatter(precision)
-  arc_set1, arc_set2 = [], []
-  inv_phi, one_minus_inv_phi = pen_num.inv_phi, 1 - pen_num.inv_phi
-  inv_phi2 = pen_num.inv_phi * pen_num.inv_phi
-  inv_phi_minus_inv_phi2 = inv_phi - inv_phi2
-  half_inv_phi = Fraction(1,2) * inv_phi
-  one_minus_half_inv_phi = 1 - half_inv_phi
-
-  # The following code makes exquisite use of what *should* be
-  # internal details of the four tile types in question.
-  v0 = tiling.get_tiles()[0].vertices()
-  rev = v0[1] - v0[0] # "represetative edge vector"
-  rev_len_squared = (rev.x * rev.x) + (rev.y * rev.y)
-  rev_inv_len = pen_num.Number(pen_num.approx_inv_sqrt(rev_len_squared))
-  edge_approx_len = pen_num.approx_inv_sqrt(rev_inv_len * rev_inv_len)
-
-  def make_arcs(second_arc_sense = 0):
-    nonlocal arc1_start, arc1_end, rad1, arc_set1
-    nonlocal arc2_start, arc2_end, rad2, arc_set2
-    nonlocal fmt
-
-    r1, r2 = fmt.approx(rad1), fmt.approx(rad2)
-
-    arc_set1.append('M{} {}'.format(
-      fmt.approx(arc1_start.x),
-      fmt.approx(arc1_start.y)
-    ))
-    arc_set1.append('A{} {} 0 0 1 {} {}'.format(
-      r1, r1,
-      fmt.approx(arc1_end.x),
-      fmt.approx(arc1_end.y)
-    ))
-
-    arc_set2.append('M{} {}'.format(
-      fmt.approx(arc2_start.x),
-      fmt.approx(arc2_start.y)
-    ))
-    arc_set2.append('A{} {} 0 {} 1 {} {}'.format(
-      r2, r2,
-      second_arc_sense,
-      fmt.approx(arc2_end.x),
-      fmt.approx(arc2_end.y)
-    ))
-
-  for t in tiling.get_tiles():
-    ty, vs = type(t), t.vertices()
-    if ty is penrose.KiteTile:
-      arc1_start = vs[0] + inv_phi * (vs[1]-vs[0])
-      arc1_end   = vs[0] + inv_phi * (vs[3]-vs[0])
-      rad1 = inv_phi * edge_approx_len
-
-      arc2_start = vs[2] + inv_phi * (vs[3]-vs[2])
-      arc2_end   = vs[2] + inv_phi * (vs[1]-vs[2])
-      rad2 = inv_phi2 * edge_approx_len
-
-      make_arcs()
-    elif ty is penrose.DartTile:
-      arc1_start = vs[0] + one_minus_inv_phi * (vs[1]-vs[0])
-      arc1_end   = vs[0] + one_minus_inv_phi * (vs[3]-vs[0])
-      rad1 = one_minus_inv_phi * edge_approx_len
-
-      arc2_start = vs[2] + one_minus_inv_phi * (vs[3]-vs[2])
-      arc2_end   = vs[2] + one_minus_inv_phi * (vs[1]-vs[2])
-      rad2 = inv_phi_minus_inv_phi2 * edge_approx_len
-
-      make_arcs(1)
-    elif ty is penrose.ThickRhomb:
-      arc1_start = vs[0] + one_minus_half_inv_phi * (vs[1]-vs[0])
-      arc1_end   = vs[0] + one_minus_half_inv_phi * (vs[3]-vs[0])
-      rad1 = one_minus_half_inv_phi * edge_approx_len
-
-      arc2_start = vs[2] + half_inv_phi * (vs[3]-vs[2])
-      arc2_end   = vs[2] + half_inv_phi * (vs[1]-vs[2])
-      rad2 = half_inv_phi * edge_approx_len
-
-      make_arcs()
-    elif ty is penrose.ThinRhomb:
-      arc1_start = vs[1] + half_inv_phi * (vs[2]-vs[1])
-      arc1_end   = vs[1] + half_inv_phi * (vs[0]-vs[1])
-      rad1       = half_inv_phi * edge_approx_len
-
-      arc2_start = vs[3] + half_inv_phi * (vs[0]-vs[3])
-      arc2_end   = vs[3] + half_inv_phi * (vs[2]-vs[3])
-      rad2       = rad1
-
-      make_arcs()
+  last = None
+  while len(remaining) > 0:
+    if last is None:
+      start = edges[0][0]
+      pen = float_vertices[start]
     else:
-      raise ValueError
+      pen = float_vertices[last]
+      start, _ = remaining.nearest(*pen)
+    circuit = _euler_circuit(start, edges, adjacent, used, next_edge)
+    for e, v, w in circuit:
+      remaining.remove(v)
+
+    # Start drawing the circuit after the extra edge (if there are any)
+    # that leads to the nearest point to the pen
+    def distance(k):
+      x, y = float_vertices[circuit[k][1]]
+      return math.hypot(x - pen[0], y - pen[1])
+    starts = [k for k in range(len(circuit)) if circuit[k-1][0] >= n_real]
+    first = min(starts or range(len(circuit)), key = distance)
+    circuit = circuit[first:] + circuit[:first]
+    if circuit[-1][0] >= n_real:
+      circuit.pop()
+
+    v = circuit[0][1]
+    if last is None:
+      yield 'M{} {}'.format(fmt.approx(vertices[v].x), fmt.approx(vertices[v].y))
+    else:
+      yield 'm{} {}'.format(
+        fmt.approx_delta(vertices[last].x, vertices[v].x),
+        fmt.approx_delta(vertices[last].y, vertices[v].y)
+      )
+    for e, v, w in circuit:
+      yield '{}{} {}'.format(
+        'l' if e < n_real else 'm',
+        fmt.approx_delta(vertices[v].x, vertices[w].x),
+        fmt.approx_delta(vertices[v].y, vertices[w].y)
+      )
+    last = circuit[-1][2]
 
-  return { 'type1': ''.join(arc_set1), 'type2': ''.join(arc_set2) }
+def tiling_arcs_svg(tiling, precision):
+  '''Returns a dict mapping 'type1' and 'type2' to SVG path data drawing
+  the two kinds of arcs decorating the tiles of tiling (a P2 or P3 tiling).'''
+  return tiling_decoration_svg(tiling, tile_decoration.arcs, precision)
+
+def write_arcs_svg(f, tiling, precision, arc_type, buffer_size = _default_buffer_size):
+  '''Writes the path data for the arcs of type arc_type ('type1' or 'type2')
+  that tiling_arcs_svg() would return to the text file object f, in chunks
+  of about buffer_size characters. Each call makes a pass over the tiling.'''
+  if arc_type not in ('type1', 'type2'):
+    raise ValueError
+  _write_buffered(
+    f, (command for ty, command in _arc_commands(tiling, precision) if ty == arc_type), buffer_size
+  )
+
+def _arc_commands(tiling, precision):
+  # Yields (arc type, command) for the commands of the arcs' paths
+  return _decoration_commands(tiling, tile_decoration.arcs, precision)
+
+def _decoration_commands(tiling, decoration, precision):
+  # Yields (layer, command) for the commands of the decoration's paths
+  fmt = DecimalFormatter(precision)
+  for layer, shape in decoration.iter_shapes(tiling):
+    yield (layer, shape.svg_path(fmt))
+
+def tiling_decoration_svg(tiling, decoration, precision):
+  '''Returns a dict mapping each layer of decoration (a
+  tile_decoration.Decoration, such as tile_decoration.ammann_bars) to SVG
+  path data drawing that layer's shapes on the tiles of tiling.'''
+  layers = { layer: [] for layer in decoration.layers() }
+  for layer, command in _decoration_commands(tiling, decoration, precision):
+    layers[layer].append(command)
+  return { layer: ''.join(commands) for layer, commands in layers.items() }
+
+def write_decoration_svg(f, tiling, decoration, precision, layer, buffer_size = _default_buffer_size):
+  '''Writes the path data for the given layer of decoration that
+  tiling_decoration_svg() would return to the text file object f, in chunks
+  of about buffer_size characters.'''
+  if layer not in decoration.layers():
+    raise ValueError
+  _write_buffered(
+    f, (command for l, command in _decoration_commands(tiling, decoration, precision) if l == layer), buffer_size
+  )
+
+def _symbol_elements(tiling, precision, decorate, id_prefix):
+  # Yields the SVG elements that tiling_to_svg_symbols() returns
+  types, max_scale = [], 0.0
+  for t in tiling.iter_tiles():
+    if type(t) not in types:
+      types.append(type(t))
+    xf = t.curr_transform()
+    max_scale = max(max_scale, math.hypot(float(xf.a), float(xf.d)))
+  if not types:
+    return
+
+  # The prototiles' coordinates are scaled up by the tiles' transforms,
+  # so need more decimal places to be as accurate, as do the transforms'
+  # linear parts, which multiply coordinates up to about 2
+  extra = max(0, math.ceil(math.log10(max_scale))) if max_scale > 0 else 0
+  proto_fmt = DecimalFormatter(precision + extra)
+  linear_fmt, fmt = DecimalFormatter(precision + 1), DecimalFormatter(precision)
+
+  yield '<defs>\n'
+  for ty in sorted(types, key = lambda ty: penrose.tile_type_codes.get(ty, len(penrose.tile_types))):
+    proto = ty()
+    yield '<symbol id="{}{}" overflow="visible">'.format(id_prefix, ty.__name__)
+    yield '<path class="edges" d="M{}Z"/>'.format('L'.join(
+      '{} {}'.format(proto_fmt.approx(pt.x), proto_fmt.approx(pt.y)) for pt in proto.vertices()
+    ))
+    if decorate and ty in tile_decoration.arcs.tile_types():
+      for arc_type, arc in tile_decoration.arcs.template(ty):
+        yield '<path class="arcs-{}" d="{}"/>'.format(arc_type, arc.svg_path(proto_fmt))
+    yield '</symbol>\n'
+  yield '</defs>\n'
+
+  for t in tiling.iter_tiles(order = 'hilbert'):
+    # The tiles' transforms are similarities, so the matrix is
+    # (a -d c; d a f); the entries are rounded so that stays true
+    xf = t.curr_transform()
+    a, d = linear_fmt._decimal_approx(xf.a), linear_fmt._decimal_approx(xf.d)
+    a, d, minus_d = (linear_fmt._to_decimal_string(x) for x in (a, d, -d))
+    yield '<use href="#{}{}" transform="matrix({} {} {} {} {} {})"/>\n'.format(
+      id_prefix, type(t).__name__, a, d, minus_d, a, fmt.approx(xf.c), fmt.approx(xf.f)
+    )
+
+def tiling_to_svg_symbols(tiling, precision, decorate = True, id_prefix = 'tile-'):
+  '''Returns SVG elements drawing the tiles of tiling: a <defs> element
+  with a <symbol> for each type of tile, with the ID id_prefix followed by
+  the name of the tile's class, then a <use> element for each tile,
+  placing the symbol with the tile's transform. Each symbol holds a path of
+  class "edges" outlining the prototile and, if decorate is true and
+  the tile is a P2 or P3 tile, paths of classes "arcs-type1" and
+  "arcs-type2" with its arcs (see tiling_arcs_svg()). The paths are left
+  unstyled, to be styled by CSS or attributes on an enclosing element.
+  Note that strokes are scaled along with the symbols.
+
+  Positions are accurate to about precision decimal places.'''
+  return ''.join(_symbol_elements(tiling, precision, decorate, id_prefix))
+
+def write_svg_symbols(f, tiling, precision, decorate = True, id_prefix = 'tile-', buffer_size = _default_buffer_size):
+  '''Writes the SVG elements that tiling_to_svg_symbols() would return to
+  the text file object f, in chunks of about buffer_size characters.'''
+  _write_buffered(f, _symbol_elements(tiling, precision, decorate, id_prefix), buffer_size)
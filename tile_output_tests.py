@@ -0,0 +1,151 @@
+# MIT-licensed; see LICENSE for details
+
+import io, math, re
+from fractions import Fraction
+from unittest import TestCase
+import tile_output as to
+from tile_manager import TileManager
+import penrose as p
+import pen_num as pn
+import tile_decoration as td
+from pen_num import phi
+
+def _sun():
+  tm = TileManager()
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(p.KiteTile().scale(phi).rotate(i))
+  return tm.decompose('to-A').decompose('half-deflation').decompose('half-deflation').decompose('to-P2')
+
+def _path_edges(d):
+  # Returns (list of the drawn edges, number of moves) for the path data d,
+  # with coordinates in thousandths
+  edges, moves, x, y = [], 0, 0, 0
+  for cmd, dx, dy in re.findall(r'([Mml])(-?[0-9.]+) (-?[0-9.]+)', d):
+    dx, dy = round(float(dx) * 1000), round(float(dy) * 1000)
+    if cmd == 'M':
+      x, y = dx, dy
+      continue
+    if cmd == 'l':
+      edges.append(tuple(sorted([(x, y), (x + dx, y + dy)])))
+    else:
+      moves += 1
+    x, y = x + dx, y + dy
+  return (edges, moves)
+
+class _RecordingFile(io.StringIO):
+  def __init__(self):
+    super().__init__()
+    self.sizes = []
+
+  def write(self, s):
+    self.sizes.append(len(s))
+    return super().write(s)
+
+class TestStreamingOutput(TestCase):
+  def test_svg_path(self):
+    tm = _sun()
+    f = _RecordingFile()
+    to.write_svg_path(f, tm, 3, buffer_size = 100)
+    self.assertEqual(f.getvalue(), to.tiling_to_svg_path(tm, 3))
+    self.assertGreater(len(f.sizes), 1)
+    # Each chunk is at most one command longer than the buffer
+    self.assertLess(max(f.sizes), 100 + 30)
+
+  def test_arcs(self):
+    tm = _sun()
+    arcs = to.tiling_arcs_svg(tm, 3)
+    for arc_type in ['type1', 'type2']:
+      f = _RecordingFile()
+      to.write_arcs_svg(f, tm, 3, arc_type, buffer_size = 100)
+      self.assertEqual(f.getvalue(), arcs[arc_type])
+      self.assertLess(max(f.sizes), 100 + 60)
+    self.assertRaises(ValueError, to.write_arcs_svg, io.StringIO(), tm, 3, 'type3')
+
+  def test_decoration(self):
+    tm = _sun()
+    bars = to.tiling_decoration_svg(tm, td.ammann_bars, 3)
+    self.assertEqual(list(bars), ['bars'])
+    self.assertEqual(bars['bars'].count('L'), 5 * tm.count())
+    f = _RecordingFile()
+    to.write_decoration_svg(f, tm, td.ammann_bars, 3, 'bars', buffer_size = 100)
+    self.assertEqual(f.getvalue(), bars['bars'])
+    self.assertRaises(ValueError, to.write_decoration_svg, io.StringIO(), tm, td.ammann_bars, 3, 'type1')
+
+  def test_empty(self):
+    self.assertEqual(to.tiling_to_svg_path(TileManager(), 3), '')
+    self.assertEqual(to.tiling_arcs_svg(TileManager(), 3), { 'type1': '', 'type2': '' })
+
+class TestTrails(TestCase):
+  def test_draws_each_edge_once(self):
+    tm = _sun()
+    greedy, greedy_moves = _path_edges(to.tiling_to_svg_path(tm, 3))
+    trails, trail_moves = _path_edges(to.tiling_to_svg_path(tm, 3, method = 'trails'))
+    self.assertEqual(len(set(trails)), len(trails))
+    self.assertEqual(sorted(trails), sorted(greedy))
+    self.assertLess(trail_moves, greedy_moves)
+
+  def test_fewest_trails(self):
+    tm = _sun()
+    _, edges, adjacent = to._edge_graph(tm)
+    n_odd = sum(1 for adj in adjacent if len(adj) % 2 == 1)
+    # The tiling is connected, so it takes n_odd/2 trails
+    _, moves = _path_edges(to.tiling_to_svg_path(tm, 3, method = 'trails'))
+    self.assertEqual(moves, n_odd // 2 - 1)
+
+  def test_streaming(self):
+    tm = _sun()
+    f = io.StringIO()
+    to.write_svg_path(f, tm, 3, method = 'trails')
+    self.assertEqual(f.getvalue(), to.tiling_to_svg_path(tm, 3, method = 'trails'))
+    self.assertEqual(to.tiling_to_svg_path(TileManager(), 3, method = 'trails'), '')
+    self.assertRaises(ValueError, to.tiling_to_svg_path, tm, 3, 'shortest')
+
+class TestSymbols(TestCase):
+  def test_uses_place_tiles(self):
+    tm = _sun()
+    svg = to.tiling_to_svg_symbols(tm, 3)
+    uses = re.findall(r'<use href="#tile-(\w+)" transform="matrix\(([^)]*)\)"/>', svg)
+    self.assertEqual(len(uses), tm.count())
+    # The uses are in the same order as the tiles
+    for (name, matrix), t in zip(uses, tm.iter_tiles(order = 'hilbert')):
+      a, b, c, d, e, f = (float(x) for x in matrix.split())
+      self.assertIs(getattr(p, name), type(t))
+      for v, tv in zip(type(t)().vertices(), t.vertices()):
+        x, y = float(v.x), float(v.y)
+        self.assertAlmostEqual(a*x + c*y + e, float(tv.x), delta = 0.005)
+        self.assertAlmostEqual(b*x + d*y + f, float(tv.y), delta = 0.005)
+
+  def test_symbols(self):
+    tm = _sun()
+    svg = to.tiling_to_svg_symbols(tm, 3, id_prefix = 'x-')
+    self.assertEqual(re.findall(r'<symbol id="([^"]*)"', svg), ['x-KiteTile', 'x-DartTile'])
+    self.assertEqual(svg.count('class="arcs-type1"'), 2)
+    plain = to.tiling_to_svg_symbols(tm, 3, decorate = False)
+    self.assertEqual(plain.count('class="arcs-'), 0)
+    self.assertEqual(plain.count('class="edges"'), 2)
+    f = _RecordingFile()
+    to.write_svg_symbols(f, tm, 3, buffer_size = 100)
+    self.assertEqual(f.getvalue(), to.tiling_to_svg_symbols(tm, 3))
+    self.assertEqual(to.tiling_to_svg_symbols(TileManager(), 3), '')
+
+class TestDecimalFormatter(TestCase):
+  def test_matches_exact_floor(self):
+    xs = [pn.Number(Fraction(k, 1000)) for k in range(-50, 50)]
+    xs += [pn.Number(Fraction(k, 7)) * phi for k in range(-50, 50)]
+    # Just either side of a multiple of 1/1000
+    xs += [pn.Number(Fraction(1, 1000)) + d * pn.Number(Fraction(1, 10**12)) * phi for d in [-1, 1]]
+    fmt = to.DecimalFormatter(3)
+    for x in xs:
+      self.assertEqual(fmt._decimal_approx(x), math.floor(x * 1000))
+    self.assertEqual(fmt.approx(pn.Number(Fraction(-1, 1000))), '-0.001')
+    self.assertEqual(fmt.approx_delta(pn.Number(Fraction(1, 2)), pn.Number(2)), '1.5')
+
+  def test_cache(self):
+    fmt = to.DecimalFormatter(3, cache_size = 2)
+    a, b, c = pn.Number(1), pn.Number(2), pn.Number(3)
+    for x in [a, b, a, c, b, a]:
+      fmt.approx(x)
+    # b is evicted by c, as a was used more recently
+    self.assertEqual(fmt.cache_info(), to.CacheInfo(1, 5, 2, 2))
+    self.assertRaises(TypeError, to.DecimalFormatter, 3.0)
+    self.assertRaises(ValueError, to.DecimalFormatter, 0)
@@ -0,0 +1,180 @@
+'''Writing tilings out as multi-resolution pyramids of image tiles, for
+viewing with "slippy map" viewers'''
+
+# MIT-licensed; see LICENSE for details
+
+# At zoom level z, the square around the tiling is cut into 2**z by 2**z
+# image tiles, written to out_dir/z/x/y.png (or .svg), with y counting down
+# from the top, as slippy maps expect; image tiles with no tiles in them are
+# left out. Given a seed and a depth, each zoom level is drawn from the
+# shallowest deflation of the seed whose tiles' edges are at most
+# max_edge_pixels long there, so the coarse levels don't need the whole
+# deep tiling.
+#
+# The image tiles are rendered in square chunks of them: the tiles in each
+# chunk are found by a spatial query on the tiling, and handed (in tile_io's
+# format) to a worker, which queries them again for each image tile.
+
+import os
+from collections import deque
+from fractions import Fraction
+from math import ceil, log10
+import pen_geom as pg
+import tile_io, tile_output, tile_raster
+from tile_decoration import transform_scale
+from tile_manager import TileManager
+
+# Size, in image tiles, of the side of the chunks that are rendered together
+_chunk_side = 8
+
+# Number of chunks per worker process that may be queued or being rendered
+# at once
+_pending_per_process = 2
+
+def deflation_levels(seed, depth, decomp_id = 'half-deflation'):
+  '''Yields the TileManager seed and then its first depth decompositions by
+  decomp_id, each decomposing the one before; only the last level yielded
+  is kept.'''
+  tm = seed
+  yield tm
+  for i in range(depth):
+    tm = tm.decompose(decomp_id)
+    yield tm
+
+def _edge_length(tm):
+  # The length of the long edges of the tiles of tm, as a float, assuming
+  # they're all of the same size
+  t = next(tm.iter_tiles(), None)
+  return 0.0 if t is None else float(transform_scale(t.curr_transform()))
+
+def zoom_levels(levels, max_zoom, pixels_per_unit, max_edge_pixels):
+  '''Yields (zoom, level) for zoom levels 0 to max_zoom, where level is the
+  first of the iterable levels (of successively deeper deflations) whose
+  tiles' edges would be drawn at most max_edge_pixels long at that zoom, or
+  the last if none would; pixels_per_unit is the scale at zoom level 0.
+  Since deeper zoom levels need deeper levels, levels is only advanced, so
+  each level can be dropped once the zoom levels have gone past it.'''
+  levels = iter(levels)
+  level = next(levels)
+  length = _edge_length(level)
+  for z in range(max_zoom + 1):
+    scale = pixels_per_unit * 2 ** z
+    while length * scale > max_edge_pixels:
+      deeper = next(levels, None)
+      if deeper is None:
+        break
+      level, length = deeper, _edge_length(deeper)
+    yield (z, level)
+
+def _svg_tile(f, tm, rect, tile_size, precision):
+  # Writes an SVG image of the tiles in tm that shows the Rectangle rect
+  min_x, max_y = float(rect.min_x), float(rect.max_y)
+  k = tile_size / float(rect.max_x - rect.min_x)
+  f.write('<?xml version="1.0"?>\n')
+  f.write('<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{0}" viewBox="0 0 {0} {0}">\n'.format(tile_size))
+  f.write('<style>path {{ vector-effect: non-scaling-stroke; stroke: #333; stroke-width: 1; }} use {{ fill: #{:02x}{:02x}{:02x}; }}'.format(*tile_raster._other_color))
+  for ty, color in tile_raster.default_colors.items():
+    f.write(' use[href="#tile-{}"] {{ fill: #{:02x}{:02x}{:02x}; }}'.format(ty.__name__, *color))
+  f.write('</style>\n')
+  f.write('<g transform="matrix({0} 0 0 {1} {2} {3})">\n'.format(
+    round(k, 9), round(-k, 9), round(-k * min_x, 6), round(k * max_y, 6)
+  ))
+  tile_output.write_svg_symbols(f, tm, precision, decorate = False)
+  f.write('</g>\n</svg>\n')
+
+def _render_chunk(args):
+  # Renders the image tiles of a chunk from the tiles in it, given in
+  # tile_io's format; returns the number of image tiles written
+  out_dir, fmt, z, x_range, y_range, rects, data, tile_size, precision = args
+  chunk = tile_io.loads(data, symmetry = None)
+  written = 0
+  for x, y, rect in zip(x_range, y_range, rects):
+    tiles = chunk.tiles_in_rect(rect)
+    if not tiles:
+      continue
+    tm = TileManager()
+    tm.add_tiles(tiles, trusted = True)
+    tile_dir = os.path.join(out_dir, str(z), str(x))
+    os.makedirs(tile_dir, exist_ok = True)
+    path = os.path.join(tile_dir, '{}.{}'.format(y, fmt))
+    if fmt == 'png':
+      view = (float(rect.min_x), float(rect.min_y), float(rect.max_x), float(rect.max_y))
+      tile_raster.save_png(path, tm, tile_size, height = tile_size, view = view)
+    else:
+      with open(path, 'w') as f:
+        _svg_tile(f, tm, rect, tile_size, precision)
+    written += 1
+  return written
+
+def _chunk_jobs(out_dir, fmt, z, level, square, tile_size):
+  # Yields the arguments to _render_chunk for the chunks at zoom z
+  n = 2 ** z
+  min_x, max_y, side = square
+  precision = max(1, ceil(log10(tile_size * n / float(side))) + 1)
+
+  def rect(x0, y0, x1, y1):
+    # The Rectangle covering image tiles x0 to x1 - 1 and y0 to y1 - 1
+    return pg.Rectangle(
+      min_x + Fraction(x0, n) * side, max_y - Fraction(y1, n) * side,
+      min_x + Fraction(x1, n) * side, max_y - Fraction(y0, n) * side
+    )
+
+  c = min(n, _chunk_side)
+  for cx in range(0, n, c):
+    for cy in range(0, n, c):
+      tiles = level.tiles_in_rect(rect(cx, cy, cx + c, cy + c))
+      if not tiles:
+        continue
+      cells = [(x, y) for x in range(cx, cx + c) for y in range(cy, cy + c)]
+      yield (
+        out_dir, fmt, z, [x for x, _ in cells], [y for _, y in cells],
+        [rect(x, y, x + 1, y + 1) for x, y in cells],
+        tile_io.dumps(tiles), tile_size, precision
+      )
+
+def write_pyramid(out_dir, tiling, max_zoom, depth = None, fmt = 'png', tile_size = 256,
+    max_edge_pixels = 32, processes = 1):
+  '''Writes zoom levels 0 to max_zoom of a pyramid of images of tiling (a
+  TileManager) to out_dir, as out_dir/z/x/y.fmt, where fmt is 'png' or
+  'svg', each image being tile_size pixels square. Returns the number of
+  images written.
+
+  If depth is given, tiling is taken as a seed, and each zoom level is drawn
+  from the shallowest of its first depth half-deflations that has tiles
+  with edges at most max_edge_pixels long at that zoom (or from the deepest,
+  for zoom levels where none do). If processes > 1, chunks of images are
+  rendered in parallel by that many worker processes.'''
+  if fmt not in ('png', 'svg'):
+    raise ValueError
+  if not (isinstance(max_zoom, int) and isinstance(tile_size, int)):
+    raise TypeError
+  if max_zoom < 0 or tile_size < 1:
+    raise ValueError
+  bb = tiling.bbox()
+  if bb is None:
+    raise ValueError
+  # The square around the tiling that zoom level 0 shows, as its left and
+  # top edges and its side
+  side = max(bb.max_x - bb.min_x, bb.max_y - bb.min_y)
+  square = (bb.min_x, bb.max_y, side)
+  levels = [tiling] if depth is None else deflation_levels(tiling, depth)
+
+  def jobs():
+    for z, level in zoom_levels(levels, max_zoom, tile_size / float(side), max_edge_pixels):
+      yield from _chunk_jobs(out_dir, fmt, z, level, square, tile_size)
+
+  if processes <= 1:
+    return sum(_render_chunk(job) for job in jobs())
+
+  # Chunks are submitted as earlier ones finish, so that only a few chunks'
+  # tiles are held at once
+  from concurrent.futures import ProcessPoolExecutor
+  written, pending = 0, deque()
+  with ProcessPoolExecutor(processes) as pool:
+    for job in jobs():
+      if len(pending) >= _pending_per_process * processes:
+        written += pending.popleft().result()
+      pending.append(pool.submit(_render_chunk, job))
+    while pending:
+      written += pending.popleft().result()
+  return written
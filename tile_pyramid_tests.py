@@ -0,0 +1,89 @@
+# MIT-licensed; see LICENSE for details
+
+import os, shutil, tempfile
+from unittest import TestCase
+import tile_pyramid as tpy
+import penrose as p
+from tile_manager import TileManager
+from pen_num import phi
+from tile_raster_tests import _decode
+
+def _seed():
+  tm = TileManager()
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(p.KiteTile().scale(phi * phi).rotate(i))
+  return tm.decompose('to-A')
+
+def _files(out_dir):
+  # The files under out_dir, as paths relative to it
+  return sorted(
+    os.path.relpath(os.path.join(d, name), out_dir)
+    for d, _, names in os.walk(out_dir) for name in names
+  )
+
+class TestPyramid(TestCase):
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def test_zoom_levels(self):
+    levels = list(tpy.deflation_levels(_seed(), 2))
+    lengths = [tpy._edge_length(l) for l in levels]
+    self.assertTrue(lengths[0] >= lengths[1] >= lengths[2] and lengths[0] > lengths[2])
+    ppu = 10 / lengths[0]
+    for z, level in tpy.zoom_levels(levels, 4, ppu, 10):
+      fits = [i for i, length in enumerate(lengths) if length * ppu * 2 ** z <= 10]
+      self.assertIs(level, levels[fits[0] if fits else -1])
+    # Levels are only taken from the iterator as they're needed
+    it = iter(levels)
+    self.assertEqual([l for _, l in tpy.zoom_levels(it, 0, ppu, 10)], levels[:1])
+    self.assertIs(next(it), levels[1])
+
+  def test_png(self):
+    seed = _seed()
+    n = tpy.write_pyramid(self.dir, seed, 2, depth = 3, tile_size = 32)
+    files = _files(self.dir)
+    self.assertEqual(len(files), n)
+    # The sun is centred in the square of zoom level 0, so covers all of
+    # the image tiles down to zoom level 2
+    self.assertEqual(n, 1 + 4 + 16)
+    self.assertIn(os.path.join('2', '3', '1.png'), files)
+    for name in files:
+      with open(os.path.join(self.dir, name), 'rb') as f:
+        self.assertEqual(_decode(f.read())[:2], (32, 32))
+
+  def test_svg_and_parallel(self):
+    tm = _seed().decompose('half-deflation')
+    n = tpy.write_pyramid(self.dir, tm, 1, fmt = 'svg', tile_size = 64)
+    files = _files(self.dir)
+    self.assertEqual(len(files), n)
+    with open(os.path.join(self.dir, '0', '0', '0.svg')) as f:
+      svg = f.read()
+    self.assertTrue(svg.endswith('</svg>\n'))
+    self.assertEqual(svg.count('<use '), tm.count())
+    other = tempfile.mkdtemp()
+    try:
+      self.assertEqual(tpy.write_pyramid(other, tm, 1, fmt = 'svg', tile_size = 64, processes = 2), n)
+      for name in files:
+        with open(os.path.join(self.dir, name)) as f1, open(os.path.join(other, name)) as f2:
+          self.assertEqual(f1.read(), f2.read())
+    finally:
+      shutil.rmtree(other)
+
+  def test_levels(self):
+    seed = _seed()
+    levels = list(tpy.deflation_levels(seed, 2))
+    self.assertEqual([l.count() for l in levels], [seed.count(), seed.decompose('half-deflation').count(),
+      seed.decompose('half-deflation').decompose('half-deflation').count()])
+    # Coarse zoom levels are drawn from shallow deflations
+    tpy.write_pyramid(self.dir, seed, 3, depth = 2, fmt = 'svg', tile_size = 16, max_edge_pixels = 64)
+    with open(os.path.join(self.dir, '0', '0', '0.svg')) as f:
+      self.assertEqual(f.read().count('<use '), seed.count())
+
+  def test_errors(self):
+    self.assertRaises(ValueError, tpy.write_pyramid, self.dir, _seed(), 1, fmt = 'gif')
+    self.assertRaises(ValueError, tpy.write_pyramid, self.dir, _seed(), -1)
+    self.assertRaises(TypeError, tpy.write_pyramid, self.dir, _seed(), 1.0)
+    self.assertRaises(ValueError, tpy.write_pyramid, self.dir, TileManager(), 1)
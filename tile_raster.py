@@ -0,0 +1,353 @@
+'''Rendering tilings to PNG images, in pure Python'''
+
+# MIT-licensed; see LICENSE for details
+
+# The image is cut into bands of _band_rows rows. The tiles are converted to
+# floating-point polygons in pixel coordinates one at a time, and put in a
+# bucket for each band they cross; once the buckets hold more than
+# _max_held_shapes polygons, they're pickled out to a temporary file, to be
+# read back a band at a time. Then each band is scan-converted a row at a
+# time: each row holds the polygons that it crosses (found by sorting the
+# band's polygons by their top rows), filled with the colour for their tile
+# type, then the tiles' edges, drawn as thin filled quadrilaterals. Rows are
+# compressed and written out as they're done. So only one band's polygons
+# and one row of pixels are held in memory at a time, however many tiles
+# there are. Pixels are either in a polygon or not (by whether their
+# centres are); there's no anti-aliasing.
+#
+# To render in parallel, the bands are each compressed by a worker process
+# into a raw deflate stream ending on a byte boundary. Such streams can be
+# concatenated into one, so the PNG's zlib stream is just a header, the
+# bands' streams, and the Adler-32 checksum of all of the rows, which is
+# combined from the bands' checksums.
+
+import pickle, struct, tempfile, zlib
+from collections import deque
+from math import ceil, hypot
+import penrose as p
+
+default_colors = {
+  p.KiteTile: (0xf4, 0xa2, 0x61),
+  p.DartTile: (0x2a, 0x9d, 0x8f),
+  p.ThickRhomb: (0xe9, 0xc4, 0x6a),
+  p.ThinRhomb: (0x26, 0x46, 0x53),
+  p.A_K1: (0xf4, 0xa2, 0x61),
+  p.A_K2: (0xe7, 0x6f, 0x51),
+  p.A_D1: (0x2a, 0x9d, 0x8f),
+  p.A_D2: (0x21, 0x7a, 0x6f),
+  p.B_L1: (0xe9, 0xc4, 0x6a),
+  p.B_L2: (0xd4, 0xa3, 0x3a),
+  p.B_S1: (0x26, 0x46, 0x53),
+  p.B_S2: (0x3d, 0x64, 0x73),
+}
+'''The colour (r, g, b) that tiles of each type are filled with by default.'''
+
+_other_color = (0x99, 0x99, 0x99)
+
+_png_signature = b'\x89PNG\r\n\x1a\n'
+
+# Size of the IDAT chunks to write
+_chunk_size = 1 << 16
+
+# Zlib header for a deflate stream with a 32K window and default compression
+_zlib_header = b'\x78\x9c'
+
+_adler_base = 65521
+
+# Number of rows of pixels in each band of the image
+_band_rows = 64
+
+# Number of polygons that may be held in the bands' buckets before they're
+# spilled to a temporary file
+_max_held_shapes = 1 << 16
+
+# Number of bands per worker process that may be queued or being compressed
+# at once
+_pending_per_process = 2
+
+def adler32_combine(adler1, adler2, len2):
+  '''Returns the Adler-32 checksum of the concatenation of two byte strings,
+  given the checksums adler1 and adler2 of the two and the length len2 of
+  the second.'''
+  a1, b1 = adler1 & 0xffff, adler1 >> 16
+  a2, b2 = adler2 & 0xffff, adler2 >> 16
+  a = (a1 + a2 - 1) % _adler_base
+  b = (b1 + b2 + len2 * (a1 - 1)) % _adler_base
+  return (b << 16) | a
+
+def _float_polygons(tiling):
+  # Yields (tile type, list of float vertices) for the tiles of tiling: a
+  # TileManager, a TileStore or MappedTileStore (without creating tile
+  # objects), or an iterable of tiles
+  if hasattr(tiling, 'float_vertices'):
+    for k in range(len(tiling)):
+      yield (tiling.tile_type(k), tiling.float_vertices(k))
+    return
+  tiles = tiling.iter_tiles() if hasattr(tiling, 'iter_tiles') else tiling
+  for t in tiles:
+    yield (type(t), [(float(pt.x), float(pt.y)) for pt in t.vertices()])
+
+def _edge_quad(x0, y0, x1, y1, half_width):
+  # The quadrilateral covering the line from (x0, y0) to (x1, y1), of width
+  # 2 * half_width
+  length = hypot(x1 - x0, y1 - y0)
+  if length == 0:
+    return None
+  nx, ny = (y0 - y1) * half_width / length, (x1 - x0) * half_width / length
+  return [(x0 + nx, y0 + ny), (x1 + nx, y1 + ny), (x1 - nx, y1 - ny), (x0 - nx, y0 - ny)]
+
+def _shape(pts, color):
+  # A polygon to fill, as (first row, last row, colour, vertices)
+  ys = [y for _, y in pts]
+  return (ceil(min(ys) - 0.5), ceil(max(ys) - 0.5) - 1, color, pts)
+
+def _pixel_shapes(polygons, view, width, height, colors, line_color, line_width):
+  # Yields (layer, shape) for the shapes to fill that are in the image, in
+  # pixel coordinates (with y increasing downwards): the tiles in layer 0,
+  # and their edges, drawn over them, in layer 1
+  min_x, min_y, max_x, max_y = view
+  scale = min(width / (max_x - min_x), height / (max_y - min_y))
+  # Center the view in the image
+  x0 = (width - scale * (max_x - min_x)) / 2 - scale * min_x
+  y0 = (height - scale * (max_y - min_y)) / 2 + scale * max_y
+
+  for ty, vertices in polygons:
+    pts = [(x0 + scale * x, y0 - scale * y) for x, y in vertices]
+    color = bytes(colors.get(ty, _other_color))
+    shapes = [(0, _shape(pts, color))]
+    if line_width > 0:
+      for (xa, ya), (xb, yb) in zip(pts, pts[1:] + pts[:1]):
+        quad = _edge_quad(xa, ya, xb, yb, line_width / 2)
+        if quad is not None:
+          shapes.append((1, _shape(quad, line_color)))
+    for layer, s in shapes:
+      if s[1] >= 0 and s[0] < height:
+        yield (layer, s)
+
+class _Bands:
+  # Buckets of the shapes crossing each band of the image, in two layers,
+  # spilled to a temporary file when they get too large
+
+  def __init__(self, height):
+    self._height = height
+    n = (height + _band_rows - 1) // _band_rows
+    self._held = [([], []) for _ in range(n)]
+    self._n_held = 0
+    # The (offset, length) of the pickled chunks of each band's shapes in
+    # the temporary file
+    self._spilled = [[] for _ in range(n)]
+    self._file = None
+
+  def __len__(self):
+    return len(self._held)
+
+  def add(self, layer, shape):
+    first = max(0, shape[0]) // _band_rows
+    last = min(len(self._held) - 1, shape[1] // _band_rows)
+    for b in range(first, last + 1):
+      self._held[b][layer].append(shape)
+    self._n_held += last - first + 1
+    if self._n_held > _max_held_shapes:
+      self._spill()
+
+  def _spill(self):
+    if self._file is None:
+      self._file = tempfile.TemporaryFile()
+    f = self._file
+    for b, layers in enumerate(self._held):
+      if layers[0] or layers[1]:
+        data = pickle.dumps(layers, pickle.HIGHEST_PROTOCOL)
+        self._spilled[b].append((f.tell(), len(data)))
+        f.write(data)
+        self._held[b] = ([], [])
+    self._n_held = 0
+
+  def take(self, b):
+    # Returns (layers, first row, row after the last) for band b, and
+    # forgets its shapes
+    fills, lines = [], []
+    for offset, length in self._spilled[b]:
+      self._file.seek(offset)
+      spilled = pickle.loads(self._file.read(length))
+      fills += spilled[0]
+      lines += spilled[1]
+    held = self._held[b]
+    fills += held[0]
+    lines += held[1]
+    self._spilled[b], self._held[b] = [], ([], [])
+    return ([fills, lines], b * _band_rows, min(self._height, (b + 1) * _band_rows))
+
+  def close(self):
+    if self._file is not None:
+      self._file.close()
+      self._file = None
+
+def _fill_row(row, width, yc, pts, color):
+  # Fills the pixels of row (after its filter type byte) whose centres are
+  # inside the polygon pts at height yc, by the even-odd rule
+  xs = []
+  xa, ya = pts[-1]
+  for xb, yb in pts:
+    if (ya <= yc) != (yb <= yc):
+      xs.append(xa + (yc - ya) * (xb - xa) / (yb - ya))
+    xa, ya = xb, yb
+  xs.sort()
+  for i in range(0, len(xs) - 1, 2):
+    start, end = max(0, ceil(xs[i] - 0.5)), min(width, ceil(xs[i+1] - 0.5))
+    if end > start:
+      row[1+3*start:1+3*end] = color * (end - start)
+
+def _rows(layers, width, start, stop, background):
+  # Yields the rows start to stop - 1 of the image, each as a bytearray
+  # starting with the PNG filter type (none), given the shapes crossing them
+  layers = [sorted(layer, key = lambda s: s[0]) for layer in layers]
+  next_shape = [0] * len(layers)
+  active = [[] for _ in layers]
+  blank = b'\x00' + bytes(background) * width
+  for r in range(start, stop):
+    row = bytearray(blank)
+    yc = r + 0.5
+    for i, layer in enumerate(layers):
+      k = next_shape[i]
+      while k < len(layer) and layer[k][0] <= r:
+        active[i].append(layer[k])
+        k += 1
+      next_shape[i] = k
+      active[i] = [s for s in active[i] if s[1] >= r]
+      for _, _, color, pts in active[i]:
+        _fill_row(row, width, yc, pts, color)
+    yield row
+
+def _compress_band(args):
+  # Returns (raw deflate stream, Adler-32 checksum, length) for the rows of
+  # a band of the image; the stream is final for the last band
+  layers, width, start, stop, background, last = args
+  compressor = zlib.compressobj(wbits = -15)
+  out, adler, length = [], 1, 0
+  for row in _rows(layers, width, start, stop, background):
+    adler = zlib.adler32(row, adler)
+    length += len(row)
+    out.append(compressor.compress(row))
+  out.append(compressor.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH))
+  return (b''.join(out), adler, length)
+
+class _PNGWriter:
+  # Writes a PNG file's chunks, buffering the image data into IDAT chunks
+
+  def __init__(self, f, width, height):
+    self._f = f
+    self._buf = bytearray()
+    f.write(_png_signature)
+    # 8-bit RGB, no interlacing
+    self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+  def _chunk(self, kind, data):
+    self._f.write(struct.pack('>I', len(data)) + kind + data)
+    self._f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+  def write(self, data):
+    self._buf += data
+    while len(self._buf) >= _chunk_size:
+      self._chunk(b'IDAT', bytes(self._buf[:_chunk_size]))
+      del self._buf[:_chunk_size]
+
+  def close(self):
+    if self._buf:
+      self._chunk(b'IDAT', bytes(self._buf))
+    self._chunk(b'IEND', b'')
+
+def write_png(f, tiling, width, height = None, view = None, colors = None,
+    background = (255, 255, 255), line_color = (0x33, 0x33, 0x33), line_width = 1.0, processes = 1):
+  '''Writes a PNG image of tiling (a TileManager, TileStore, MappedTileStore
+  or iterable of tiles) to the binary file object f.
+
+  The image is width pixels wide, and shows the rectangle view, given as
+  floats (min_x, min_y, max_x, max_y), by default the bounding box of the
+  tiles, centred and scaled to fit. If height isn't given, it's chosen to
+  fit view. Tiles are filled with the colours (r, g, b) in the dict colors
+  (by default default_colors) for their types, and have their edges drawn
+  in line_color, line_width pixels wide (or not at all, if that's 0).
+
+  The tiles are read once, and sorted into bands of the image, which are
+  spilled to a temporary file if there are many tiles, so the memory used
+  doesn't grow with the number of tiles; except that if tiling is an
+  iterable of tiles and view isn't given, all of them are held, to find
+  their bounding box first.
+
+  If processes > 1, bands of the image are rendered in parallel by that
+  many worker processes.'''
+  if not isinstance(width, int) or not (height is None or isinstance(height, int)):
+    raise TypeError
+  if width < 1 or (height is not None and height < 1):
+    raise ValueError
+  colors = default_colors if colors is None else colors
+
+  polygons = _float_polygons(tiling)
+  if view is None and hasattr(tiling, 'bbox'):
+    bb = tiling.bbox()
+    if bb is None:
+      raise ValueError
+    view = bb if isinstance(bb, tuple) else (bb.min_x, bb.min_y, bb.max_x, bb.max_y)
+  elif view is None:
+    polygons = list(polygons)
+    if not polygons:
+      raise ValueError
+    xs = [x for _, vs in polygons for x, _ in vs]
+    ys = [y for _, vs in polygons for _, y in vs]
+    view = (min(xs), min(ys), max(xs), max(ys))
+  min_x, min_y, max_x, max_y = (float(x) for x in view)
+  if not (max_x > min_x and max_y > min_y):
+    raise ValueError
+  if height is None:
+    height = max(1, round(width * (max_y - min_y) / (max_x - min_x)))
+
+  bands = _Bands(height)
+  try:
+    for layer, s in _pixel_shapes(polygons, (min_x, min_y, max_x, max_y), width, height,
+        colors, bytes(line_color), line_width):
+      bands.add(layer, s)
+    del polygons
+    _write_bands(_PNGWriter(f, width, height), bands, width, background, processes)
+  finally:
+    bands.close()
+
+def _write_bands(png, bands, width, background, processes):
+  # Writes the image data of the _Bands bands to the _PNGWriter png, and
+  # closes it
+  if processes <= 1:
+    compressor = zlib.compressobj()
+    for b in range(len(bands)):
+      layers, start, stop = bands.take(b)
+      for row in _rows(layers, width, start, stop, background):
+        png.write(compressor.compress(row))
+    png.write(compressor.flush())
+    png.close()
+    return
+
+  # Bands are submitted as earlier ones finish, so that only a few bands'
+  # shapes are held at once
+  from concurrent.futures import ProcessPoolExecutor
+  png.write(_zlib_header)
+  adler, pending = 1, deque()
+
+  def write_next():
+    nonlocal adler
+    data, band_adler, length = pending.popleft().result()
+    png.write(data)
+    adler = adler32_combine(adler, band_adler, length)
+
+  with ProcessPoolExecutor(processes) as pool:
+    for b in range(len(bands)):
+      if len(pending) >= _pending_per_process * processes:
+        write_next()
+      layers, start, stop = bands.take(b)
+      pending.append(pool.submit(_compress_band, (layers, width, start, stop, background, b == len(bands) - 1)))
+    while pending:
+      write_next()
+  png.write(struct.pack('>I', adler))
+  png.close()
+
+def save_png(path, tiling, width, **kwargs):
+  '''Writes a PNG image of tiling to a new file at path; see write_png().'''
+  with open(path, 'wb') as f:
+    write_png(f, tiling, width, **kwargs)
@@ -0,0 +1,102 @@
+# MIT-licensed; see LICENSE for details
+
+import io, random, struct, zlib
+from unittest import TestCase
+import tile_raster as tr
+import penrose as p
+from tile_manager import TileManager
+from tile_store import TileStore
+from pen_num import phi
+
+def _sun():
+  tm = TileManager()
+  for i in [-1, 3, 7, 11, 15]:
+    tm.add_tile(p.KiteTile().scale(phi).rotate(i))
+  return tm.decompose('to-A').decompose('half-deflation').decompose('half-deflation').decompose('to-P2')
+
+def _decode(data):
+  # Returns (width, height, rows of pixels) for the PNG data
+  if data[:8] != b'\x89PNG\r\n\x1a\n':
+    raise ValueError
+  pos, idat, chunks = 8, b'', []
+  while pos < len(data):
+    n, = struct.unpack('>I', data[pos:pos+4])
+    kind, body = data[pos+4:pos+8], data[pos+8:pos+8+n]
+    crc, = struct.unpack('>I', data[pos+8+n:pos+12+n])
+    if crc != zlib.crc32(kind + body):
+      raise ValueError
+    chunks.append(kind)
+    if kind == b'IHDR':
+      width, height = struct.unpack('>II', body[:8])
+    elif kind == b'IDAT':
+      idat += body
+    pos += 12 + n
+  if chunks[0] != b'IHDR' or chunks[-1] != b'IEND':
+    raise ValueError
+  raw = zlib.decompress(idat)
+  stride = 1 + 3 * width
+  if len(raw) != height * stride:
+    raise ValueError
+  rows = [raw[r*stride+1:(r+1)*stride] for r in range(height)]
+  return (width, height, rows)
+
+def _render(tiling, width, **kwargs):
+  f = io.BytesIO()
+  tr.write_png(f, tiling, width, **kwargs)
+  return _decode(f.getvalue())
+
+class TestRaster(TestCase):
+  def test_adler32_combine(self):
+    rng = random.Random(1)
+    for n1, n2 in [(0, 5), (7, 0), (100, 3), (70000, 123456)]:
+      d1, d2 = rng.randbytes(n1), rng.randbytes(n2)
+      self.assertEqual(tr.adler32_combine(zlib.adler32(d1), zlib.adler32(d2), n2), zlib.adler32(d1 + d2))
+
+  def test_fills(self):
+    tm = _sun()
+    view = (-3.0, -3.0, 3.0, 3.0)
+    width, height, rows = _render(tm, 120, view = view, line_width = 0)
+    self.assertEqual((width, height), (120, 120))
+    # The corners are outside the sun, and the pixel at each tile's centroid
+    # is in it
+    self.assertEqual(rows[0][0:3], b'\xff\xff\xff')
+    for t in tm.iter_tiles():
+      vs = t.vertices()
+      cx = sum(float(v.x) for v in vs) / len(vs)
+      cy = sum(float(v.y) for v in vs) / len(vs)
+      px, py = int((cx + 3) * 20), int((3 - cy) * 20)
+      self.assertEqual(rows[py][3*px:3*px+3], bytes(tr.default_colors[type(t)]))
+
+  def test_parallel_and_stores(self):
+    tm = _sun()
+    image = _render(tm, 97)
+    self.assertEqual(_render(tm, 97, processes = 2), image)
+    # Stores are drawn from their float vertices, without creating tiles
+    tiles = list(tm.iter_tiles())
+    for (ty1, vs1), (ty2, vs2) in zip(tr._float_polygons(tiles), tr._float_polygons(TileStore(tiles))):
+      self.assertIs(ty1, ty2)
+      for (x1, y1), (x2, y2) in zip(vs1, vs2):
+        self.assertAlmostEqual(x1, x2, places = 9)
+        self.assertAlmostEqual(y1, y2, places = 9)
+    self.assertEqual(image[0], 97)
+
+  def test_spilled_bands(self):
+    # Small bands, spilled to a temporary file after a few shapes, give the
+    # same image
+    tm = _sun()
+    image = _render(tm, 97)
+    saved = (tr._band_rows, tr._max_held_shapes)
+    tr._band_rows, tr._max_held_shapes = 5, 40
+    try:
+      self.assertEqual(_render(tm, 97), image)
+      self.assertEqual(_render(tm, 97, processes = 2), image)
+    finally:
+      tr._band_rows, tr._max_held_shapes = saved
+    # Stores give their bounding box as the default view
+    store = TileStore(tm.iter_tiles())
+    self.assertEqual(_render(store, 97, view = store.bbox()), _render(store, 97))
+
+  def test_errors(self):
+    self.assertRaises(ValueError, _render, _sun(), 0)
+    self.assertRaises(TypeError, _render, _sun(), 10.0)
+    self.assertRaises(ValueError, _render, TileManager(), 10)
@@ -0,0 +1,656 @@
+'''Columnar storage for large tilings, keeping tiles as rows of typed
+arrays and only making tile objects out of them on access'''
+
+# MIT-licensed; see LICENSE for details
+
+# Each penrose.TransformableTile is the proto-tile of its type under an
+# orientation-preserving, conformal affine transform, which takes (x, y) to
+# (a*x - d*y + c, d*x + a*y + f); in complex terms, that's z -> s*z + w with
+# s = a + d*i and w = c + f*i. So a tile is fully described by its type and
+# the four Numbers a, d, c and f, and composing two such transforms is just
+# complex multiplication and addition.
+#
+# A TileStore keeps, for each tile,
+#  * the tile's type code (see penrose.tile_types) in an array('b'),
+#  * the 4 rational coefficients of each of a, d, c and f, as 16 integers
+#    in an array('q'); all coefficients in the store are over one common
+#    denominator, and
+#  * the tile's bounding box, computed in floating point and slightly
+#    widened, as 4 doubles in an array('d').
+# That's 161 bytes per tile, rather than several kilobytes for a tile object.
+#
+# The integer coefficients have to fit in 64 bits, which covers any tiling
+# that can reasonably be put together: they grow only slowly with the depth
+# of deflation (about tenfold over 16 half-deflations). OverflowError is
+# raised otherwise.
+
+import mmap, struct
+from array import array
+from fractions import Fraction as Q
+from math import gcd
+import penrose as p, pen_geom as pg, pen_num, tile_index
+from tile_manager import TileManager
+
+# Integer coefficients per tile: 4 for each of a, d, c and f
+_stride = 16
+
+_alpha = float(pen_num.alpha)
+_float_alpha_powers = (1.0, _alpha, _alpha * _alpha, _alpha * _alpha * _alpha)
+
+def _lcm(x, y):
+  return x * y // gcd(x, y)
+
+def _mul(x0, x1, x2, x3, y0, y1, y2, y3):
+  # Multiplies two Numbers given by their coefficients, using
+  # alpha**4 = 20*alpha**2 - 80 (alpha being pen_num.alpha)
+  h2 = x1*y3 + x2*y2 + x3*y1
+  h3 = x2*y3 + x3*y2
+  h4 = x3*y3
+  return (
+    x0*y0 - 80*h2 - 1600*h4,
+    x0*y1 + x1*y0 - 80*h3,
+    x0*y2 + x1*y1 + x2*y0 + 20*h2 + 320*h4,
+    x0*y3 + x1*y2 + x2*y1 + x3*y0 + 20*h3,
+  )
+
+def encode_transform(t):
+  '''Returns a pair (coefficients, den) for the conformal AffineTransform t:
+  a list of 16 integers, being the rational coefficients of t.a, t.d, t.c
+  and t.f (in the basis used by pen_num.Number) times den.'''
+  qs = [q for x in (t.a, t.d, t.c, t.f) for q in pen_num.Number(x)._vec]
+  den = 1
+  for q in qs:
+    den = _lcm(den, q.denominator)
+  return ([q.numerator * (den // q.denominator) for q in qs], den)
+
+def decode_transform(xf, den):
+  '''The inverse of encode_transform(): returns the AffineTransform with
+  the given coefficients over the denominator den.'''
+  a, d, c, f = (
+    pen_num.Number(*(Q(n, den) for n in xf[k:k+4]))
+    for k in range(0, _stride, 4)
+  )
+  return pg.AffineTransform(a, -d, c, d, a, f)
+
+def _float_value(xf, k, den):
+  fp = _float_alpha_powers
+  return (xf[k] * fp[0] + xf[k+1] * fp[1] + xf[k+2] * fp[2] + xf[k+3] * fp[3]) / den
+
+# The float coordinates of each tile type's proto-tile vertices
+_proto_float_vertices = tuple(
+  tuple((float(v.x), float(v.y)) for v in ty().vertices()) for ty in p.tile_types
+)
+
+# The coefficients of the coordinates of each tile type's proto-tile
+# vertices, as lists of 8 integers (4 for x, then 4 for y) over the common
+# denominator _proto_vertex_den
+def _proto_vertex_table():
+  vecs = [
+    [[q for x in (v.x, v.y) for q in pen_num.Number(x)._vec] for v in ty().vertices()]
+    for ty in p.tile_types
+  ]
+  den = 1
+  for vs in vecs:
+    for qs in vs:
+      for q in qs:
+        den = _lcm(den, q.denominator)
+  return (tuple([[q.numerator * (den // q.denominator) for q in qs] for qs in vs] for vs in vecs), den)
+
+_proto_vertices, _proto_vertex_den = _proto_vertex_table()
+
+def row_vertices(code, xf, den):
+  '''Returns the vertices of the tile given as its type code and encoded
+  transform (as yielded by the stores' rows()), as a list of pairs (key,
+  (x, y)): the floats x and y are its coordinates, and the key is a tuple
+  of integers giving them exactly, over a denominator depending only on
+  den; so for rows with the same den, the keys of two vertices are equal
+  just when the vertices are.'''
+  a, d, c, f = xf[0:4], xf[4:8], xf[8:12], xf[12:16]
+  c = [x * _proto_vertex_den for x in c]
+  f = [x * _proto_vertex_den for x in f]
+  vden = den * _proto_vertex_den
+  out = []
+  for pv in _proto_vertices[code]:
+    px, py = pv[0:4], pv[4:8]
+    # (a + d i) * (px + py i) + (c + f i)
+    apx, dpy, apy, dpx = _mul(*a, *px), _mul(*d, *py), _mul(*a, *py), _mul(*d, *px)
+    key = (
+      apx[0] - dpy[0] + c[0], apx[1] - dpy[1] + c[1], apx[2] - dpy[2] + c[2], apx[3] - dpy[3] + c[3],
+      apy[0] + dpx[0] + f[0], apy[1] + dpx[1] + f[1], apy[2] + dpx[2] + f[2], apy[3] + dpx[3] + f[3],
+    )
+    out.append((key, (_float_value(key, 0, vden), _float_value(key, 4, vden))))
+  return out
+
+# For each decomposition ID, a pair (entries, den): entries has an item for
+# each type code, which is None if that type doesn't have the decomposition,
+# or else a list of (child type code, child's coefficients), all of the
+# coefficients being over the denominator den.
+_decompositions = {}
+
+def _decomposition_table(decomp_id):
+  table = _decompositions.get(decomp_id, None)
+  if table is not None:
+    return table
+
+  encoded = []
+  for ty in p.tile_types:
+    children = ty().decompose(decomp_id)
+    encoded.append(None if children is None else [
+      (p.tile_type_codes[type(c)], *encode_transform(c.curr_transform())) for c in children
+    ])
+  den = 1
+  for children in encoded:
+    for _, _, d in children or ():
+      den = _lcm(den, d)
+  entries = tuple(
+    None if children is None else [(code, [x * (den // d) for x in xf]) for code, xf, d in children]
+    for children in encoded
+  )
+  table = _decompositions[decomp_id] = (entries, den)
+  return table
+
+def _compose(oxf, i, ixf, j, den):
+  # Returns the coefficients of the composition of the transforms with
+  # coefficients oxf[i:i+16] (applied second) and ixf[j:j+16] (applied
+  # first); the former's translation is scaled by den, the denominator
+  # of the latter, so the result is over the product of the denominators.
+  oa, od = oxf[i:i+4], oxf[i+4:i+8]
+  oc, of = [x * den for x in oxf[i+8:i+12]], [x * den for x in oxf[i+12:i+16]]
+  ia, id, ic, if_ = ixf[j:j+4], ixf[j+4:j+8], ixf[j+8:j+12], ixf[j+12:j+16]
+  # s = s_outer * s_inner
+  aa, dd, ad, da = _mul(*oa, *ia), _mul(*od, *id), _mul(*oa, *id), _mul(*od, *ia)
+  # w = s_outer * w_inner + w_outer
+  ac, df, af, dc = _mul(*oa, *ic), _mul(*od, *if_), _mul(*oa, *if_), _mul(*od, *ic)
+  return [
+    aa[0] - dd[0], aa[1] - dd[1], aa[2] - dd[2], aa[3] - dd[3],
+    ad[0] + da[0], ad[1] + da[1], ad[2] + da[2], ad[3] + da[3],
+    ac[0] - df[0] + oc[0], ac[1] - df[1] + oc[1], ac[2] - df[2] + oc[2], ac[3] - df[3] + oc[3],
+    af[0] + dc[0] + of[0], af[1] + dc[1] + of[1], af[2] + dc[2] + of[2], af[3] + dc[3] + of[3],
+  ]
+
+def _children(table, code, xf, i):
+  # Yields (type code, coefficients) for the children of the tile with the
+  # given type code and coefficients xf[i:i+16], using a table from
+  # _decomposition_table()
+  entries, child_den = table
+  children = entries[code]
+  if children is None:
+    raise ValueError
+  for child_code, cxf in children:
+    yield (child_code, _compose(xf, i, cxf, 0, child_den))
+
+def _row_bbox(code, xf, k, den):
+  # The widened float bbox of the tile with the given type code and
+  # coefficients xf[k:k+16] over den
+  a, d = _float_value(xf, k, den), _float_value(xf, k+4, den)
+  c, f = _float_value(xf, k+8, den), _float_value(xf, k+12, den)
+  xs, ys = [], []
+  for px, py in _proto_float_vertices[code]:
+    xs.append(a*px - d*py + c)
+    ys.append(d*px + a*py + f)
+  return tile_index.widen(min(xs), min(ys), max(xs), max(ys))
+
+def _checked_transform(trns):
+  # Returns the coefficients and denominator of trns
+  if not isinstance(trns, pg.AffineTransform):
+    raise TypeError
+  if not (trns.is_orientation_preserving() and trns.is_conformal()):
+    raise ValueError
+  return encode_transform(trns)
+
+class TileStore:
+  '''A list-like container of tiles (instances of the types in
+  penrose.tile_types) in columnar form. Indexing and iteration create tile
+  objects on demand; decompose(), transform(), bbox() and the floating-point
+  accessors work on the columns directly.
+
+  Unlike TileManager, a TileStore doesn't check that its tiles fit together;
+  it's meant for holding tilings already known to be valid, e.g. ones
+  produced by decomposing a valid tiling.'''
+
+  def __init__(self, tiles = ()):
+    self._codes = array('b')
+    self._xf = array('q')
+    self._bb = array('d')
+    self._den = 1
+    self.extend(tiles)
+
+  def __len__(self):
+    return len(self._codes)
+
+  def nbytes(self):
+    '''Returns the number of bytes taken up by the columns.'''
+    return sum(len(col) * col.itemsize for col in (self._codes, self._xf, self._bb))
+
+  def _rescale(self, den):
+    # Puts all coefficients over den, a multiple of the current denominator
+    if den != self._den:
+      m = den // self._den
+      self._xf = array('q', (x * m for x in self._xf))
+      self._den = den
+
+  def _append_row(self, code, xf):
+    # Appends a tile with the given coefficients (over self._den), computing
+    # its bounding box
+    self._codes.append(code)
+    self._xf.extend(xf)
+    self._bb.extend(_row_bbox(code, xf, 0, self._den))
+
+  def append(self, t):
+    '''Adds the tile t at the end of the store.'''
+    code = p.tile_type_codes.get(type(t), None)
+    if code is None:
+      raise TypeError
+    self.append_row(code, *encode_transform(t.curr_transform()))
+
+  def append_row(self, code, xf, den):
+    '''Adds a tile at the end of the store, given as its type code (see
+    penrose.tile_types) and its transform as encoded by encode_transform().'''
+    self._rescale(_lcm(self._den, den))
+    m = self._den // den
+    self._append_row(code, [x * m for x in xf])
+
+  def rows(self, order = None):
+    '''Yields each tile as a tuple (type code, coefficients, den), as taken
+    by append_row(), without creating tile objects; order is as for
+    iter_tiles().'''
+    if order not in (None, 'hilbert'):
+      raise ValueError
+    xf, den, codes = self._xf, self._den, self._codes
+    for k in range(len(self)) if order is None else self.hilbert_order():
+      yield (codes[k], xf[k*_stride:(k+1)*_stride], den)
+
+  def extend(self, tiles):
+    for t in tiles:
+      self.append(t)
+
+  def __getitem__(self, k):
+    if isinstance(k, slice):
+      return [self[i] for i in range(*k.indices(len(self)))]
+    if k < 0:
+      k += len(self)
+    if not 0 <= k < len(self):
+      raise IndexError
+    return p.tile_types[self._codes[k]](
+      decode_transform(self._xf[k*_stride:(k+1)*_stride], self._den)
+    )
+
+  def __iter__(self):
+    for k in range(len(self)):
+      yield self[k]
+
+  def tile_type(self, k):
+    '''Returns the type of the k'th tile, without creating the tile.'''
+    return p.tile_types[self._codes[k]]
+
+  def type_counts(self):
+    '''Returns a dict mapping each tile type present to its number of tiles.'''
+    counts = [0] * len(p.tile_types)
+    for code in self._codes:
+      counts[code] += 1
+    return {p.tile_types[code]: n for code, n in enumerate(counts) if n != 0}
+
+  def float_bbox(self, k):
+    '''Returns the floating-point bounding box (min_x, min_y, max_x, max_y)
+    of the k'th tile, which contains the tile's exact bounding box.'''
+    return tuple(self._bb[4*k:4*k+4])
+
+  def float_vertices(self, k):
+    '''Returns the vertices of the k'th tile as a list of (x, y) pairs of
+    floats.'''
+    xf, den, i = self._xf, self._den, k * _stride
+    a, d = _float_value(xf, i, den), _float_value(xf, i+4, den)
+    c, f = _float_value(xf, i+8, den), _float_value(xf, i+12, den)
+    return [(a*px - d*py + c, d*px + a*py + f) for px, py in _proto_float_vertices[self._codes[k]]]
+
+  def bbox(self):
+    '''Returns the floating-point bounding box (min_x, min_y, max_x, max_y)
+    of all of the tiles, or None if there are none.'''
+    if len(self) == 0:
+      return None
+    bb = self._bb
+    return (min(bb[0::4]), min(bb[1::4]), max(bb[2::4]), max(bb[3::4]))
+
+  def _centroid(self, k):
+    v = self.float_vertices(k)
+    return (sum(x for x, _ in v) / len(v), sum(y for _, y in v) / len(v))
+
+  def hilbert_order(self):
+    '''Returns a list of the indices of the tiles, sorted along the
+    Hilbert curve through their centroids.'''
+    keys = tile_index.curve_keys(range(len(self)), 'hilbert', self._centroid)
+    return sorted(range(len(self)), key = keys.__getitem__)
+
+  def iter_tiles(self, region = None, order = None):
+    '''Returns an iterator over the tiles; if region is given, only the
+    tiles whose bounding boxes overlap the Rectangle region are produced.
+    The columns are scanned in floating point, and only the tiles that might
+    overlap region are created. order may be None, for the tiles in the
+    order they were added, or 'hilbert', for them sorted along the Hilbert
+    curve.'''
+    if order not in (None, 'hilbert'):
+      raise ValueError
+    indices = range(len(self)) if order is None else self.hilbert_order()
+    if region is None:
+      return (self[k] for k in indices) if order is not None else iter(self)
+    min_x, min_y = float(region.min_x), float(region.min_y)
+    max_x, max_y = float(region.max_x), float(region.max_y)
+    bb = self._bb
+    return (
+      self[k] for k in indices
+      if bb[4*k] <= max_x and min_x <= bb[4*k+2] and bb[4*k+1] <= max_y and min_y <= bb[4*k+3]
+      and pg.do_bboxes_overlap(self[k], region)
+    )
+
+  def _normalized(self, codes, xf, den):
+    # Returns a new store with the given columns, with coefficients (an
+    # array('q'), which is taken over) and denominator reduced by their
+    # common factor, in place
+    g = den
+    for x in xf:
+      if g == 1:
+        break
+      g = gcd(g, x)
+    if g != 1:
+      for i in range(len(xf)):
+        xf[i] //= g
+    new = TileStore()
+    new._codes = codes
+    new._den = den // g
+    new._xf = xf
+    bb = new._bb
+    for k in range(len(codes)):
+      bb.extend(_row_bbox(codes[k], new._xf, k * _stride, new._den))
+    return new
+
+  def decompose(self, decomp_id):
+    '''Returns a new TileStore holding the decomposition of each tile;
+    raises ValueError if some tile doesn't have a decomposition decomp_id.'''
+    table = _decomposition_table(decomp_id)
+    # The children's coefficients go straight into an array, as in
+    # MappedTileStore.decompose(), so they take 8 bytes each rather than a
+    # Python int each; like there, they're reduced by their common factor
+    # afterwards
+    codes, out, xf = array('b'), array('q'), self._xf
+    for k, code in enumerate(self._codes):
+      for child_code, cxf in _children(table, code, xf, k * _stride):
+        codes.append(child_code)
+        out.extend(cxf)
+    return self._normalized(codes, out, self._den * table[1])
+
+  def transform(self, trns):
+    '''Returns a new TileStore with each tile transformed by the
+    AffineTransform trns, which must be orientation-preserving and
+    conformal (as for penrose.TransformableTile).'''
+    txf, tden = _checked_transform(trns)
+    out, xf, den = array('q'), self._xf, self._den
+    for k in range(len(self)):
+      out.extend(_compose(txf, 0, xf, k * _stride, den))
+    return self._normalized(array('b', self._codes), out, den * tden)
+
+  def to_tile_manager(self, **kwargs):
+    '''Returns a TileManager holding the tiles, which are added to it
+    without checks; keyword arguments are passed on to TileManager().'''
+    tm = TileManager(**kwargs)
+    tm.add_tiles(self, trusted = True)
+    return tm
+
+# A MappedTileStore's file consists of
+#  * a header (_file_header, padded to _records_offset bytes),
+#  * fixed-size records (_record) for the tiles, each holding a tile's type
+#    code, its 16 coefficients and its widened float bbox, and
+#  * the page index: for each run (page) of _page_records consecutive
+#    records, the union of their bboxes, as 4 doubles.
+# All numbers are little-endian.
+_magic = b'PENTSTOR'
+_file_version = 1
+# Magic, version, records per page, number of records, denominator of the
+# coefficients, and the file offset of the page index:
+_file_header = struct.Struct('<8sIIqqq')
+_records_offset = 64
+_record = struct.Struct('<b7x16q4d')
+_page_bbox = struct.Struct('<4d')
+_page_records = 256
+
+class _MappedStoreWriter:
+  # Writes a MappedTileStore file, one record at a time. The coefficients
+  # are given over the denominator den, and divided by their common factor
+  # in a second pass over the file once they've all been written.
+
+  def __init__(self, path, den):
+    self._path, self._den = path, den
+    self._file = open(path, 'wb')
+    self._file.write(bytes(_records_offset))
+    self._count, self._gcd = 0, den
+    self._pages = array('d')
+    self._page = None
+
+  def write(self, code, xf, fb):
+    try:
+      self._file.write(_record.pack(code, *xf, *fb))
+    except struct.error as e:
+      raise OverflowError from e
+    g = self._gcd
+    if g != 1:
+      for x in xf:
+        g = gcd(g, x)
+      self._gcd = g
+
+    page = self._page
+    if page is None:
+      self._page = list(fb)
+    else:
+      page[0], page[1] = min(page[0], fb[0]), min(page[1], fb[1])
+      page[2], page[3] = max(page[2], fb[2]), max(page[3], fb[3])
+    self._count += 1
+    if self._count % _page_records == 0:
+      self._pages.extend(self._page)
+      self._page = None
+
+  def close(self):
+    if self._page is not None:
+      self._pages.extend(self._page)
+      self._page = None
+    index_offset = _records_offset + self._count * _record.size
+    pages = self._pages
+    self._file.write(b''.join(_page_bbox.pack(*pages[k:k+4]) for k in range(0, len(pages), 4)))
+    self._file.close()
+
+    g = self._gcd
+    with open(self._path, 'r+b') as f:
+      if g > 1 and self._count > 0:
+        with mmap.mmap(f.fileno(), 0) as mm:
+          for k in range(self._count):
+            offset = _records_offset + k * _record.size
+            row = _record.unpack_from(mm, offset)
+            _record.pack_into(mm, offset, row[0], *(x // g for x in row[1:17]), *row[17:])
+      f.write(_file_header.pack(_magic, _file_version, _page_records, self._count, self._den // g, index_offset))
+    return MappedTileStore(self._path)
+
+class MappedTileStore:
+  '''A read-only container of tiles kept in a memory-mapped file, in the
+  same form as in a TileStore, for tilings too large to hold in memory.
+  Tiles are only read from the file (and made into tile objects) on access.
+
+  The records are grouped into pages of consecutive tiles, and the file has
+  an index of the pages' bounding boxes, used to skip over pages in region
+  queries. The tiles in a file made by create() are in the order of the
+  Hilbert curve through them, and decompose() keeps children in the order
+  of their parents; so pages are spatially compact, and the file's order is
+  (a coarsening of) Hilbert curve order.
+
+  decompose() and transform() stream each record of the file to the new
+  one, so producing the next level of a tiling takes little memory however
+  many tiles there are. The mapping stays open until close() is called, or
+  the store is used as a context manager.'''
+
+  def __init__(self, path):
+    self._path = path
+    self._file = open(path, 'rb')
+    try:
+      self._mm = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_READ)
+      magic, version, page_records, count, den, index_offset = _file_header.unpack_from(self._mm, 0)
+      if magic != _magic or version != _file_version:
+        raise ValueError('not a tile store file')
+    except Exception:
+      self.close()
+      raise
+    self._page_records, self._count, self._den = page_records, count, den
+    n_pages = -(-count // page_records)
+    self._pages = [_page_bbox.unpack_from(self._mm, index_offset + k * _page_bbox.size) for k in range(n_pages)]
+
+  @staticmethod
+  def create(path, tiles):
+    '''Writes the tiles (an iterable of tiles, or a TileStore) to a new file
+    at path, sorted along the Hilbert curve, and returns a MappedTileStore
+    for it. The tiles are gathered in a TileStore first, so this is meant for
+    the starting point of a tiling, with later levels made by decompose().'''
+    store = tiles if isinstance(tiles, TileStore) else TileStore(tiles)
+    writer = _MappedStoreWriter(path, store._den)
+    for k in store.hilbert_order():
+      writer.write(store._codes[k], store._xf[k*_stride:(k+1)*_stride], store.float_bbox(k))
+    return writer.close()
+
+  def close(self):
+    if getattr(self, '_mm', None) is not None:
+      self._mm.close()
+      self._mm = None
+    self._file.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+  def path(self):
+    return self._path
+
+  def __len__(self):
+    return self._count
+
+  def count(self):
+    return self._count
+
+  def _row(self, k):
+    if k < 0:
+      k += self._count
+    if not 0 <= k < self._count:
+      raise IndexError
+    return _record.unpack_from(self._mm, _records_offset + k * _record.size)
+
+  def __getitem__(self, k):
+    row = self._row(k)
+    return p.tile_types[row[0]](decode_transform(row[1:17], self._den))
+
+  def __iter__(self):
+    for k in range(self._count):
+      yield self[k]
+
+  def rows(self, order = None):
+    '''Yields each tile as a tuple (type code, coefficients, den), as taken
+    by TileStore.append_row(), without creating tile objects; order is as
+    for iter_tiles().'''
+    if order not in (None, 'hilbert'):
+      raise ValueError
+    for k in range(self._count):
+      row = self._row(k)
+      yield (row[0], row[1:17], self._den)
+
+  def tile_type(self, k):
+    return p.tile_types[self._row(k)[0]]
+
+  def type_counts(self):
+    '''Returns a dict mapping each tile type present to its number of tiles.'''
+    counts = [0] * len(p.tile_types)
+    mm = self._mm
+    for k in range(self._count):
+      counts[mm[_records_offset + k * _record.size]] += 1
+    return {p.tile_types[code]: n for code, n in enumerate(counts) if n != 0}
+
+  def float_bbox(self, k):
+    return self._row(k)[17:]
+
+  def float_vertices(self, k):
+    row = self._row(k)
+    xf, den = row[1:17], self._den
+    a, d = _float_value(xf, 0, den), _float_value(xf, 4, den)
+    c, f = _float_value(xf, 8, den), _float_value(xf, 12, den)
+    return [(a*px - d*py + c, d*px + a*py + f) for px, py in _proto_float_vertices[row[0]]]
+
+  def bbox(self):
+    '''Returns the floating-point bounding box (min_x, min_y, max_x, max_y)
+    of all of the tiles, or None if there are none; only the page index is
+    read for this.'''
+    if self._count == 0:
+      return None
+    pages = self._pages
+    return (min(pb[0] for pb in pages), min(pb[1] for pb in pages),
+            max(pb[2] for pb in pages), max(pb[3] for pb in pages))
+
+  def iter_tiles(self, region = None, order = None):
+    '''Returns an iterator over the tiles; if region is given, only the
+    tiles whose bounding boxes overlap the Rectangle region are produced,
+    reading only the pages of the file that might hold them. order may be
+    None or 'hilbert', both of which give the tiles in file order.'''
+    if order not in (None, 'hilbert'):
+      raise ValueError
+    if region is None:
+      return iter(self)
+    fb = (float(region.min_x), float(region.min_y), float(region.max_x), float(region.max_y))
+    return self._iter_region(region, fb)
+
+  def _iter_region(self, region, fb):
+    for page, pbb in enumerate(self._pages):
+      if not tile_index.overlap(fb, pbb):
+        continue
+      start = page * self._page_records
+      for k in range(start, min(start + self._page_records, self._count)):
+        if tile_index.overlap(fb, self.float_bbox(k)):
+          t = self[k]
+          if pg.do_bboxes_overlap(t, region):
+            yield t
+
+  def decompose(self, decomp_id, path):
+    '''Writes the decomposition of each tile to a new file at path, and
+    returns a MappedTileStore for it; raises ValueError if some tile doesn't
+    have a decomposition decomp_id.'''
+    table = _decomposition_table(decomp_id)
+    den = self._den * table[1]
+    writer = _MappedStoreWriter(path, den)
+    for k in range(self._count):
+      row = self._row(k)
+      for child_code, cxf in _children(table, row[0], row, 1):
+        writer.write(child_code, cxf, _row_bbox(child_code, cxf, 0, den))
+    return writer.close()
+
+  def transform(self, trns, path):
+    '''Writes each tile transformed by the AffineTransform trns (which must
+    be orientation-preserving and conformal) to a new file at path, and
+    returns a MappedTileStore for it.'''
+    txf, tden = _checked_transform(trns)
+    den = self._den * tden
+    writer = _MappedStoreWriter(path, den)
+    for k in range(self._count):
+      row = self._row(k)
+      xf = _compose(txf, 0, row, 1, self._den)
+      writer.write(row[0], xf, _row_bbox(row[0], xf, 0, den))
+    return writer.close()
+
+  def to_tile_store(self):
+    '''Returns an in-memory TileStore holding the tiles.'''
+    store = TileStore()
+    store._den = self._den
+    for k in range(self._count):
+      row = self._row(k)
+      store._codes.append(row[0])
+      store._xf.extend(row[1:17])
+      store._bb.extend(row[17:])
+    return store
+
+  def to_tile_manager(self, **kwargs):
+    '''Returns a TileManager holding the tiles, which are added to it
+    without checks; keyword arguments are passed on to TileManager().'''
+    tm = TileManager(**kwargs)
+    tm.add_tiles(self, trusted = True)
+    return tm
@@ -0,0 +1,147 @@
+# MIT-licensed; see LICENSE for details
+
+import os, tempfile
+from unittest import TestCase
+from tile_store import TileStore, MappedTileStore
+import tile_output as to, tile_export as te
+import tile_store as ts
+import penrose as p
+import pen_geom as g
+import pen_num
+from pen_num import phi
+from fractions import Fraction as Q
+
+def _sun():
+  return [p.KiteTile().scale(phi).rotate(i) for i in [-1, 3, 7, 11, 15]]
+
+def _decompose(tiles, decomp_id):
+  return [c for t in tiles for c in t.decompose(decomp_id)]
+
+class TestTileStore(TestCase):
+  def test_round_trip(self):
+    tiles = _sun() + [p.ThinRhomb().translate(Q(1, 3), 5), p.B_S2().scale(Q(2, 7))]
+    store = TileStore(tiles)
+    self.assertEqual(len(store), len(tiles))
+    self.assertEqual(list(store), tiles)
+    self.assertEqual(store[-1], tiles[-1])
+    self.assertEqual(store[1:3], tiles[1:3])
+    self.assertIs(store.tile_type(5), p.ThinRhomb)
+    self.assertEqual(store.type_counts(), {p.KiteTile: 5, p.ThinRhomb: 1, p.B_S2: 1})
+    self.assertRaises(IndexError, store.__getitem__, len(tiles))
+    self.assertRaises(TypeError, store.append, g.Polygon(tiles[0].vertices()))
+    self.assertEqual(store.nbytes(), 161 * len(tiles))
+
+  def test_field_multiplication(self):
+    x = pen_num.Number(Q(1, 3), -2, Q(5, 7), 3)
+    y = pen_num.Number(4, Q(-1, 2), 0, Q(9, 5))
+    xv = [q * 105 for q in x._vec]
+    yv = [q * 10 for q in y._vec]
+    product = ts._mul(*(int(q) for q in xv), *(int(q) for q in yv))
+    self.assertEqual(pen_num.Number(*(Q(n, 1050) for n in product)), x * y)
+
+  def test_decompose(self):
+    tiles = _decompose(_sun(), 'to-A')
+    store = TileStore(tiles)
+    for decomp_id in ['half-deflation', 'deflation', 'half-deflation', 'to-P2']:
+      tiles, store = _decompose(tiles, decomp_id), store.decompose(decomp_id)
+      self.assertEqual(set(store), set(tiles))
+    self.assertRaises(ValueError, store.decompose, 'to-P2')
+
+  def test_transform(self):
+    tiles = _decompose(_sun(), 'to-A')
+    trns = g.translation(Q(3, 2), -1) @ g.rotation(3) @ g.scaling(pen_num.inv_phi)
+    self.assertEqual(set(TileStore(tiles).transform(trns)), set(t.transform(trns) for t in tiles))
+    self.assertRaises(ValueError, TileStore(tiles).transform, g.scaling(1, 2))
+
+  def test_bboxes(self):
+    store = TileStore(_decompose(_decompose(_sun(), 'to-A'), 'half-deflation'))
+    for k, t in enumerate(store):
+      fb, bb = store.float_bbox(k), t.bbox()
+      self.assertTrue(Q(fb[0]) < bb.min_x and Q(fb[1]) < bb.min_y)
+      self.assertTrue(Q(fb[2]) > bb.max_x and Q(fb[3]) > bb.max_y)
+      for (x, y), v in zip(store.float_vertices(k), t.vertices()):
+        self.assertAlmostEqual(x, float(v.x))
+        self.assertAlmostEqual(y, float(v.y))
+    fb = store.bbox()
+    self.assertAlmostEqual(fb[2], float(max(t.bbox().max_x for t in store)))
+    self.assertIs(TileStore().bbox(), None)
+
+    r = g.Rectangle(0, 0, 1, Q(1, 2))
+    expected = set(t for t in store if g.do_bboxes_overlap(t, r))
+    self.assertEqual(set(store.iter_tiles(r)), expected)
+    self.assertEqual(set(store.to_tile_manager().tiles_in_rect(r)), expected)
+
+  def test_output(self):
+    tm = TileStore(_sun()).to_tile_manager().decompose('to-A').decompose('deflation').decompose('to-P2')
+    store = TileStore(tm.iter_tiles())
+    self.assertEqual(set(store.iter_tiles(order = 'hilbert')), set(store))
+    self.assertRaises(ValueError, store.iter_tiles, None, 'x')
+    arcs_s, arcs_tm = to.tiling_arcs_svg(store, 3), to.tiling_arcs_svg(tm, 3)
+    for k in arcs_s:
+      self.assertEqual(sorted(arcs_s[k].split('M')), sorted(arcs_tm[k].split('M')))
+    path = to.tiling_to_svg_path(store, 3)
+    self.assertEqual(path.count('l'), to.tiling_to_svg_path(tm, 3).count('l'))
+    self.assertEqual(to.tiling_to_svg_symbols(store, 3).count('<use '), len(store))
+    geom = te.geometry(store)
+    self.assertEqual((len(geom), geom.vertex_count()), (len(store), len(tm.get_vertices())))
+
+class TestMappedTileStore(TestCase):
+  def setUp(self):
+    self.dir = tempfile.TemporaryDirectory()
+    self.tiles = _decompose(_sun(), 'to-A')
+
+  def tearDown(self):
+    self.dir.cleanup()
+
+  def path(self, name):
+    return os.path.join(self.dir.name, name)
+
+  def test_create(self):
+    with MappedTileStore.create(self.path('a'), self.tiles) as m:
+      self.assertEqual(len(m), len(self.tiles))
+      self.assertEqual(set(m), set(self.tiles))
+      self.assertEqual(m.type_counts(), TileStore(self.tiles).type_counts())
+      self.assertEqual(m[3], m.to_tile_store()[3])
+      self.assertEqual(m.float_vertices(3), m.to_tile_store().float_vertices(3))
+      self.assertEqual(set(m.to_tile_manager().get_tiles()), set(self.tiles))
+      self.assertEqual(m.bbox(), TileStore(self.tiles).bbox())
+    with MappedTileStore.create(self.path('empty'), []) as m:
+      self.assertEqual(len(m), 0)
+      self.assertIs(m.bbox(), None)
+    with open(self.path('junk'), 'wb') as f:
+      f.write(bytes(100))
+    self.assertRaises(ValueError, MappedTileStore, self.path('junk'))
+
+  def test_decompose(self):
+    tiles, m = self.tiles, MappedTileStore.create(self.path('0'), self.tiles)
+    for k, decomp_id in enumerate(['half-deflation', 'deflation', 'half-deflation', 'to-P2']):
+      # Children come in the order of their parents:
+      in_memory = m.to_tile_store().decompose(decomp_id)
+      tiles, new_m = _decompose(tiles, decomp_id), m.decompose(decomp_id, self.path(str(k+1)))
+      m.close()
+      m = new_m
+      self.assertEqual(set(m), set(tiles))
+      self.assertEqual(list(m), list(in_memory))
+    self.assertRaises(ValueError, m.decompose, 'to-P2', self.path('bad'))
+    m.close()
+
+  def test_transform_and_region(self):
+    trns = g.translation(Q(3, 2), -1) @ g.rotation(3) @ g.scaling(phi)
+    tiles = _decompose(_decompose(self.tiles, 'half-deflation'), 'half-deflation')
+    with MappedTileStore.create(self.path('a'), tiles) as m, m.transform(trns, self.path('b')) as mt:
+      tiles = [t.transform(trns) for t in tiles]
+      self.assertEqual(set(mt), set(tiles))
+      r = g.Rectangle(1, -1, 2, 0)
+      expected = set(t for t in tiles if g.do_bboxes_overlap(t, r))
+      self.assertNotEqual(expected, set())
+      self.assertEqual(set(mt.iter_tiles(r)), expected)
+      self.assertRaises(ValueError, mt.iter_tiles, None, 'x')
+
+  def test_output(self):
+    with MappedTileStore.create(self.path('a'), _sun()) as m:
+      tm = m.to_tile_manager()
+      arcs_m, arcs_tm = to.tiling_arcs_svg(m, 3), to.tiling_arcs_svg(tm, 3)
+      for k in arcs_m:
+        self.assertEqual(sorted(arcs_m[k].split('M')), sorted(arcs_tm[k].split('M')))
+      path = to.tiling_to_svg_path(m, 3)
+      self.assertEqual(path.count('l'), to.tiling_to_svg_path(tm, 3).count('l'))